@@ -0,0 +1,60 @@
+"""
+Compare results of two benchmark runs (see benchmarks.run).
+
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+
+
+METRICS = ['collect_duration', 'collect_queries', 'collect_peak_memory', 'serialize_duration', 'output_size',
+           'serialize_peak_memory']
+
+
+def load_results(path):
+    with open(path) as stream:
+        report = json.load(stream)
+    return dict(((result['scenario'], result['collector']), result) for result in report['results'])
+
+
+def compare(before, after):
+    """
+    :return: a row by (scenario, collector) in both runs, with before and after values, and their ratio, of every
+    metric
+    """
+    rows = []
+    for key in sorted(set(before) & set(after)):
+        row = {'scenario': key[0], 'collector': key[1]}
+        for metric in METRICS:
+            old, new = before[key].get(metric), after[key].get(metric)
+            ratio = float(new) / old if old and new is not None else None
+            row[metric] = {'before': old, 'after': new, 'ratio': ratio}
+        rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare results of two benchmark runs.')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    options = parser.parse_args(argv)
+
+    for row in compare(load_results(options.before), load_results(options.after)):
+        print('%s / %s' % (row['scenario'], row['collector']))
+        for metric in METRICS:
+            values = row[metric]
+            ratio = '%.2fx' % values['ratio'] if values['ratio'] is not None else '-'
+            print('    %-24s %14s -> %14s  %s' % (metric, format_value(values['before']),
+                                                   format_value(values['after']), ratio))
+
+
+def format_value(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return '%.4f' % value
+    return str(value)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Synthetic graphs of test models, to benchmark collectors.
+
+Every scenario builds its own rows, and returns the roots to collect:
+
+- relations: BaseModel roots (a share of them being ChildModel or SubClassOfBaseModel, i.e. multi-table inheritance),
+  each with its own O2ODummyModel and OneToOneToBaseModel, fanout ForeignKeyToBaseModel objects, and
+  ManyToManyToBaseModel objects (m2m_density by root), each referring to fanout random roots. FKDummyModel objects are
+  shared by fanout roots.
+- depth: ClassLevel1 roots, with fanout ClassLevel2 objects each, with fanout ClassLevel3 objects each (depth of 1 to 3
+  levels).
+- gfk: BaseToGFKModel roots, with fanout GFKModel objects each (GenericRelation, and GenericForeignKey back to roots).
+"""
+import random
+
+from django.contrib.contenttypes.models import ContentType
+
+from tests.models import (BaseModel, BaseToGFKModel, ChildModel, ClassLevel1, ClassLevel2, ClassLevel3,
+                          FKDummyModel, ForeignKeyToBaseModel, GFKModel, ManyToManyToBaseModel, O2ODummyModel,
+                          OneToOneToBaseModel, SubClassOfBaseModel)
+
+
+SCENARIOS = ('relations', 'depth', 'gfk')
+
+BATCH_SIZE = 500
+
+
+class Graph(object):
+
+    def __init__(self, fanout=5, depth=3, m2m_density=0.5, inheritance=0.1, seed=0):
+        self.fanout = fanout
+        self.depth = depth
+        self.m2m_density = m2m_density
+        self.inheritance = inheritance
+        self.random = random.Random(seed)
+        self.rows = 0
+
+    def get_rows_by_root(self, scenario):
+        """
+        Approximate number of rows built for every root of given scenario.
+        """
+        if scenario == 'relations':
+            m2m_rows = self.m2m_density * (1 + self.fanout)
+            return 3 + self.fanout + 1.0 / self.fanout + m2m_rows
+        if scenario == 'depth':
+            return sum(self.fanout ** level for level in range(self.depth))
+        if scenario == 'gfk':
+            return 1 + self.fanout
+        raise ValueError('Unknown scenario: %s' % scenario)
+
+    def get_roots_count(self, scenario, rows):
+        return max(1, int(rows / self.get_rows_by_root(scenario)))
+
+    def build(self, scenario, roots_count):
+        """
+        Build rows of given scenario.
+        :return: root objects
+        """
+        return getattr(self, 'build_%s' % scenario)(roots_count)
+
+    def build_relations(self, roots_count):
+        fk_dummies = self.bulk_create(FKDummyModel, [
+            {'name': 'fk dummy %s' % i} for i in range(roots_count // self.fanout + 1)
+        ])
+        o2o_dummies = self.bulk_create(O2ODummyModel, [{'name': 'o2o dummy %s' % i} for i in range(roots_count)])
+
+        roots = []
+        base_rows = []
+        for i in range(roots_count):
+            values = {'name': 'root %s' % i, 'fkey_id': fk_dummies[i // self.fanout], 'o2o_id': o2o_dummies[i]}
+            # Multi-table inheritance objects can't be created in bulk.
+            if self.random.random() < self.inheritance:
+                model = self.random.choice([ChildModel, SubClassOfBaseModel])
+                if model is ChildModel:
+                    values['child_field'] = 'child %s' % i
+                roots.append(model.objects.create(**values))
+                self.rows += 2
+            else:
+                base_rows.append(values)
+        roots += list(BaseModel.objects.filter(pk__in=self.bulk_create(BaseModel, base_rows)))
+        root_pks = [root.pk for root in roots]
+
+        self.bulk_create(OneToOneToBaseModel, [
+            {'name': 'o2o to base %s' % pk, 'o2oto_id': pk} for pk in root_pks
+        ])
+        self.bulk_create(ForeignKeyToBaseModel, [
+            {'name': 'fk to base %s/%s' % (pk, j), 'fkeyto_id': pk} for pk in root_pks for j in range(self.fanout)
+        ])
+
+        m2m_pks = self.bulk_create(ManyToManyToBaseModel, [
+            {'name': 'm2m %s' % i} for i in range(int(roots_count * self.m2m_density))
+        ])
+        through = ManyToManyToBaseModel.m2m.through
+        self.bulk_create(through, [
+            {'manytomanytobasemodel_id': m2m_pk, 'basemodel_id': root_pk}
+            for m2m_pk in m2m_pks
+            for root_pk in self.random.sample(root_pks, min(self.fanout, len(root_pks)))
+        ])
+
+        return roots
+
+    def build_depth(self, roots_count):
+        pks = self.bulk_create(ClassLevel1, [{'name': 'level 1 %s' % i} for i in range(roots_count)])
+        roots = list(ClassLevel1.objects.filter(pk__in=pks))
+
+        for model in [ClassLevel2, ClassLevel3][:self.depth - 1]:
+            pks = self.bulk_create(model, [
+                {'name': '%s %s/%s' % (model.__name__, pk, i), 'fkey_id': pk} for pk in pks for i in range(self.fanout)
+            ])
+
+        return roots
+
+    def build_gfk(self, roots_count):
+        pks = self.bulk_create(BaseToGFKModel, [{} for _ in range(roots_count)])
+        content_type = ContentType.objects.get_for_model(BaseToGFKModel)
+        self.bulk_create(GFKModel, [
+            {'content_type_id': content_type.pk, 'object_id': pk} for pk in pks for _ in range(self.fanout)
+        ])
+
+        return list(BaseToGFKModel.objects.filter(pk__in=pks))
+
+    def bulk_create(self, model, rows):
+        """
+        Create objects of given model, with explicit primary keys (bulk_create doesn't set them on every database and
+        Django version).
+        :return: primary keys of created objects
+        """
+        last_pk = model._base_manager.order_by('-pk').values_list('pk', flat=True).first() or 0
+        pks = list(range(last_pk + 1, last_pk + 1 + len(rows)))
+
+        model._base_manager.bulk_create([model(pk=pk, **values) for pk, values in zip(pks, rows)],
+                                        batch_size=BATCH_SIZE)
+        self.rows += len(rows)
+        return pks
@@ -0,0 +1,197 @@
+"""
+Benchmark collectors on synthetic graphs (see benchmarks.graph), and save results as JSON.
+
+    python -m benchmarks.run --rows 10000 --output results.json
+    python -m benchmarks.run --rows 1000000 --scenarios depth --collectors deep_collector.batch.BatchDeepCollector
+    python -m benchmarks.compare before.json after.json
+
+For every scenario and collector, we measure collect duration and queries, get_json_serialized_objects duration and
+output size, and the peak memory of both (in a second run, as tracing memory allocations slows everything down).
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import time
+from contextlib import contextmanager
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import django
+
+
+DEFAULT_COLLECTORS = ['deep_collector.core.DeepCollector', 'deep_collector.batch.BatchDeepCollector']
+
+RESULTS_VERSION = 1
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Benchmark collectors on synthetic graphs.')
+    parser.add_argument('--rows', type=int, default=1000, help='approximate number of rows of every scenario')
+    parser.add_argument('--roots', type=int, help='number of roots of every scenario (instead of --rows)')
+    parser.add_argument('--scenarios', default='relations,depth,gfk', help='comma separated scenarios')
+    parser.add_argument('--collectors', default=','.join(DEFAULT_COLLECTORS),
+                        help='comma separated import paths of collector classes')
+    parser.add_argument('--fanout', type=int, default=5, help='related objects by object')
+    parser.add_argument('--depth', type=int, default=3, choices=[1, 2, 3], help='levels of the depth scenario')
+    parser.add_argument('--m2m-density', type=float, default=0.5, help='ManyToManyField objects by root')
+    parser.add_argument('--inheritance', type=float, default=0.1, help='share of multi-table inheritance roots')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help="don't measure peak memory")
+    parser.add_argument('--reuse-database', action='store_true',
+                        help='reuse graphs built by a previous run with the same parameters')
+    parser.add_argument('--output', help='JSON file results are saved to')
+    return parser
+
+
+def setup_database(reuse):
+    from django.conf import settings
+    from django.core.management import call_command
+
+    path = settings.DATABASES['default']['NAME']
+    if not reuse and os.path.exists(path):
+        os.remove(path)
+    call_command('migrate', verbosity=0)
+
+
+@contextmanager
+def count_queries(counter):
+    from django.db import connection
+
+    if hasattr(connection, 'execute_wrapper'):
+        def count_query(execute, sql, params, many, context):
+            counter[0] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            yield
+    else:
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            yield
+        counter[0] += len(queries)
+
+
+def get_collector(collector_class):
+    collector = collector_class()
+    # Graphs are collected as they are built, whatever their fanout (thresholds end up in SQL LIMIT clauses: they have
+    # to fit in a 64 bits integer).
+    collector.MAXIMUM_RELATED_INSTANCES = 10 ** 9
+    return collector
+
+
+def collect(collector, roots):
+    if len(roots) == 1:
+        collector.collect(roots[0])
+    else:
+        collector.collect_many(roots)
+
+
+def measure(collector_class, roots, memory=True):
+    collector = get_collector(collector_class)
+    queries = [0]
+    with count_queries(queries):
+        start = time.time()
+        collect(collector, roots)
+        collect_duration = time.time() - start
+
+    start = time.time()
+    output = collector.get_json_serialized_objects().getvalue()
+    serialize_duration = time.time() - start
+
+    result = {
+        'collected_objects': len(collector.collected_objs),
+        'collect_duration': collect_duration,
+        'collect_queries': queries[0],
+        'serialize_duration': serialize_duration,
+        'output_size': len(output.encode('utf-8')),
+        'collect_peak_memory': None,
+        'serialize_peak_memory': None,
+    }
+    del collector, output
+
+    if memory and tracemalloc is not None:
+        collector = get_collector(collector_class)
+        result['collect_peak_memory'] = get_peak_memory(collect, collector, roots)
+        # Memory allocated by the serialization, on top of collected objects.
+        result['serialize_peak_memory'] = get_peak_memory(collector.get_json_serialized_objects)
+
+    return result
+
+
+def get_peak_memory(function, *args):
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(options):
+    from django.utils.module_loading import import_string
+
+    from .graph import SCENARIOS, Graph
+
+    setup_database(options.reuse_database)
+
+    graph = Graph(fanout=options.fanout, depth=options.depth, m2m_density=options.m2m_density,
+                  inheritance=options.inheritance, seed=options.seed)
+    collector_classes = [import_string(path) for path in options.collectors.split(',')]
+
+    results = []
+    for scenario in options.scenarios.split(','):
+        if scenario not in SCENARIOS:
+            raise ValueError('Unknown scenario: %s' % scenario)
+
+        roots_count = options.roots or graph.get_roots_count(scenario, options.rows)
+        rows = graph.rows
+        start = time.time()
+        roots = graph.build(scenario, roots_count)
+        build_duration = time.time() - start
+        rows = graph.rows - rows
+
+        for collector_class in collector_classes:
+            result = {
+                'scenario': scenario,
+                'collector': '%s.%s' % (collector_class.__module__, collector_class.__name__),
+                'roots': len(roots),
+                'rows': rows,
+                'build_duration': build_duration,
+            }
+            result.update(measure(collector_class, roots, memory=not options.no_memory))
+            results.append(result)
+            print('%(scenario)s / %(collector)s: %(collected_objects)s objects, %(collect_queries)s queries, '
+                  '%(collect_duration).2fs collect, %(serialize_duration).2fs serialization, '
+                  '%(output_size)s bytes' % result)
+
+    return {
+        'version': RESULTS_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'parameters': vars(options),
+        'results': results,
+    }
+
+
+def main(argv=None):
+    options = get_parser().parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    django.setup()
+
+    report = run(options)
+    if options.output:
+        with open(options.output, 'w') as stream:
+            json.dump(report, stream, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+import os
+import tempfile
+
+from tests.test_settings import *  # noqa
+
+
+# Benchmark graphs are built in their own SQLite file, that can be kept between runs (see --reuse-database).
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('BENCHMARK_DATABASE', os.path.join(tempfile.gettempdir(), 'deep_collector_benchmark.db')),
+    }
+}
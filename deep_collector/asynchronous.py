@@ -0,0 +1,323 @@
+import asyncio
+import contextvars
+from collections import OrderedDict
+
+import django
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count
+
+from .batch import RELATION_QUERY_ERRORS, BatchDeepCollector
+from .core import get_model_from_instance
+
+if django.VERSION < (4, 1):
+    raise ImportError('AsyncDeepCollector requires the asynchronous ORM of Django 4.1+')
+
+
+# Events and excluded fields recorded by the relation task running in the current asyncio task.
+_task_records = contextvars.ContextVar('deep_collector_task_records', default=None)
+
+
+class AsyncDeepCollector(BatchDeepCollector):
+    """
+    Asynchronous version of BatchDeepCollector, built on Django asynchronous ORM (Django 4.1+), to be used from async
+    views or workers without blocking a thread for the whole collect.
+
+    Relation queries of every level run concurrently, at most CONCURRENCY of them at the same time. Parameters,
+    hooks (pre_collect, post_collect, filter_by_threshold) and report are the same as in BatchDeepCollector. Hooks
+    are synchronous: they must not query the database. MAX_QUERIES, PROFILE and CHECKPOINT_PATH are not supported
+    (MAX_DURATION and MAX_COLLECTED_OBJECTS are).
+
+    HOWTO use:
+    >>> from deep_collector.asynchronous import AsyncDeepCollector
+    >>>
+    >>> collector = AsyncDeepCollector()
+    >>> await collector.collect(user)
+    >>> related_objects = await collector.aget_collected_objects()
+
+    Serialization is still synchronous: use sync_to_async(collector.write_json_serialized_objects).
+    """
+
+    # Maximum number of relation queries running at the same time.
+    CONCURRENCY = 10
+
+    async def collect(self, root_obj):
+        await self.collect_many([root_obj])
+
+    async def collect_many(self, root_objs):
+        # Queries run in threads of the asynchronous ORM, where they can't be counted, and checkpoints are only
+        # written by synchronous collects.
+        if self.MAX_QUERIES is not None or self.PROFILE or self.CHECKPOINT_PATH:
+            raise ImproperlyConfigured('MAX_QUERIES, PROFILE and CHECKPOINT_PATH are not supported by '
+                                       'AsyncDeepCollector')
+
+        self._reset_collect_state(list(root_objs))
+        self._content_types = {}
+
+        while self.objects_to_collect and not self.is_over_limits():
+            self.objects_to_collect = await self._acollect_level(self.objects_to_collect)
+
+        self._emit_collect_history()
+
+    async def _acollect_level(self, frontier):
+        objs_by_model, unexplored_frontier = self._collect_frontier(frontier)
+
+        tasks = []
+        for objs in objs_by_model.values():
+            tasks += self.get_local_relation_tasks(objs)
+            tasks += self.get_related_relation_tasks(objs)
+
+        next_frontier = await self.arun_relation_tasks(tasks)
+
+        if not self.KEYS_ONLY:
+            for objs in objs_by_model.values():
+                for obj in objs:
+                    self.post_collect(obj)
+
+        return unexplored_frontier + next_frontier
+
+    async def arun_relation_tasks(self, tasks):
+        """
+        Asynchronous version of run_relation_tasks: tasks run concurrently (at most CONCURRENCY of them at the same
+        time), and their events and excluded fields are recorded in tasks order.
+        """
+        semaphore = asyncio.Semaphore(self.CONCURRENCY)
+        outcomes = await asyncio.gather(*[self._arun_task(task, semaphore) for task in tasks])
+        return self._merge_task_outcomes(outcomes)
+
+    async def _arun_task(self, task, semaphore):
+        event_type, objs, field, method, args = task
+
+        async with semaphore:
+            # Every task runs in its own context, so records are never shared between tasks.
+            records = []
+            _task_records.set(records)
+            if self.is_over_limits():
+                self.add_unexplored_relation(objs, field)
+                return records, []
+            if self.emits_events:
+                self.emit_event(type=event_type, obj=objs[0], field=field)
+            # Relation tasks are given with synchronous query methods: we run their asynchronous version instead.
+            result = await getattr(self, 'a' + method.__name__)(*args)
+            return records, result
+
+    def _get_task_records(self):
+        records = _task_records.get()
+        if records is not None:
+            return records
+        return super(AsyncDeepCollector, self)._get_task_records()
+
+    async def aquery_foreign_key_objects_batch(self, objs, field):
+        values = self._get_foreign_key_values(objs, field)
+        queryset = self.get_manager(field.related_model._base_manager).all()
+        instances = await self.afetch_in_bulk(queryset, set(value for _, value in values), field.target_field)
+        return self._link_referred_objects(values, instances, queryset.model, field.target_field, field)
+
+    async def aquery_generic_foreign_key_objects_batch(self, objs, field):
+        await self._aload_content_type_models(objs, field)
+        values_by_model = self._get_generic_foreign_key_values(objs, field)
+
+        related_objs = []
+        for related_model, values in values_by_model.items():
+            instances = await self.afetch_in_bulk(self.get_manager(related_model._base_manager).all(),
+                                                  set(pk for _, pk in values), related_model._meta.pk)
+            related_objs += self._link_referred_objects(values, instances, related_model, related_model._meta.pk,
+                                                        field)
+
+        return related_objs
+
+    async def _aload_content_type_models(self, objs, field):
+        """
+        Load content types referred to by given objects that are not in cache yet, so that
+        get_generic_foreign_key_value doesn't have to query them.
+        """
+        attname = objs[0]._meta.get_field(field.ct_field).attname
+        content_type_ids = set(getattr(obj, attname) for obj in objs) - set(self._content_type_models)
+        content_type_ids.discard(None)
+        if not content_type_ids:
+            return
+
+        queryset = ContentType.objects.db_manager(self.USING or objs[0]._state.db).filter(pk__in=content_type_ids)
+        async for content_type in queryset:
+            self._content_type_models[content_type.pk] = content_type.model_class()
+        for content_type_id in content_type_ids:
+            self._content_type_models.setdefault(content_type_id, None)
+
+    async def aquery_related_objects_batch(self, objs, accessor_name, related_model, query_name, attname):
+        related_model_name = get_model_from_instance(related_model)
+        max_count = self.get_maximum_allowed_instances_for_model(related_model_name)
+        manager = self.get_manager(related_model._default_manager)
+        fk_attname = related_model._meta.get_field(query_name).attname
+
+        try:
+            counts = dict([
+                row async for row in manager
+                .filter(**{query_name + '__in': [getattr(obj, attname) for obj in objs]})
+                .order_by()
+                .values_list(query_name)
+                .annotate(count=Count('pk'))
+            ])
+
+            objs_to_fetch = self._filter_by_related_counts(objs, counts, attname, accessor_name, related_model_name,
+                                                           max_count)
+            if not objs_to_fetch:
+                return []
+
+            related_objs_by_value = OrderedDict()
+            queryset = self.get_traversal_queryset(manager.all(), fk_attname).filter(
+                **{query_name + '__in': [getattr(obj, attname) for obj in objs_to_fetch]})
+            async for related_obj in queryset:
+                related_objs_by_value.setdefault(getattr(related_obj, fk_attname), []).append(related_obj)
+        except RELATION_QUERY_ERRORS:
+            self.skip_failed_relation(objs, accessor_name)
+            return []
+
+        return [
+            (obj, related_obj)
+            for obj in objs_to_fetch
+            for related_obj in related_objs_by_value.get(getattr(obj, attname), [])
+        ]
+
+    async def aquery_reverse_one_to_one_objects_batch(self, objs, accessor_name, related_model, attname):
+        field = related_model._meta.get_field(attname)
+        objs_by_value = OrderedDict((getattr(obj, field.target_field.attname), obj) for obj in objs)
+        queryset = self.get_traversal_queryset(self.get_manager(related_model._base_manager).all(), attname)
+
+        related_objs_by_value = {}
+        try:
+            async for related_obj in queryset.filter(**{attname + '__in': list(objs_by_value)}):
+                related_objs_by_value[getattr(related_obj, attname)] = related_obj
+        except RELATION_QUERY_ERRORS:
+            self.skip_failed_relation(objs, accessor_name)
+            return []
+
+        related_objs = []
+        for value, obj in objs_by_value.items():
+            if value not in related_objs_by_value:
+                if self.emits_events:
+                    self.emit_event(type='no_related_object', obj=obj, field=accessor_name)
+                continue
+
+            related_obj = related_objs_by_value[value]
+            if self.filter_by_threshold([related_obj], obj, accessor_name):
+                related_objs.append((obj, related_obj))
+
+        return related_objs
+
+    async def aquery_m2m_objects_batch(self, objs, accessor_name, m2m_field, reverse=False):
+        through = m2m_field.remote_field.through
+        source_field = through._meta.get_field(m2m_field.m2m_field_name())
+        target_field = through._meta.get_field(m2m_field.m2m_reverse_field_name())
+        if reverse:
+            source_field, target_field = target_field, source_field
+
+        related_model = target_field.related_model
+        related_model_name = get_model_from_instance(related_model)
+        max_count = self.get_maximum_allowed_instances_for_model(related_model_name)
+
+        objs_by_value = OrderedDict((getattr(obj, source_field.target_field.attname), obj) for obj in objs)
+        try:
+            rows = [
+                row async for row in self.get_manager(through._base_manager).filter(
+                    **{source_field.attname + '__in': list(objs_by_value)}
+                ).values_list(source_field.attname, target_field.attname)
+            ]
+        except RELATION_QUERY_ERRORS:
+            self.skip_failed_relation(objs, accessor_name)
+            return []
+
+        edges, values_to_fetch = self._bucket_related_values(objs_by_value, rows, accessor_name, related_model_name,
+                                                             max_count)
+        instances = await self.afetch_in_bulk(self.get_manager(related_model._default_manager).all(),
+                                              values_to_fetch, target_field.target_field)
+
+        return self._link_related_values(edges, instances)
+
+    async def aquery_generic_relation_objects_batch(self, objs, field):
+        related_model = field.related_model
+        related_model_name = get_model_from_instance(related_model)
+        max_count = self.get_maximum_allowed_instances_for_model(related_model_name)
+
+        content_type = await self._aget_content_type(objs[0], field.for_concrete_model)
+        objs_by_pk = OrderedDict((obj.pk, obj) for obj in objs)
+        try:
+            rows = [
+                row async for row in self.get_manager(related_model._default_manager).filter(**{
+                    field.content_type_field_name: content_type,
+                    field.object_id_field_name + '__in': list(objs_by_pk),
+                }).values_list(field.object_id_field_name, 'pk')
+            ]
+        except RELATION_QUERY_ERRORS:
+            self.skip_failed_relation(objs, field.name)
+            return []
+
+        edges, pks_to_fetch = self._bucket_related_values(objs_by_pk, rows, field.name, related_model_name, max_count,
+                                                          converter=objs[0]._meta.pk.to_python)
+        instances = await self.afetch_in_bulk(self.get_manager(related_model._default_manager).all(), pks_to_fetch,
+                                              related_model._meta.pk)
+
+        return self._link_related_values(edges, instances)
+
+    async def _aget_content_type(self, obj, for_concrete_model):
+        """
+        Asynchronous version of ContentType.objects.get_for_model, cached during the whole collect.
+        """
+        model = obj._meta.concrete_model if for_concrete_model else obj.__class__
+        if model not in self._content_types:
+            content_type, _ = await ContentType.objects.db_manager(self.USING or obj._state.db).aget_or_create(
+                app_label=model._meta.app_label, model=model._meta.model_name)
+            self._content_types[model] = content_type
+
+        return self._content_types[model]
+
+    async def aquery_hidden_objects_batch(self, objs, related):
+        return self.query_hidden_objects_batch(objs, related)
+
+    async def afetch_in_bulk(self, queryset, values, field):
+        """
+        Asynchronous version of fetch_in_bulk.
+        """
+        queryset = self.get_traversal_queryset(queryset, field.attname)
+
+        if field.primary_key:
+            values = [value for value in values if not self._is_excluded_pk(queryset.model, value)]
+            return await queryset.ain_bulk(values)
+
+        queryset = queryset.filter(**{field.name + '__in': values})
+        return dict([(getattr(obj, field.attname), obj) async for obj in queryset])
+
+    async def aget_collected_objects(self):
+        """
+        Asynchronous version of get_collected_objects, loading collected objects (KEYS_ONLY) or their deferred fields
+        (DEFER_FIELDS) by chunks of LOAD_CHUNK_SIZE objects.
+        :return: a list of collected objects
+        """
+        if self.KEYS_ONLY:
+            pks_by_model = OrderedDict()
+            for model, pk in self.collected_objs:
+                pks_by_model.setdefault(model, []).append(pk)
+
+            collected_objs = []
+            for model, pks in pks_by_model.items():
+                for i in range(0, len(pks), self.LOAD_CHUNK_SIZE):
+                    chunk = pks[i:i + self.LOAD_CHUNK_SIZE]
+                    objs = await model._base_manager.ain_bulk(chunk)
+                    for pk in chunk:
+                        if pk in objs:
+                            self.post_collect(objs[pk])
+                            collected_objs.append(objs[pk])
+            return collected_objs
+
+        collected_objs = list(self.collected_objs.values())
+        if self.DEFER_FIELDS:
+            for i in range(0, len(collected_objs), self.LOAD_CHUNK_SIZE):
+                await self._aload_deferred_fields(collected_objs[i:i + self.LOAD_CHUNK_SIZE])
+
+        return collected_objs
+
+    async def _aload_deferred_fields(self, objs):
+        for (model, attnames), objs_by_pk in self._group_by_deferred_fields(objs).items():
+            async for row in model._base_manager.filter(pk__in=list(objs_by_pk)).values_list('pk', *attnames):
+                obj = objs_by_pk[row[0]]
+                for attname, value in zip(attnames, row[1:]):
+                    obj.__dict__[attname] = value
@@ -0,0 +1,681 @@
+import threading
+from collections import OrderedDict, deque
+from itertools import islice
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import FieldError, ObjectDoesNotExist
+from django.db import DatabaseError
+from django.db.models import Count, ForeignKey, OneToOneField, Prefetch, prefetch_related_objects
+
+from .compat.fields import GenericRelation
+from .core import (DeepCollector, LabelKeyedView, _sink_emit_events, close_thread_connections, get_field_name,
+                   get_model_from_instance)
+
+
+# Errors raised when a relation can't be queried as a whole (e.g. a lookup that can't be resolved on a custom
+# relation, or a missing table): the relation is skipped (see BatchDeepCollector.skip_failed_relation). Other errors
+# are raised.
+RELATION_QUERY_ERRORS = (FieldError, DatabaseError)
+
+
+class BatchDeepCollector(DeepCollector):
+    """
+    Alternative traversal engine for DeepCollector, collecting the same objects with much less queries.
+
+    DeepCollector collects objects one by one, so every relation of every collected object costs at least one query.
+    This collector walks the graph one level at a time instead:
+
+    1. Every object of the current level (the 'frontier') goes through the usual exclusion checks, and is collected.
+
+    2. Collected objects are grouped by model, and each relation of this model is fetched for the whole group at once
+    (with a single 'pk__in' / 'fk__in' query).
+
+    3. Objects related to the current level become the next frontier, and we go back to step 1.
+
+    Parameters (EXCLUDE_MODELS, EXCLUDE_DIRECT_FIELDS, EXCLUDE_RELATED_FIELDS, thresholds and
+    ALLOWS_SAME_TYPE_AS_ROOT_COLLECT) have the same meaning as in DeepCollector: switching from one engine to the
+    other changes the query count and the order in which objects are collected, not the collected objects.
+
+    HOWTO use:
+    >>> from deep_collector.batch import BatchDeepCollector
+    >>>
+    >>> collector = BatchDeepCollector()
+    >>> collector.collect(user)
+    >>> related_objects = collector.get_collected_objects()
+    """
+
+    # Number of threads querying relations of a level at the same time (each one with its own database connection).
+    WORKERS = 1
+
+    # Database alias related objects are queried from. By default, the one given objects have been loaded from.
+    USING = None
+
+    # Records of relation tasks, by thread (see _reset_collect_state).
+    _task_records = None
+
+    # Table the last frontier spilled to disk is in (see get_frontier).
+    _frontier_table_index = 0
+
+    def _start_collect(self, root_objs):
+        self._reset_collect_state(list(root_objs))
+
+    def _reset_collect_state(self, root_objs):
+        super(BatchDeepCollector, self)._reset_collect_state(root_objs)
+        # Events and excluded fields recorded by the relation task running in the current thread.
+        self._task_records = threading.local()
+
+    def _collect_step(self):
+        # objects_to_collect is holding the current frontier, i.e. every (parent, obj) of the current level, and a step
+        # is a level. Checkpoints are only saved between levels, so a resumed collect starts again from the beginning
+        # of a level.
+        self._checkpoint_if_needed()
+        self.objects_to_collect = self._collect_level(self.objects_to_collect)
+
+    def get_frontier(self, items):
+        """
+        Container of the (parent, object) tuples of a level: a list, or a stack spilled to disk (SPILL_TO_DISK) that
+        is only iterated, bottom first. A level is read from a table while the next one is written to the other one.
+        """
+        if self.SPILL_TO_DISK:
+            self._frontier_table_index = 1 - self._frontier_table_index
+            return self._storage.get_stack('frontier_%s' % self._frontier_table_index, items)
+        return list(items)
+
+    def _collect_level(self, frontier):
+        if self.SPILL_TO_DISK:
+            return self._collect_spilled_level(frontier)
+
+        objs_by_model, unexplored_frontier = self._collect_frontier(frontier)
+        return unexplored_frontier + self._collect_level_relations(objs_by_model)
+
+    def _collect_spilled_level(self, frontier):
+        """
+        Collect a level spilled to disk SPILL_CACHE_SIZE objects at a time, spilling the next level while it grows.
+        Relations of a chunk may lead to objects of the next chunks of the level: they are collected with the level
+        anyway, and just skipped by the next one.
+        """
+        next_frontier = self.get_frontier(())
+        items = iter(frontier)
+        while True:
+            chunk = list(islice(items, self.SPILL_CACHE_SIZE))
+            if not chunk:
+                return next_frontier
+
+            objs_by_model, unexplored_frontier = self._collect_frontier(chunk)
+            next_frontier.extend(self._collect_level_relations(objs_by_model))
+            if unexplored_frontier:
+                # Objects left when a limit is reached are kept with the next level.
+                next_frontier.extend(unexplored_frontier)
+                for item in items:
+                    next_frontier.append(item)
+                return next_frontier
+
+    def _collect_level_relations(self, objs_by_model):
+        """
+        Query relations of objects collected in a level (by model).
+        :return: (parent, related object) tuples of the next level
+        """
+        # Relations of every model of the level are independent from each other: they can be queried concurrently.
+        tasks = []
+        for objs in objs_by_model.values():
+            tasks += self.get_local_relation_tasks(objs)
+            tasks += self.get_related_relation_tasks(objs)
+
+        next_frontier = self.run_relation_tasks(tasks)
+
+        for objs in objs_by_model.values():
+            for obj in objs:
+                self._clear_prefetched_relations(obj)
+                if not self.KEYS_ONLY:
+                    self.post_collect(obj)
+
+        return next_frontier
+
+    def _resume_unexplored_relations(self, relations):
+        # Relations of a level that haven't been queried when a limit has been reached: they are queried now, and the
+        # objects they lead to are added to the frontier.
+        relation_names_by_key = OrderedDict()
+        for relation in relations:
+            key = LabelKeyedView.get_registry_key(relation['object'])
+            field_names = relation_names_by_key.setdefault(key, [])
+            if relation['field'] not in field_names:
+                field_names.append(relation['field'])
+        objs_by_key = self._load_objects_by_keys(list(relation_names_by_key), queryset_fn=self.get_traversal_queryset)
+
+        objs_by_relation = OrderedDict()
+        for key, field_names in relation_names_by_key.items():
+            if key in objs_by_key:
+                for field_name in field_names:
+                    objs_by_relation.setdefault((key[0], field_name), []).append(objs_by_key[key])
+
+        tasks = []
+        for (_, field_name), objs in objs_by_relation.items():
+            tasks += [task for task in self.get_local_relation_tasks(objs) + self.get_related_relation_tasks(objs)
+                      if get_field_name(task[2]) == field_name]
+
+        with self.count_queries():
+            self.objects_to_collect.extend(self.run_relation_tasks(tasks))
+
+    def _collect_frontier(self, frontier):
+        """
+        Collect objects of a level (the ones that are not excluded), until a collect limit is reached.
+        :return: collected objects by model, and (parent, object) tuples left in the frontier
+        """
+        objs_by_model = OrderedDict()
+
+        items = iter(frontier)
+        for parent, obj in items:
+            if self.is_over_limits():
+                # Objects that won't be collected are left in the frontier.
+                return objs_by_model, [(parent, obj)] + list(items)
+            if self.is_excluded_from_collect(parent, obj):
+                continue
+            obj = self.pre_collect(obj)
+            self.add_to_collected_object(parent, obj)
+            objs_by_model.setdefault(obj.__class__, []).append(obj)
+
+        return objs_by_model, []
+
+    def get_local_objs_batch(self, objs):
+        """
+        Batch version of get_local_objs, for objects of the same model.
+        :return: (parent, related object) tuples
+        """
+        return self.run_relation_tasks(self.get_local_relation_tasks(objs))
+
+    def get_related_objs_batch(self, objs):
+        """
+        Batch version of get_related_objs, for objects of the same model.
+        :return: (parent, related object) tuples
+        """
+        return self.run_relation_tasks(self.get_related_relation_tasks(objs))
+
+    def get_local_relation_tasks(self, objs):
+        """
+        Queries to run to get local objects of given objects (of the same model), one for every followed field.
+        :return: (event type, objects, field, query method, query arguments) tuples
+        """
+        plan = self.get_relation_plan(objs[0])
+        tasks = []
+
+        for field in plan.local_relation_fields:
+            if isinstance(field, GenericRelation):
+                tasks.append(('local_reverse_generic_field', objs, field,
+                              self.query_generic_relation_objects_batch, (objs, field)))
+            elif isinstance(field, ForeignKey):
+                tasks.append(('local_field', objs, field, self.query_foreign_key_objects_batch, (objs, field)))
+            else:
+                tasks.append(('local_field', objs, field, self.query_generic_foreign_key_objects_batch, (objs, field)))
+
+        for field in plan.m2m_fields:
+            tasks.append(('local_m2m_field', objs, field, self.query_m2m_objects_batch, (objs, field.name, field)))
+
+        return tasks
+
+    def get_related_relation_tasks(self, objs):
+        """
+        Queries to run to get related objects of given objects (of the same model), one for every followed field.
+        :return: (event type, objects, field, query method, query arguments) tuples
+        """
+        plan = self.get_relation_plan(objs[0])
+        tasks = []
+
+        for related in plan.related_fields:
+            accessor_name = related.get_accessor_name()
+
+            if isinstance(related.field, OneToOneField):
+                tasks.append(('related_field', objs, related, self.query_reverse_one_to_one_objects_batch,
+                              (objs, accessor_name, related.related_model, related.field.attname)))
+            else:
+                tasks.append(('related_field', objs, related, self.query_related_objects_batch,
+                              (objs, accessor_name, related.related_model, related.field.name,
+                               related.field.target_field.attname)))
+
+        for related, _ in plan.related_m2m_fields:
+            if related.is_hidden():
+                tasks.append(('related_m2m_field', objs, related, self.query_hidden_objects_batch, (objs, related)))
+            else:
+                tasks.append(('related_m2m_field', objs, related, self.query_m2m_objects_batch,
+                              (objs, related.get_accessor_name(), related.field, True)))
+
+        return tasks
+
+    def run_relation_tasks(self, tasks):
+        """
+        Run given relation queries, on WORKERS threads if there are several of them.
+        Events and excluded fields are recorded in tasks order, whatever the order in which tasks are completed, so
+        the result is always the same as running tasks one after the other.
+        :return: (parent, related object) tuples, in tasks order
+        """
+        if self.WORKERS > 1 and len(tasks) > 1:
+            outcomes = self._run_tasks_in_threads(tasks)
+        else:
+            outcomes = [self._run_task(task) for task in tasks]
+
+        return self._merge_task_outcomes(outcomes)
+
+    def _merge_task_outcomes(self, outcomes):
+        related_objs = []
+        for records, result in outcomes:
+            for method_name, kwargs in records:
+                getattr(super(BatchDeepCollector, self), method_name)(**kwargs)
+            related_objs += result
+
+        return related_objs
+
+    def _run_task(self, task):
+        event_type, objs, field, method, args = task
+
+        self._task_records.records = []
+        try:
+            if self.is_over_limits():
+                self.add_unexplored_relation(objs, field)
+                return self._task_records.records, []
+            if self.emits_events:
+                self.emit_event(type=event_type, obj=objs[0], field=field)
+            result = self.profile_relation(objs[0], field, method, *args)
+            return self._task_records.records, result
+        finally:
+            self._task_records.records = None
+
+    def _run_tasks_in_threads(self, tasks):
+        # Objects are shared between threads prefetching their relations: their prefetch cache has to exist before.
+        for task in tasks:
+            for obj in task[1]:
+                if not hasattr(obj, '_prefetched_objects_cache'):
+                    obj._prefetched_objects_cache = {}
+
+        outcomes = [None] * len(tasks)
+        errors = []
+        pending_tasks = deque(enumerate(tasks))
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                with self.count_queries():
+                    while True:
+                        with lock:
+                            if not pending_tasks or errors:
+                                return
+                            index, task = pending_tasks.popleft()
+                        try:
+                            outcomes[index] = self._run_task(task)
+                        except Exception as e:
+                            errors.append(e)
+            finally:
+                close_thread_connections()
+
+        threads = [threading.Thread(target=worker) for _ in range(min(self.WORKERS, len(tasks)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+        return outcomes
+
+    def _get_task_records(self):
+        return getattr(self._task_records, 'records', None)
+
+    def emit_event(self, **kwargs):
+        # Inside a relation task, events are recorded to be emitted once the task is over.
+        records = self._get_task_records()
+        if records is not None:
+            records.append(('emit_event', kwargs))
+        else:
+            super(BatchDeepCollector, self).emit_event(**kwargs)
+
+    def add_excluded_field(self, parent_instance_key, field_name, related_model_name, count, max_count):
+        records = self._get_task_records()
+        if records is not None:
+            records.append(('add_excluded_field', {
+                'parent_instance_key': parent_instance_key,
+                'field_name': field_name,
+                'related_model_name': related_model_name,
+                'count': count,
+                'max_count': max_count,
+            }))
+        else:
+            super(BatchDeepCollector, self).add_excluded_field(parent_instance_key, field_name, related_model_name,
+                                                               count, max_count)
+
+    def add_unexplored_relation(self, objs, field):
+        records = self._get_task_records()
+        if records is not None:
+            records.append(('add_unexplored_relation', {'objs': objs, 'field': field}))
+        else:
+            super(BatchDeepCollector, self).add_unexplored_relation(objs, field)
+
+    def skip_failed_relation(self, objs, field):
+        """
+        Skip a relation that couldn't be queried for given objects (all of the same model). As in DeepCollector, it
+        is just not collected, but it is reported in 'unexplored_relations' for every given object.
+        """
+        if self.emits_events:
+            self.emit_event(type='error_related_object', obj=objs[0], field=field)
+        self.add_unexplored_relation(objs, field)
+
+    def get_manager(self, manager):
+        """
+        Manager to query, on the USING database if it is set.
+        """
+        if self.USING:
+            return manager.db_manager(self.USING)
+        return manager
+
+    def query_hidden_objects_batch(self, objs, related):
+        # Hidden relations don't have any accessor, so they are not collected by DeepCollector either.
+        if self.emits_events:
+            self.emit_event(type='error_related_object', obj=objs[0], field=related)
+        return []
+
+    def query_foreign_key_objects_batch(self, objs, field):
+        """
+        Get objects referred to by a ForeignKey (or OneToOneField) of given objects. Foreign key values are read from
+        given objects, and referred objects are loaded with a single in_bulk query.
+        Invalid foreign keys (referring to objects that don't exist anymore) are just not collected.
+        :return: (parent, related object) tuples
+        """
+        values = self._get_foreign_key_values(objs, field)
+        queryset = self.get_manager(field.related_model._base_manager).all()
+        return self._get_referred_objects(values, queryset, field.target_field, field)
+
+    def _get_foreign_key_values(self, objs, field):
+        """
+        :return: (parent, foreign key value) tuples, for every object having a foreign key value
+        """
+        values = []
+        for obj in objs:
+            value = getattr(obj, field.attname)
+            if value is None:
+                if self.emits_events:
+                    self.emit_event(type='local_field_wo_instance', obj=obj, field=field)
+            else:
+                values.append((obj, value))
+
+        return values
+
+    def query_generic_foreign_key_objects_batch(self, objs, field):
+        """
+        Get objects referred to by a GenericForeignKey of given objects. Values are grouped by content type, and
+        referred objects are loaded with a single in_bulk query per content type.
+        :return: (parent, related object) tuples
+        """
+        values_by_model = self._get_generic_foreign_key_values(objs, field)
+
+        related_objs = []
+        for related_model, values in values_by_model.items():
+            related_objs += self._get_referred_objects(values, self.get_manager(related_model._base_manager).all(),
+                                                       related_model._meta.pk, field)
+
+        return related_objs
+
+    def _get_generic_foreign_key_values(self, objs, field):
+        """
+        :return: (parent, primary key) tuples, by model of referred objects
+        """
+        values_by_model = OrderedDict()
+        for obj in objs:
+            related_model, pk = self.get_generic_foreign_key_value(obj, field)
+            if related_model is not None:
+                values_by_model.setdefault(related_model, []).append((obj, pk))
+
+        return values_by_model
+
+    def _get_referred_objects(self, values, queryset, target_field, field):
+        """
+        Load objects referred to by a (generic) foreign key, for every (parent, value) tuple, with a single query.
+        :return: (parent, related object) tuples
+        """
+        instances = self.fetch_in_bulk(queryset, set(value for _, value in values), target_field)
+        return self._link_referred_objects(values, instances, queryset.model, target_field, field)
+
+    def _link_referred_objects(self, values, instances, model, target_field, field):
+        related_objs = []
+        for obj, value in values:
+            if value in instances:
+                related_objs.append((obj, instances[value]))
+            elif target_field.primary_key and self._is_excluded_pk(model, value):
+                if self.emits_events:
+                    self.emit_event(type='local_field_excluded_instance', obj=obj, field=field)
+            else:
+                if self.emits_events:
+                    self.emit_event(type='local_field_no_instance', obj=obj, field=field)
+
+        return related_objs
+
+    def query_related_objects_batch(self, objs, accessor_name, related_model, query_name, attname):
+        """
+        Get objects related to given objects through a reverse ForeignKey.
+        Thresholds are checked for every parent object with a single grouped count query, so relations having too
+        many related objects are reported without loading any of them. Other relations are then prefetched with a
+        single query.
+        :param objs: objects of the same model
+        :param accessor_name: the name of the manager on parent objects
+        :param related_model: the model of related objects
+        :param query_name: the lookup pointing to parent objects, from related_model
+        :param attname: the parent objects attribute that query_name is referring to
+        :return: (parent, related object) tuples
+        """
+        related_model_name = get_model_from_instance(related_model)
+        max_count = self.get_maximum_allowed_instances_for_model(related_model_name)
+
+        try:
+            counts = dict(
+                self.get_manager(related_model._default_manager)
+                .filter(**{query_name + '__in': [getattr(obj, attname) for obj in objs]})
+                .order_by()
+                .values_list(query_name)
+                .annotate(count=Count('pk'))
+            )
+        except RELATION_QUERY_ERRORS:
+            self.skip_failed_relation(objs, accessor_name)
+            return []
+
+        objs_to_fetch = self._filter_by_related_counts(objs, counts, attname, accessor_name, related_model_name,
+                                                       max_count)
+        if not objs_to_fetch:
+            return []
+
+        queryset = None
+        if self.KEYS_ONLY or self.DEFER_FIELDS or self.USING:
+            queryset = self.get_traversal_queryset(self.get_manager(related_model._default_manager).all(),
+                                                   related_model._meta.get_field(query_name).attname)
+        return self.get_prefetched_related_objects(objs_to_fetch, accessor_name, queryset)
+
+    def _filter_by_related_counts(self, objs, counts, attname, accessor_name, related_model_name, max_count):
+        """
+        Exclude (and report) relations having too many related objects, from related objects count of every object.
+        :param counts: related objects count, by value of attname
+        :return: objects having related objects to fetch
+        """
+        objs_to_fetch = []
+        for obj in objs:
+            count = counts.get(getattr(obj, attname), 0)
+            if count > max_count:
+                self._exclude_too_many_related_objects(obj, accessor_name, related_model_name, count, max_count)
+            elif count:
+                objs_to_fetch.append(obj)
+
+        return objs_to_fetch
+
+    def query_m2m_objects_batch(self, objs, accessor_name, m2m_field, reverse=False):
+        """
+        Get objects related to given objects through a ManyToManyField. The through table is read once for every
+        given object, then related objects are loaded with a single in_bulk query.
+        Thresholds are checked for every parent object from through table rows, so relations having too many related
+        objects are never loaded.
+        :param objs: objects of the same model
+        :param accessor_name: the name of the manager on parent objects
+        :param m2m_field: the ManyToManyField
+        :param reverse: True if parent objects are on the 'to' side of m2m_field (reverse ManyToManyField)
+        :return: (parent, related object) tuples
+        """
+        through = m2m_field.remote_field.through
+        source_field = through._meta.get_field(m2m_field.m2m_field_name())
+        target_field = through._meta.get_field(m2m_field.m2m_reverse_field_name())
+        if reverse:
+            source_field, target_field = target_field, source_field
+
+        related_model = target_field.related_model
+        related_model_name = get_model_from_instance(related_model)
+        max_count = self.get_maximum_allowed_instances_for_model(related_model_name)
+
+        objs_by_value = OrderedDict((getattr(obj, source_field.target_field.attname), obj) for obj in objs)
+        try:
+            rows = list(self.get_manager(through._base_manager).filter(
+                **{source_field.attname + '__in': list(objs_by_value)}
+            ).values_list(source_field.attname, target_field.attname))
+        except RELATION_QUERY_ERRORS:
+            self.skip_failed_relation(objs, accessor_name)
+            return []
+
+        edges, values_to_fetch = self._bucket_related_values(objs_by_value, rows, accessor_name, related_model_name,
+                                                             max_count)
+        instances = self.fetch_in_bulk(self.get_manager(related_model._default_manager).all(), values_to_fetch,
+                                       target_field.target_field)
+
+        return self._link_related_values(edges, instances)
+
+    def _bucket_related_values(self, objs_by_value, rows, accessor_name, related_model_name, max_count,
+                               converter=None):
+        """
+        Bucket (parent value, related value) rows back to their parent object, and exclude (and report) relations
+        having too many related objects.
+        :param objs_by_value: parent objects, by the value rows are referring to
+        :param converter: function converting parent values of rows to the type of objs_by_value keys
+        :return: (parent, related values) edges, and the set of every related value to fetch
+        """
+        related_values_by_value = OrderedDict()
+        for source_value, target_value in rows:
+            if converter is not None:
+                source_value = converter(source_value)
+            related_values_by_value.setdefault(source_value, []).append(target_value)
+
+        edges = []
+        values_to_fetch = set()
+        for source_value, related_values in related_values_by_value.items():
+            obj = objs_by_value[source_value]
+            if len(related_values) > max_count:
+                self._exclude_too_many_related_objects(obj, accessor_name, related_model_name,
+                                                       len(related_values), max_count)
+                continue
+
+            edges.append((obj, related_values))
+            values_to_fetch.update(related_values)
+
+        return edges, values_to_fetch
+
+    def _link_related_values(self, edges, instances):
+        return [
+            (obj, instances[value])
+            for obj, related_values in edges
+            for value in related_values
+            if value in instances
+        ]
+
+    def query_generic_relation_objects_batch(self, objs, field):
+        """
+        Get objects related to given objects through a GenericRelation. Related rows of every given object are read
+        with a single query (on content type and object ids), then bucketed back to their parent object, so thresholds
+        are checked for every parent. Remaining related objects are loaded with a single in_bulk query.
+        :return: (parent, related object) tuples
+        """
+        related_model = field.related_model
+        related_model_name = get_model_from_instance(related_model)
+        max_count = self.get_maximum_allowed_instances_for_model(related_model_name)
+
+        content_type = ContentType.objects.db_manager(self.USING or objs[0]._state.db).get_for_model(
+            objs[0], for_concrete_model=field.for_concrete_model)
+        objs_by_pk = OrderedDict((obj.pk, obj) for obj in objs)
+        try:
+            rows = list(self.get_manager(related_model._default_manager).filter(**{
+                field.content_type_field_name: content_type,
+                field.object_id_field_name + '__in': list(objs_by_pk),
+            }).values_list(field.object_id_field_name, 'pk'))
+        except RELATION_QUERY_ERRORS:
+            self.skip_failed_relation(objs, field.name)
+            return []
+
+        # Object ids are not always stored with the same type as parent primary keys (e.g. in a CharField).
+        edges, pks_to_fetch = self._bucket_related_values(objs_by_pk, rows, field.name, related_model_name, max_count,
+                                                          converter=objs[0]._meta.pk.to_python)
+        instances = self.fetch_in_bulk(self.get_manager(related_model._default_manager).all(), pks_to_fetch,
+                                       related_model._meta.pk)
+
+        return self._link_related_values(edges, instances)
+
+    def fetch_in_bulk(self, queryset, values, field):
+        """
+        Load objects of queryset whose given field is in values, with a single query. Objects that have already been
+        collected (or that are excluded from collect) are not loaded, as they won't be collected anyway.
+        :return: a {value: object} dict
+        """
+        queryset = self.get_traversal_queryset(queryset, field.attname)
+
+        if field.primary_key:
+            values = [value for value in values if not self._is_excluded_pk(queryset.model, value)]
+            return queryset.in_bulk(values)
+
+        return dict((getattr(obj, field.attname), obj) for obj in queryset.filter(**{field.name + '__in': values}))
+
+    def query_reverse_one_to_one_objects_batch(self, objs, accessor_name, related_model, attname):
+        """
+        Get the object related to given objects through a reverse OneToOneField, with a single query.
+        :param related_model: the model of related objects
+        :param attname: the OneToOneField attribute name, on related_model
+        :return: (parent, related object) tuples
+        """
+        queryset = None
+        if self.KEYS_ONLY or self.DEFER_FIELDS or self.USING:
+            queryset = self.get_traversal_queryset(self.get_manager(related_model._base_manager).all(), attname)
+        if not self.prefetch_relation(objs, accessor_name, queryset):
+            return []
+
+        related_objs = []
+        for obj in objs:
+            try:
+                related_obj = getattr(obj, accessor_name)
+            except ObjectDoesNotExist:
+                if self.emits_events:
+                    self.emit_event(type='no_related_object', obj=obj, field=accessor_name)
+                continue
+
+            if self.filter_by_threshold([related_obj], obj, accessor_name):
+                related_objs.append((obj, related_obj))
+
+        return related_objs
+
+    def get_prefetched_related_objects(self, objs, lookup, queryset=None):
+        """
+        Get related objects of a manager, for every given object, with a single query.
+        :return: (parent, related object) tuples
+        """
+        if not self.prefetch_relation(objs, lookup, queryset):
+            return []
+
+        return [(obj, related_obj) for obj in objs for related_obj in getattr(obj, lookup).all()]
+
+    def prefetch_relation(self, objs, lookup, queryset=None):
+        """
+        Fetch given relation for every given object (all of the same model), with a single query.
+        :param queryset: the queryset used to fetch related objects, instead of the relation default one
+        :return: True if the relation has been prefetched
+        """
+        try:
+            prefetch_related_objects(objs, Prefetch(lookup, queryset=queryset))
+        except RELATION_QUERY_ERRORS:
+            self.skip_failed_relation(objs, lookup)
+            return False
+        return True
+
+    def _clear_prefetched_relations(self, obj):
+        # Prefetched managers would otherwise keep every related object alive (and return stale results if the
+        # collected instance is used afterwards). This is only a cache, managers will query the database again.
+        obj.__dict__.pop('_prefetched_objects_cache', None)
+
+
+# Events are deferred during relation tasks, then sent to sinks.
+_sink_emit_events.add(vars(BatchDeepCollector)['emit_event'])
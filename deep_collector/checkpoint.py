@@ -0,0 +1,56 @@
+import json
+import os
+
+from django.apps import apps
+
+from .core import get_model_label
+
+
+# Version of the checkpoint file format.
+CHECKPOINT_VERSION = 1
+
+# os.rename can't replace an existing file on Windows, and os.replace doesn't exist in Python 2.
+replace_file = getattr(os, 'replace', os.rename)
+
+
+def write_checkpoint(path, state):
+    """
+    Write a collect state to the given path. The state is first written to a temporary file, that then replaces the
+    previous checkpoint, so a checkpoint file is always complete, even if the process dies while writing it.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as stream:
+        # Primary keys that are not JSON serializable (e.g. UUID) are converted back from strings when resuming.
+        json.dump(dict(state, version=CHECKPOINT_VERSION), stream, default=str)
+    replace_file(tmp_path, path)
+
+
+def read_checkpoint(path):
+    with open(path) as stream:
+        state = json.load(stream)
+
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError('Unsupported checkpoint version: %s' % state.get('version'))
+
+    return state
+
+
+def dump_key(key):
+    """
+    Convert a (model, pk) collector key to a JSON serializable [label, pk] list.
+    """
+    if key is None:
+        return None
+    model, pk = key
+    return [get_model_label(model), pk]
+
+
+def load_key(value):
+    """
+    Convert a [label, pk] list back to a (model, pk) collector key.
+    """
+    if value is None:
+        return None
+    label, pk = value
+    model = apps.get_model(label)
+    return model, model._meta.pk.to_python(pk)
@@ -11,3 +11,42 @@ try:
 except:
     # Python 3.x
     basestring = (str, bytes)
+
+
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:
+    # Python 2.x
+    from collections import Mapping, MutableMapping
+
+
+try:
+    import queue
+except ImportError:
+    # Python 2.x
+    import Queue as queue
+
+
+try:
+    from contextlib import ExitStack
+except ImportError:
+    # Python 2.x: only entering context managers, and exiting them in reverse order.
+    class ExitStack(object):
+        def __init__(self):
+            self._exits = []
+
+        def enter_context(self, context_manager):
+            result = context_manager.__enter__()
+            self._exits.append(context_manager.__exit__)
+            return result
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            suppressed = False
+            while self._exits:
+                if self._exits.pop()(*exc_info):
+                    suppressed = True
+                    exc_info = (None, None, None)
+            return suppressed
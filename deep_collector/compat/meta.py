@@ -20,7 +20,7 @@ else:
 
     def get_all_related_m2m_objects_with_model(obj):
         return  [
-            (f, f.model if f.model != obj.__class__ else None)
+            (f, f.model if f.model != obj._meta.model else None)
             for f in obj._meta.get_fields(include_hidden=True)
             if f.many_to_many and f.auto_created
         ]
@@ -49,3 +49,67 @@ class MultiModelInheritanceSerializer(CustomizableLocalFieldsSerializer):
             self.parent_local_m2m_fields += parent._meta.local_many_to_many
 
             self.collect_parent_fields(parent._meta.concrete_model)
+
+
+class ChunkedStreamWriter(object):
+    '''
+    File-like wrapper buffering small writes, to write them to the underlying stream in chunks of (at least)
+    chunk_size characters. The underlying stream is flushed after every chunk.
+    '''
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.buffer_size = 0
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffer_size += len(data)
+        if self.buffer_size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.stream.write(''.join(self.buffer))
+            self.buffer = []
+            self.buffer_size = 0
+
+        if callable(getattr(self.stream, 'flush', None)):
+            self.stream.flush()
+
+
+class StreamingMultiModelInheritanceSerializer(MultiModelInheritanceSerializer):
+    '''
+    Same as MultiModelInheritanceSerializer, but objects are written to the given stream (file, socket, HTTP
+    response, ...) while they are serialized, in chunks of chunk_size characters. The serialized output is never
+    kept in memory.
+    If no indent is given, the most compact JSON representation is written.
+
+    >>> with open('fixture.json', 'w') as stream:
+    >>>     StreamingMultiModelInheritanceSerializer().serialize(objects, stream=stream)
+    '''
+    chunk_size = 64 * 1024
+
+    def serialize(self, queryset, **options):
+        stream = ChunkedStreamWriter(options.pop('stream'), options.pop('chunk_size', self.chunk_size))
+        if not options.get('indent'):
+            options.setdefault('separators', (',', ':'))
+
+        super(StreamingMultiModelInheritanceSerializer, self).serialize(queryset, stream=stream, **options)
+        stream.flush()
+
+
+class PrefetchedM2MSerializer(StreamingMultiModelInheritanceSerializer):
+    '''
+    Same as StreamingMultiModelInheritanceSerializer, but ManyToManyField values that have been prefetched are written
+    from the prefetch cache, instead of being queried again.
+    '''
+    def handle_m2m_field(self, obj, field):
+        related_objs = getattr(obj, '_prefetched_objects_cache', {}).get(field.name)
+        # Primary keys are converted with _value_from_field since Django 1.9. Fields with a custom through model are not
+        # serialized by Django (their through objects are).
+        if (related_objs is None or self.use_natural_foreign_keys or not hasattr(self, '_value_from_field') or
+                not field.remote_field.through._meta.auto_created):
+            return super(PrefetchedM2MSerializer, self).handle_m2m_field(obj, field)
+
+        self._current[field.name] = [self._value_from_field(related, related._meta.pk) for related in related_objs]
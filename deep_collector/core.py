@@ -1,15 +1,24 @@
 
 import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 
 import django
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist, ValidationError
+from django.db import connections
 from django.db.models import ForeignKey, OneToOneField
 
-from .compat.builtins import basestring, StringIO
+from .compat.builtins import basestring, ExitStack, Mapping, StringIO
 from .compat.fields import GenericForeignKey, GenericRelation
 from .compat.meta import (get_all_related_objects,
                           get_all_related_m2m_objects_with_model,
                           get_compat_local_fields)
-from .compat.serializers import MultiModelInheritanceSerializer
+from .compat.serializers import MultiModelInheritanceSerializer, StreamingMultiModelInheritanceSerializer
+from .plan import RelationPlan, get_relation_plans
 
 
 logger = logging.getLogger(__name__)
@@ -121,14 +130,71 @@ class DeepCollector(object):
 
     # Allow to recursively collect other objects that have same type as root collected object.
     ALLOWS_SAME_TYPE_AS_ROOT_COLLECT = False
+    # Keys ((model, pk) tuples) of roots collected separately (e.g. by the other shards of a ShardedExport): they are
+    # not collected, but ForeignKeys referring to them are kept as well (see post_collect).
+    OTHER_ROOT_KEYS = frozenset()
 
     MAXIMUM_RELATED_INSTANCES = 50
     # We are settings related instances maximum size depending on the model
     MAXIMUM_RELATED_INSTANCES_PER_MODEL = {}
 
+    # Only register (model, pk) keys while collecting, instead of keeping every collected instance in memory.
+    # Collected objects are loaded again when they are asked for (get_collected_objects, serialization), model by
+    # model and by chunks of LOAD_CHUNK_SIZE objects, and post_collect is called on them at this time.
+    # BatchDeepCollector also only loads the columns it needs to follow relations while collecting.
+    KEYS_ONLY = False
+
+    # Fields that won't be loaded while collecting, by model (e.g. big TextField or BinaryField columns).
+    # They are loaded in bulk, by chunks of LOAD_CHUNK_SIZE objects, when collected objects are asked for.
+    # >>> DEFER_FIELDS = {'documents.document': ['body']}
+    DEFER_FIELDS = {}
+
+    LOAD_CHUNK_SIZE = 2000
+
+    # Spill the registries of collected objects and the objects left to collect to a SQLite database (see
+    # deep_collector.storage), only keeping the SPILL_CACHE_SIZE most recently used of them in memory, so that the
+    # memory used by a collect doesn't grow with the size of the graph. It requires KEYS_ONLY.
+    # SPILL_PATH is the database file, a temporary one (deleted with the collector) by default.
+    SPILL_TO_DISK = False
+    SPILL_PATH = None
+    SPILL_CACHE_SIZE = 10000
+
+    # File the collect state is saved to, every CHECKPOINT_INTERVAL seconds, so that an interrupted collect can be
+    # resumed from its last checkpoint (see resume).
+    CHECKPOINT_PATH = None
+    CHECKPOINT_INTERVAL = 60
+
+    # Limits on the whole collect: number of queries (Django 2.0+), duration (in seconds) and number of collected
+    # objects. Once one of them is reached, the collect stops, and objects (and relations) that haven't been explored
+    # are in the report.
+    MAX_QUERIES = None
+    MAX_DURATION = None
+    MAX_COLLECTED_OBJECTS = None
+
+    # Record queries (Django 2.0+), related objects and duration of every followed relation, by model and field.
+    # They are in the report, as 'hot_relations' (see get_hot_relations).
+    PROFILE = False
+
     # To be used if you want a detailed report on different collector steps.
     DEBUG = False
 
+    # Destinations of collector events (see deep_collector.events), on top of the DEBUG log.
+    # >>> EVENT_SINKS = [RingBufferSink(1000), JSONLinesSink(open('events.jsonl', 'w'))]
+    EVENT_SINKS = []
+    # Types of events that are emitted (None for every type of event).
+    EVENT_TYPES = None
+    # Only emit one event out of EVENT_SAMPLING events of every type.
+    EVENT_SAMPLING = 1
+
+    # Tell if there is any event sink, or a custom emit_event method: events are only built if there is one.
+    emits_events = False
+
+    # Relation plans by model, reset on every collect to take into account changes on exclusion parameters.
+    _relation_plans = None
+
+    # SQLite database registries are spilled to (SPILL_TO_DISK).
+    _storage = None
+
     def clean_by_fields(self, obj, fields, get_field_fn, exclude_list):
         """
         Function used to exclude defined fields from object collect.
@@ -155,16 +221,127 @@ class DeepCollector(object):
         return cleaned_list
 
     def get_report(self):
-        return {
+        report = {
             'excluded_fields': self.excluded_fields,
             'log': self.saved_log if self.DEBUG else "Set DEBUG to True to get collector internal logs",
         }
+        if self.DEBUG:
+            # Collected objects count, by 'app_label.model_name'.
+            report['collected_objects_history'] = dict(LabelKeyedView(self.collected_objs_history))
+        if self.PROFILE:
+            report['hot_relations'] = self.get_hot_relations()
+            # Queries made by the whole collect (Django 2.0+).
+            report['queries'] = self._queries_count
+        if self.truncated:
+            report['truncated'] = self.truncated
+            report['unexplored_objects'] = [
+                {'parent': get_key_from_instance(parent) if parent else None, 'object': get_key_from_instance(obj)}
+                for parent, obj in self.objects_to_collect
+            ]
+        if self.unexplored_relations:
+            report['unexplored_relations'] = self.unexplored_relations
+        return report
 
     def get_collected_objects(self):
+        if self.KEYS_ONLY or self._has_unloaded_objects or self.DEFER_FIELDS:
+            return list(self.iter_collected_objects())
         return self.collected_objs.values()
 
+    def iter_collected_objects(self):
+        """
+        Same as get_collected_objects, but objects that have to be loaded (KEYS_ONLY mode, objects collected before
+        resuming, DEFER_FIELDS) are loaded by chunks while they are iterated, instead of all at once.
+        :return: a generator, that can only be iterated once
+        """
+        if self.KEYS_ONLY or self._has_unloaded_objects:
+            return self._load_collected_objects()
+        if self.DEFER_FIELDS:
+            return self._load_deferred_fields()
+        return iter(self.collected_objs.values())
+
+    def _load_collected_objects(self):
+        """
+        Load collected objects from their registered keys (KEYS_ONLY mode, or objects collected before resuming),
+        with a single in_bulk query for every LOAD_CHUNK_SIZE objects of the same model. Objects deleted since they
+        have been collected are skipped.
+        """
+        for model, chunk in self._get_collected_chunks():
+            for obj in self._load_collected_chunk(model, chunk):
+                yield obj
+
+    def _load_collected_chunk(self, model, chunk):
+        """
+        :param chunk: (pk, collected object or None) tuples of objects of the given model
+        :return: collected objects, loaded with a single in_bulk query if they aren't
+        """
+        pks_to_load = [pk for pk, obj in chunk if obj is None]
+        objs = model._base_manager.in_bulk(pks_to_load) if pks_to_load else {}
+
+        loaded_objs = []
+        for pk, obj in chunk:
+            if obj is None and pk in objs:
+                obj = objs[pk]
+                self.post_collect(obj)
+            if obj is not None:
+                loaded_objs.append(obj)
+        return loaded_objs
+
+    def _get_collected_chunks(self):
+        """
+        :return: (model, [(pk, collected object or None), ...]) tuples, with at most LOAD_CHUNK_SIZE objects each,
+        model by model
+        """
+        if self.SPILL_TO_DISK:
+            # Registry is already sorted by model, and read page by page.
+            return self.collected_objs.iter_items_by_model(self.LOAD_CHUNK_SIZE)
+
+        items_by_model = OrderedDict()
+        for (model, pk), obj in self.collected_objs.items():
+            items_by_model.setdefault(model, []).append((pk, obj))
+
+        return [
+            (model, items[i:i + self.LOAD_CHUNK_SIZE])
+            for model, items in items_by_model.items()
+            for i in range(0, len(items), self.LOAD_CHUNK_SIZE)
+        ]
+
+    def _load_deferred_fields(self):
+        """
+        Load fields that have been deferred while collecting (DEFER_FIELDS), with a single query for every
+        LOAD_CHUNK_SIZE collected objects of the same model, instead of a query for every object and every field.
+        """
+        objs = list(self.collected_objs.values())
+
+        for i in range(0, len(objs), self.LOAD_CHUNK_SIZE):
+            chunk = objs[i:i + self.LOAD_CHUNK_SIZE]
+            self._load_deferred_chunk(chunk)
+
+            for obj in chunk:
+                yield obj
+
+    def _load_deferred_chunk(self, objs):
+        for (model, attnames), objs_by_pk in self._group_by_deferred_fields(objs).items():
+            rows = model._base_manager.filter(pk__in=list(objs_by_pk)).values_list('pk', *attnames)
+            for row in rows:
+                obj = objs_by_pk[row[0]]
+                for attname, value in zip(attnames, row[1:]):
+                    obj.__dict__[attname] = value
+
+    def _group_by_deferred_fields(self, objs):
+        """
+        :return: {primary key: object} dicts of objects having deferred fields, by (model, deferred attnames)
+        """
+        objs_by_deferred_fields = OrderedDict()
+        for obj in objs:
+            deferred_fields = obj.get_deferred_fields()
+            if deferred_fields:
+                key = (obj.__class__, tuple(sorted(deferred_fields)))
+                objs_by_deferred_fields.setdefault(key, {})[obj.pk] = obj
+
+        return objs_by_deferred_fields
+
     def get_json_serialized_objects(self):
-        objects = self.get_collected_objects()
+        objects = self.iter_collected_objects()
 
         string_buffer = StringIO()
 
@@ -178,25 +355,91 @@ class DeepCollector(object):
 
         return string_buffer
 
-    def emit_event(self, **kwargs):
+    def write_json_serialized_objects(self, stream, indent=None):
+        """
+        Same as get_json_serialized_objects, but serialized objects are directly written to the given stream (file,
+        socket, HTTP response, ...), instead of being kept in memory.
+        """
+        serializer = StreamingMultiModelInheritanceSerializer()
+        serializer.serialize(
+            self.iter_collected_objects(),
+            stream=stream,
+            indent=indent
+        )
+
+    def get_event_sinks(self):
+        from .events import ListSink
+
+        sinks = list(self.EVENT_SINKS)
         if self.DEBUG:
-            self.saved_log.append(kwargs)
+            sinks.append(ListSink(self.saved_log))
+        return sinks
+
+    def emit_event(self, **kwargs):
+        """
+        Send an event to every event sink. Callers have to check emits_events first, so that events are not even built
+        when nobody listens to them.
+        """
+        event_type = kwargs['type']
+        if self.EVENT_TYPES is not None and event_type not in self.EVENT_TYPES:
+            return
+
+        if self.EVENT_SAMPLING > 1:
+            count = self._events_count.get(event_type, 0)
+            self._events_count[event_type] = count + 1
+            if count % self.EVENT_SAMPLING:
+                return
+
+        for sink in self._event_sinks:
+            sink.emit(kwargs)
+
+    def _has_custom_emit_event(self):
+        """
+        :return: True if emit_event is overridden (other than by collectors of this package, which only defer events
+        until they are sent to sinks): the override expects events to be emitted even without any sink
+        """
+        emit_event = type(self).emit_event
+        # Unbound method in Python 2.x.
+        return getattr(emit_event, '__func__', emit_event) not in _sink_emit_events
+
+    def _emit_collect_history(self):
+        if self.emits_events:
+            # Collected objects count by model, once per collect instead of once per collected object.
+            self.emit_event(type='object_collect_history', objs=dict(LabelKeyedView(self.collected_objs_history)))
+
+    def get_collected_objects_by_key(self):
+        """
+        Collected objects, by their 'app_label.model_name.pk' keys.
+        Objects are registered by (model, pk) keys during the collect, string keys are only built here.
+        In KEYS_ONLY mode, objects are not kept, so values are None.
+        """
+        return LabelKeyedView(self.collected_objs)
 
     def _is_already_collected(self, parent, obj):
-        new_key = get_key_from_instance(obj)
-        is_already_collected = new_key in self.collected_objs
+        is_already_collected = (obj.__class__, obj.pk) in self.collected_objs
 
         if is_already_collected:
-            self.emit_event(type='already_collected', obj=obj, parent=parent)
+            if self.emits_events:
+                self.emit_event(type='already_collected', obj=obj, parent=parent)
 
         return is_already_collected
 
+    def _is_excluded_pk(self, model, pk):
+        """
+        Same as is_excluded_from_collect, but from the model and the primary key of an object we haven't loaded yet.
+        It allows us not to load objects that won't be collected anyway.
+        """
+        return (model, pk) in self.collected_objs \
+            or get_model_label(model) in self.EXCLUDE_MODELS \
+            or (not self.ALLOWS_SAME_TYPE_AS_ROOT_COLLECT
+                and model in self._root_models and (model, pk) not in self._roots)
+
     def _is_excluded_model(self, obj):
-        obj_model = get_model_from_instance(obj)
-        is_excluded_model = obj_model in self.EXCLUDE_MODELS
+        is_excluded_model = get_model_label(obj.__class__) in self.EXCLUDE_MODELS
 
         if is_excluded_model:
-            self.emit_event(type='exluded_model', obj=obj)
+            if self.emits_events:
+                self.emit_event(type='exluded_model', obj=obj)
 
         return is_excluded_model
 
@@ -207,12 +450,12 @@ class DeepCollector(object):
         maybe collect a new tree, that will...
         """
         if not self.ALLOWS_SAME_TYPE_AS_ROOT_COLLECT:
-            obj_model = get_model_from_instance(obj)
-            obj_key = get_key_from_instance(obj)
-            is_same_type_as_root = obj_model == self.root_obj_model and obj_key != self.root_obj_key
+            model = obj.__class__
+            is_same_type_as_root = model in self._root_models and (model, obj.pk) not in self._roots
 
             if is_same_type_as_root:
-                self.emit_event(type='same_type_as_root', obj=obj)
+                if self.emits_events:
+                    self.emit_event(type='same_type_as_root', obj=obj)
 
             return is_same_type_as_root
         else:
@@ -227,34 +470,174 @@ class DeepCollector(object):
         return is_excluded_from_collect
 
     def add_to_collected_object(self, parent, obj):
-        new_key = get_key_from_instance(obj)
+        model = obj.__class__
+        key = (model, obj.pk)
+        self.collected_objs[key] = None if self.KEYS_ONLY else obj
+
+        # Every object belongs to the root it has been collected from (the first one, if several roots lead to it).
+        if parent is None or key in self._roots:
+            self.collected_objs_roots[key] = key
+        else:
+            self.collected_objs_roots[key] = self.collected_objs_roots[(parent.__class__, parent.pk)]
 
-        self.collected_objs[new_key] = obj
+        if self.emits_events:
+            self.emit_event(type='object_collected', obj=obj, parent=parent)
 
-        self.emit_event(type='object_collected', obj=obj, parent=parent)
+        if self._collected_step_objs is not None:
+            self._collected_step_objs.append(obj)
 
-        model = get_model_from_instance(obj)
         if model in self.collected_objs_history:
             self.collected_objs_history[model] += 1
         else:
             self.collected_objs_history[model] = 1
 
-        self.emit_event(type='object_collect_history', objs=self.collected_objs_history)
-
-    def collect(self, root_obj):
+    def _reset_collect_state(self, root_objs):
         # Resetting collected_objs if several collects are called.
-        self.objects_to_collect = [(None, root_obj)]
-        self.collected_objs = {}
+        # Objects are registered by (model, pk), and collected_objs_history is counting them by model.
+        # collected_objs_roots is giving the key of the root every collected object belongs to.
+        if self._storage is not None:
+            self._storage.close()
+            self._storage = None
+        if self.SPILL_TO_DISK:
+            if not self.KEYS_ONLY:
+                raise ImproperlyConfigured('SPILL_TO_DISK requires KEYS_ONLY')
+            from .storage import DiskStorage
+
+            self._storage = DiskStorage(self.SPILL_PATH, self.SPILL_CACHE_SIZE)
+            self.collected_objs = self._storage.get_registry('collected_objs')
+            self.collected_objs_roots = self._storage.get_registry('collected_objs_roots')
+        else:
+            self.collected_objs = {}
+            self.collected_objs_roots = {}
         self.collected_objs_history = {}
+        self.objects_to_collect = self.get_frontier((None, root_obj) for root_obj in root_objs)
+
+        self.root_objs = root_objs
+        self._roots = OrderedDict(((root_obj.__class__, root_obj.pk), root_obj) for root_obj in root_objs)
+        self._root_models = set(model for model, _ in self._roots)
+        self._roots_by_field = {}
 
-        self.root_obj = root_obj
-        self.root_obj_key = get_key_from_instance(root_obj)
-        self.root_obj_model = get_model_from_instance(root_obj)
+        # Kept for backward compatibility, when there is a single root.
+        self.root_obj = root_objs[0] if root_objs else None
+        self.root_obj_key = get_key_from_instance(self.root_obj)
+        self.root_obj_model = get_model_from_instance(self.root_obj)
 
         self.excluded_fields = []
         self.saved_log = []
 
-        while self.objects_to_collect:
+        self._event_sinks = self.get_event_sinks()
+        self._events_count = {}
+        self.emits_events = bool(self._event_sinks) or self._has_custom_emit_event()
+
+        self._has_unloaded_objects = False
+        self._last_checkpoint = time.time()
+
+        self.truncated = None
+        self.unexplored_relations = []
+        self._collect_started_at = time.time()
+        self._queries_count = 0
+        self._queries_lock = threading.Lock()
+        self._relations_profile = OrderedDict()
+        self._profiled_relation = threading.local()
+
+        self._relation_plans = None
+        self._content_type_models = {}
+
+        # Objects collected during the current step of the collect (see _iter_collect_steps).
+        self._collected_step_objs = None
+
+    def collect(self, root_obj):
+        self.collect_many([root_obj])
+
+    def collect_many(self, root_objs):
+        """
+        Collect objects related to several root objects at once. Objects related to several roots are only collected
+        (and queried) once, and belong to the first root leading to them (see get_root).
+        Objects having the same type as one of the roots are not collected (unless ALLOWS_SAME_TYPE_AS_ROOT_COLLECT
+        is set), except given roots themselves.
+        """
+        self._start_collect(root_objs)
+        self._collect_objects_to_collect()
+
+    def iter_collect(self, root_obj):
+        return self.iter_collect_many([root_obj])
+
+    def iter_collect_many(self, root_objs):
+        """
+        Same as collect_many, yielding collected objects while collecting them, the way get_collected_objects would
+        (see iter_collect_batches).
+        """
+        for _, objs in self.iter_collect_batches(root_objs):
+            for obj in objs:
+                yield obj
+
+    def iter_collect_batches(self, root_objs):
+        """
+        Same as collect_many, yielding objects collected by every step of the collect (LOAD_CHUNK_SIZE objects for
+        DeepCollector, a level for BatchDeepCollector), grouped by model, so that they can be serialized (or uploaded,
+        or transformed) while the collect goes on. In KEYS_ONLY mode, objects are loaded by chunks before being
+        yielded, and the collector doesn't keep them: they can be released as soon as they have been consumed.
+        Collected objects are still registered, so get_collected_objects still works once the collect is done.
+        :return: a generator of (model, collected objects) tuples, with at most LOAD_CHUNK_SIZE objects each
+        """
+        self._start_collect(root_objs)
+
+        for step_objs in self._iter_collect_steps():
+            objs_by_model = OrderedDict()
+            for obj in step_objs:
+                objs_by_model.setdefault(obj.__class__, []).append(obj)
+
+            for model, objs in objs_by_model.items():
+                for i in range(0, len(objs), self.LOAD_CHUNK_SIZE):
+                    chunk = objs[i:i + self.LOAD_CHUNK_SIZE]
+                    if self.KEYS_ONLY:
+                        chunk = self._load_collected_chunk(model, [(obj.pk, None) for obj in chunk])
+                    elif self.DEFER_FIELDS:
+                        self._load_deferred_chunk(chunk)
+                    yield model, chunk
+
+    def _start_collect(self, root_objs):
+        self._reset_collect_state(list(root_objs))
+        # Objects to collect are popped from the end: roots are collected in given order.
+        self.objects_to_collect.reverse()
+
+    def get_frontier(self, items):
+        """
+        Container of (parent, object) tuples left to collect, used as a stack: a list, or a stack spilled to disk
+        (SPILL_TO_DISK).
+        """
+        if self.SPILL_TO_DISK:
+            return self._storage.get_stack('objects_to_collect', items)
+        return list(items)
+
+    def _collect_objects_to_collect(self):
+        for _ in self._iter_collect_steps():
+            pass
+
+    def _iter_collect_steps(self):
+        """
+        Collect objects left to collect, one step at a time.
+        Objects left to collect when a limit is reached are kept, so that the collect can still be resumed.
+        :return: a generator of the lists of objects collected by every step
+        """
+        while self.objects_to_collect and not self.is_over_limits():
+            self._collected_step_objs = []
+            # Queries made by the consumer between steps are not counted.
+            with self.count_queries():
+                self._collect_step()
+            step_objs, self._collected_step_objs = self._collected_step_objs, None
+            yield step_objs
+
+        self._emit_collect_history()
+        if self.CHECKPOINT_PATH:
+            self.checkpoint()
+
+    def _collect_step(self):
+        # Objects are collected one by one, LOAD_CHUNK_SIZE of them by step.
+        while self.objects_to_collect and not self.is_over_limits() \
+                and len(self._collected_step_objs) < self.LOAD_CHUNK_SIZE:
+            self._checkpoint_if_needed()
+
             parent, obj = self.objects_to_collect.pop()
             children = self._collect(parent, obj)
 
@@ -263,8 +646,216 @@ class DeepCollector(object):
                 if child:
                     tmp_objects_to_collect.append((obj, child))
                 else:
-                    self.emit_event(type='child_none', obj=obj, parent=parent)
-            self.objects_to_collect += tmp_objects_to_collect
+                    if self.emits_events:
+                        self.emit_event(type='child_none', obj=obj, parent=parent)
+            self.objects_to_collect.extend(tmp_objects_to_collect)
+
+    @contextmanager
+    def count_queries(self):
+        """
+        Count queries made on every database connection of the current thread (if MAX_QUERIES or PROFILE is set).
+        Queries made while following a relation are also counted for this relation.
+        """
+        if self.MAX_QUERIES is None and not self.PROFILE:
+            yield
+            return
+
+        wrapped_connections = list(connections.all())
+        if any(not hasattr(connection, 'execute_wrapper') for connection in wrapped_connections):
+            if self.MAX_QUERIES is not None:
+                raise ImproperlyConfigured('MAX_QUERIES requires Django 2.0+')
+            # Profiles just don't have any query count.
+            yield
+            return
+
+        def count_query(execute, sql, params, many, context):
+            with self._queries_lock:
+                self._queries_count += 1
+            stats = getattr(self._profiled_relation, 'stats', None)
+            if stats is not None:
+                stats['queries'] += 1
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in wrapped_connections:
+                stack.enter_context(connection.execute_wrapper(count_query))
+            yield
+
+    def is_over_limits(self):
+        """
+        Tell if one of the collect limits (MAX_QUERIES, MAX_DURATION, MAX_COLLECTED_OBJECTS) has been reached. The
+        first time it happens, the reason is saved in the report.
+        """
+        if self.truncated:
+            return True
+
+        duration = time.time() - self._collect_started_at
+        if self.MAX_QUERIES is not None and self._queries_count >= self.MAX_QUERIES:
+            reason = 'max_queries'
+        elif self.MAX_DURATION is not None and duration >= self.MAX_DURATION:
+            reason = 'max_duration'
+        elif self.MAX_COLLECTED_OBJECTS is not None and len(self.collected_objs) >= self.MAX_COLLECTED_OBJECTS:
+            reason = 'max_collected_objects'
+        else:
+            return False
+
+        self.truncated = {
+            'reason': reason,
+            'queries': self._queries_count,
+            'duration': duration,
+            'collected_objects': len(self.collected_objs),
+        }
+        logger.warning('Collect truncated (%(reason)s): %(collected_objects)s objects collected with %(queries)s '
+                       'queries in %(duration).1fs', self.truncated)
+        return True
+
+    def add_unexplored_relation(self, objs, field):
+        """
+        Register a relation that hasn't been queried for given objects, because a collect limit has been reached (or
+        because the relation couldn't be queried, see BatchDeepCollector.skip_failed_relation).
+        """
+        field_name = get_field_name(field)
+        for obj in objs:
+            self.unexplored_relations.append({'object': get_key_from_instance(obj), 'field': field_name})
+
+    def profile_relation(self, obj, field, method, *args):
+        """
+        Call method, following given relation of given object (or objects of its model), and record its queries, the
+        number of related objects it returns and its duration if PROFILE is set.
+        :return: the result of method
+        """
+        if not self.PROFILE:
+            return method(*args)
+
+        stats = {'queries': 0}
+        previous_stats = getattr(self._profiled_relation, 'stats', None)
+        self._profiled_relation.stats = stats
+        start = time.time()
+        try:
+            result = method(*args)
+        finally:
+            self._profiled_relation.stats = previous_stats
+        duration = time.time() - start
+
+        key = (obj.__class__, get_field_name(field))
+        with self._queries_lock:
+            profile = self._relations_profile.get(key)
+            if profile is None:
+                profile = self._relations_profile[key] = {'calls': 0, 'queries': 0, 'instances': 0, 'duration': 0.0}
+            profile['calls'] += 1
+            profile['queries'] += stats['queries']
+            profile['instances'] += len(result)
+            profile['duration'] += duration
+
+        return result
+
+    def get_hot_relations(self, order_by='duration'):
+        """
+        Profile of every followed relation (PROFILE): how many times it has been followed ('calls'), its 'queries',
+        the number of related objects found ('instances'), and its total 'duration' (in seconds).
+        :param order_by: the column relations are sorted by, in decreasing order
+        :return: a list of dicts, with 'model' and 'field' keys
+        """
+        hot_relations = [
+            dict(profile, model=get_model_label(model), field=field_name)
+            for (model, field_name), profile in self._relations_profile.items()
+        ]
+        return sorted(hot_relations, key=lambda relation: relation[order_by], reverse=True)
+
+    def _checkpoint_if_needed(self):
+        if self.CHECKPOINT_PATH and time.time() - self._last_checkpoint >= self.CHECKPOINT_INTERVAL:
+            self.checkpoint()
+
+    def checkpoint(self, path=None):
+        """
+        Save the current collect state (objects to collect, collected objects keys and history, excluded fields,
+        unexplored relations) to the given path (CHECKPOINT_PATH by default).
+        """
+        from .checkpoint import dump_key, write_checkpoint
+
+        root_indexes = dict((key, index) for index, key in enumerate(self._roots))
+        write_checkpoint(path or self.CHECKPOINT_PATH, {
+            'collector': self.__class__.__module__ + '.' + self.__class__.__name__,
+            'roots': [dump_key(key) for key in self._roots],
+            'objects_to_collect': [
+                [dump_key(get_registry_key(parent)), dump_key(get_registry_key(obj))]
+                for parent, obj in self.objects_to_collect
+            ],
+            'collected_objs': [
+                dump_key(key) + [root_indexes[self.collected_objs_roots[key]]]
+                for key in self.collected_objs
+            ],
+            'collected_objs_history': dict(LabelKeyedView(self.collected_objs_history)),
+            'excluded_fields': self.excluded_fields,
+            'unexplored_relations': self.unexplored_relations,
+        })
+        self._last_checkpoint = time.time()
+
+    def resume(self, path=None):
+        """
+        Resume a collect from its last checkpoint (saved to the given path, CHECKPOINT_PATH by default).
+        Objects collected before the checkpoint are not queried again (they are loaded again when collected objects are
+        asked for), and only objects that were still to collect are loaded again before continuing the collect.
+        """
+        from .checkpoint import load_key, read_checkpoint
+
+        state = read_checkpoint(path or self.CHECKPOINT_PATH)
+
+        root_keys = [load_key(value) for value in state['roots']]
+        roots_by_key = self._load_objects_by_keys(root_keys)
+        self._reset_collect_state([roots_by_key[key] for key in root_keys if key in roots_by_key])
+
+        for value in state['collected_objs']:
+            key = load_key(value[:2])
+            self.collected_objs[key] = None
+            self.collected_objs_roots[key] = root_keys[value[2]]
+        self._has_unloaded_objects = bool(self.collected_objs)
+
+        self.collected_objs_history = dict(
+            (apps.get_model(label), count) for label, count in state['collected_objs_history'].items())
+        self.excluded_fields = state['excluded_fields']
+
+        # Objects that were still to collect are loaded again. Parents are only needed for their keys.
+        keys_to_collect = [(load_key(parent), load_key(obj)) for parent, obj in state['objects_to_collect']]
+        objs_by_key = self._load_objects_by_keys([key for _, key in keys_to_collect],
+                                                 queryset_fn=self.get_traversal_queryset)
+        self.objects_to_collect = self.get_frontier(
+            (parent_key[0](pk=parent_key[1]) if parent_key else None, objs_by_key[key])
+            for parent_key, key in keys_to_collect
+            if key in objs_by_key
+        )
+        self._resume_unexplored_relations(state['unexplored_relations'])
+
+        self._collect_objects_to_collect()
+
+    def _resume_unexplored_relations(self, relations):
+        """
+        Relations of collected objects that haven't been queried before the checkpoint (see add_unexplored_relation).
+        Objects are collected with every relation at once here, so they are just reported again.
+        """
+        self.unexplored_relations = relations
+
+    def _load_objects_by_keys(self, keys, queryset_fn=None):
+        """
+        Load objects from their (model, pk) keys, with a single query for every LOAD_CHUNK_SIZE objects of the same
+        model.
+        :return: a {key: object} dict
+        """
+        pks_by_model = OrderedDict()
+        for model, pk in keys:
+            pks_by_model.setdefault(model, set()).add(pk)
+
+        objs_by_key = {}
+        for model, pks in pks_by_model.items():
+            pks = list(pks)
+            queryset = model._base_manager.all()
+            if queryset_fn is not None:
+                queryset = queryset_fn(queryset)
+            for i in range(0, len(pks), self.LOAD_CHUNK_SIZE):
+                for pk, obj in queryset.in_bulk(pks[i:i + self.LOAD_CHUNK_SIZE]).items():
+                    objs_by_key[(model, pk)] = obj
+
+        return objs_by_key
 
     def filter_by_threshold(self, objects, current_instance, field_name):
         """
@@ -283,13 +874,87 @@ class DeepCollector(object):
         related_model_name = get_model_from_instance(object_example)
         max_count = self.get_maximum_allowed_instances_for_model(related_model_name)
         if objs_count > max_count:
-            self.emit_event(type='too_many_related_objects', obj=current_instance, related_model=related_model_name)
-            self.add_excluded_field(get_key_from_instance(current_instance), field_name,
-                                    related_model_name, objs_count, max_count)
+            self._exclude_too_many_related_objects(current_instance, field_name, related_model_name,
+                                                   objs_count, max_count)
             return []
 
         return objects
 
+    def fetch_within_threshold(self, queryset, current_instance, field_name):
+        """
+        Same as filter_by_threshold, but without loading every related object if there are too many of them.
+        We fetch at most max_count + 1 related objects, and if we are over the threshold, related objects are counted
+        (to be reported). When some related objects may be skipped (already collected, or excluded), we first fetch
+        their primary keys instead, so that we only load the ones we are going to collect.
+        :param queryset: The queryset returning related objects of the current instance
+        :param current_instance: The current collected instance
+        :param field_name: The current field name
+        :return: related objects, or an empty list if there are too many of them
+        """
+        related_model_name = get_model_from_instance(queryset)
+        max_count = self.get_maximum_allowed_instances_for_model(related_model_name)
+
+        if not self._may_exclude_pks(queryset.model):
+            objs = list(self.get_traversal_queryset(queryset)[:max_count + 1])
+            if len(objs) > max_count:
+                self._exclude_too_many_related_objects(current_instance, field_name, related_model_name,
+                                                       queryset.count(), max_count)
+                return []
+            return objs
+
+        pks = list(queryset.values_list('pk', flat=True)[:max_count + 1])
+        if not pks:
+            return []
+
+        if len(pks) > max_count:
+            self._exclude_too_many_related_objects(current_instance, field_name, related_model_name,
+                                                   queryset.count(), max_count)
+            return []
+
+        pks = self._get_pks_to_fetch(queryset.model, pks)
+        if not pks:
+            return []
+
+        return list(self.get_traversal_queryset(queryset.filter(pk__in=pks)))
+
+    def _may_exclude_pks(self, model):
+        """
+        Tell if _is_excluded_pk may be true for some objects of given model: none of them is excluded as long as none of
+        them has been collected, unless the whole model is excluded or is a root model.
+        """
+        return model in self.collected_objs_history \
+            or get_model_label(model) in self.EXCLUDE_MODELS \
+            or (not self.ALLOWS_SAME_TYPE_AS_ROOT_COLLECT and model in self._root_models)
+
+    def _get_pks_to_fetch(self, model, pks):
+        # Objects that have already been collected (or excluded) won't be collected, there is no need to load them.
+        return [pk for pk in pks if not self._is_excluded_pk(model, pk)]
+
+    def get_traversal_queryset(self, queryset, *fields):
+        """
+        Restrict columns loaded by a query made while collecting: in KEYS_ONLY mode, we only load the columns we
+        need to follow relations of queryset model (and given fields). Otherwise, DEFER_FIELDS of this model are
+        deferred.
+        """
+        if self.KEYS_ONLY:
+            return queryset.only(*(self.get_relation_plan(queryset.model).get_traversal_fields() + list(fields)))
+
+        deferred_fields = self.DEFER_FIELDS.get(get_model_label(queryset.model))
+        if deferred_fields:
+            # Columns we need to follow relations are never deferred.
+            needed_fields = set(self.get_relation_plan(queryset.model).get_traversal_fields()) | set(fields)
+            meta = queryset.model._meta
+            return queryset.defer(*[name for name in deferred_fields
+                                    if meta.get_field(name).attname not in needed_fields])
+
+        return queryset
+
+    def _exclude_too_many_related_objects(self, current_instance, field_name, related_model_name, count, max_count):
+        if self.emits_events:
+            self.emit_event(type='too_many_related_objects', obj=current_instance, related_model=related_model_name)
+        self.add_excluded_field(get_key_from_instance(current_instance), field_name,
+                                related_model_name, count, max_count)
+
     def add_excluded_field(self, parent_instance_key, field_name, related_model_name, count, max_count):
         self.excluded_fields.append({
             'parent_instance': parent_instance_key,
@@ -311,7 +976,8 @@ class DeepCollector(object):
         # Related objects are fields defined in other models that can refer to current model
         related_objs = self.get_related_objs(obj)
 
-        self.post_collect(obj)
+        if not self.KEYS_ONLY:
+            self.post_collect(obj)
         return local_objs + related_objs
 
     def pre_collect(self, obj):
@@ -332,32 +998,102 @@ class DeepCollector(object):
 
         After collection:
         user1 -> modelA -> user1
+
+        With several roots (collect_many), ForeignKeys referring to any of the roots (or of OTHER_ROOT_KEYS) are kept.
+        Other ones are set to the root model "A" belongs to (or to the first root of the referred model, if it is not
+        the same model).
         """
         if not self.ALLOWS_SAME_TYPE_AS_ROOT_COLLECT:
-            for field in self.get_local_fields(obj):
-                if isinstance(field, ForeignKey) and not field.unique:
-                    # Relative field's API has been changed Django 2.0
-                    # See https://docs.djangoproject.com/en/2.0/releases/1.9/#field-rel-changes for details
-                    if django.VERSION[0] >= 2:
-                        remote_model = field.remote_field.model
-                    else:
-                        remote_model = field.rel.to
-                    if isinstance(self.root_obj, remote_model):
-                        setattr(obj, field.name, self.root_obj)
+            for field in self.get_relation_plan(obj).foreign_keys:
+                if not field.unique:
+                    roots = self._get_roots_referred_to_by(field)
+                    value = getattr(obj, field.attname)
+                    if roots and value not in roots and not self._is_other_root_value(field, value):
+                        root = self.get_root(obj)
+                        if roots.get(getattr(root, field.target_field.attname, None)) is not root:
+                            root = next(iter(roots.values()))
+                        setattr(obj, field.name, root)
+
+    def _is_other_root_value(self, field, value):
+        return bool(self.OTHER_ROOT_KEYS) and field.target_field.primary_key \
+            and (field.related_model, value) in self.OTHER_ROOT_KEYS
+
+    def _get_roots_referred_to_by(self, field):
+        """
+        Roots the given ForeignKey can refer to, by their referred field value.
+        """
+        if field not in self._roots_by_field:
+            # Relative field's API has been changed Django 2.0
+            # See https://docs.djangoproject.com/en/2.0/releases/1.9/#field-rel-changes for details
+            if django.VERSION[0] >= 2:
+                remote_model = field.remote_field.model
+            else:
+                remote_model = field.rel.to
+            self._roots_by_field[field] = OrderedDict(
+                (getattr(root_obj, field.target_field.attname), root_obj)
+                for root_obj in self._roots.values()
+                if isinstance(root_obj, remote_model)
+            )
 
-    def get_local_fields(self, obj):
+        return self._roots_by_field[field]
+
+    def get_root(self, obj):
+        """
+        Get the root object given collected object belongs to.
+        """
+        return self._roots[self.collected_objs_roots[(obj.__class__, obj.pk)]]
+
+    def get_collected_objects_by_root(self):
+        """
+        Collected objects, grouped by the root object they belong to.
+        :return: a list of (root object, collected objects) tuples, in roots order
+        """
+        objs_by_root = OrderedDict((key, []) for key in self._roots)
+        for obj in self.iter_collected_objects():
+            objs_by_root[self.collected_objs_roots[(obj.__class__, obj.pk)]].append(obj)
+
+        return [(self._roots[key], objs) for key, objs in objs_by_root.items()]
+
+    def get_relation_plan(self, obj):
+        """
+        Get every relation we are following from given object (or model class).
+        Fields and accessors only depend on the model and on exclusion parameters, so they are computed once per model
+        and shared between objects, collects and collectors of the same class.
+        :return: a RelationPlan instance
+        """
+        if self._relation_plans is None:
+            self._relation_plans = get_relation_plans(self)
+
+        model = obj if isinstance(obj, type) else obj.__class__
+        try:
+            return self._relation_plans[model]
+        except KeyError:
+            plan = self._relation_plans[model] = self.build_relation_plan(obj)
+            return plan
+
+    def build_relation_plan(self, obj):
         # Use the concrete parent class' _meta instead of the object's _meta
         # This is to avoid local_fields problems for proxy models. Refs #17717.
         concrete_model = obj._meta.concrete_model
-        return self.clean_by_fields(obj, get_compat_local_fields(concrete_model),
-                          lambda x: x.name, self.EXCLUDE_DIRECT_FIELDS)
+        model = obj if isinstance(obj, type) else obj.__class__
+
+        return RelationPlan(
+            model,
+            local_fields=self.clean_by_fields(obj, get_compat_local_fields(concrete_model),
+                                              lambda x: x.name, self.EXCLUDE_DIRECT_FIELDS),
+            m2m_fields=self.clean_by_fields(obj, concrete_model._meta.local_many_to_many,
+                                            lambda x: x.name, self.EXCLUDE_DIRECT_FIELDS),
+            related_fields=self.clean_by_fields(obj, get_all_related_objects(obj),
+                                                lambda x: x.get_accessor_name(), self.EXCLUDE_RELATED_FIELDS),
+            related_m2m_fields=self.clean_by_fields(obj, get_all_related_m2m_objects_with_model(obj),
+                                                    lambda x: x[0].get_accessor_name(), self.EXCLUDE_RELATED_FIELDS),
+        )
+
+    def get_local_fields(self, obj):
+        return self.get_relation_plan(obj).local_fields
 
     def get_local_m2m_fields(self, obj):
-        # Use the concrete parent class' _meta instead of the object's _meta
-        # This is to avoid local_fields problems for proxy models. Refs #17717.
-        concrete_model = obj._meta.concrete_model
-        return self.clean_by_fields(obj, concrete_model._meta.local_many_to_many,
-                          lambda x: x.name, self.EXCLUDE_DIRECT_FIELDS)
+        return self.get_relation_plan(obj).m2m_fields
 
     def get_maximum_allowed_instances_for_model(self, model):
         if model in self.MAXIMUM_RELATED_INSTANCES_PER_MODEL:
@@ -369,53 +1105,143 @@ class DeepCollector(object):
         local_objs = []
 
         for field in self.get_local_fields(obj):
-            if isinstance(field, ForeignKey) or isinstance(field, GenericForeignKey):
-                self.emit_event(type='local_field', obj=obj, field=field)
-                try:
-                    instance = getattr(obj, field.name)
-                    if instance:
-                        self.emit_event(type='local_field_w_instance', obj=obj, field=field)
-                        local_objs.append(instance)
-                    else:
-                        self.emit_event(type='local_field_wo_instance', obj=obj, field=field)
-                except Exception as e:
-                    self.emit_event(type='local_field_no_instance', obj=obj, field=field)
+            if isinstance(field, ForeignKey):
+                if self.emits_events:
+                    self.emit_event(type='local_field', obj=obj, field=field)
+                local_objs += self.profile_relation(obj, field, self.get_foreign_key_objs, obj, field)
+            elif isinstance(field, GenericForeignKey):
+                if self.emits_events:
+                    self.emit_event(type='local_field', obj=obj, field=field)
+                local_objs += self.profile_relation(obj, field, self.get_generic_foreign_key_objs, obj, field)
             elif isinstance(field, GenericRelation):
-                self.emit_event(type='local_reverse_generic_field', obj=obj, field=field)
+                if self.emits_events:
+                    self.emit_event(type='local_reverse_generic_field', obj=obj, field=field)
                 generic_manager = getattr(obj, field.name)
-                local_objs += self.filter_by_threshold(generic_manager.all(), obj, field.name)
+                local_objs += self.profile_relation(obj, field, self.fetch_within_threshold, generic_manager.all(), obj,
+                                                    field.name)
 
         for field in self.get_local_m2m_fields(obj):
-            self.emit_event(type='local_m2m_field', obj=obj, field=field)
+            if self.emits_events:
+                self.emit_event(type='local_m2m_field', obj=obj, field=field)
             m2m_manager = getattr(obj, field.name)
-            objs_count = m2m_manager.count()
+            m2m_objs = self.profile_relation(obj, field, self.fetch_within_threshold, m2m_manager.all(), obj,
+                                             field.name)
 
-            if not objs_count:
-                self.emit_event(type='local_m2m_field_wo_instance', obj=obj, field=field)
+            if not m2m_objs:
+                if self.emits_events:
+                    self.emit_event(type='local_m2m_field_wo_instance', obj=obj, field=field)
             else:
-                self.emit_event(type='local_m2m_field_w_instance', obj=obj, field=field, number=objs_count)
-                local_objs += self.filter_by_threshold(m2m_manager.all(), obj, field.name)
+                if self.emits_events:
+                    self.emit_event(type='local_m2m_field_w_instance', obj=obj, field=field, number=len(m2m_objs))
+                local_objs += m2m_objs
 
         return local_objs
 
+    def get_foreign_key_objs(self, obj, field):
+        value = getattr(obj, field.attname)
+        if value is None:
+            if self.emits_events:
+                self.emit_event(type='local_field_wo_instance', obj=obj, field=field)
+            return []
+
+        # We don't need to query objects that won't be collected anyway.
+        if field.target_field.primary_key and self._is_excluded_pk(field.related_model, value):
+            if self.emits_events:
+                self.emit_event(type='local_field_excluded_instance', obj=obj, field=field)
+            return []
+
+        try:
+            instance = getattr(obj, field.name)
+        except ObjectDoesNotExist:
+            # Invalid foreign key, referring to an object that doesn't exist anymore.
+            if self.emits_events:
+                self.emit_event(type='local_field_no_instance', obj=obj, field=field)
+            return []
+
+        if self.emits_events:
+            self.emit_event(type='local_field_w_instance', obj=obj, field=field)
+        return [instance]
+
+    def get_generic_foreign_key_objs(self, obj, field):
+        related_model, pk = self.get_generic_foreign_key_value(obj, field)
+        if related_model is None:
+            return []
+
+        # We don't need to query objects that won't be collected anyway.
+        if self._is_excluded_pk(related_model, pk):
+            if self.emits_events:
+                self.emit_event(type='local_field_excluded_instance', obj=obj, field=field)
+            return []
+
+        # Same broad behaviour as before: GenericForeignKey can refer to anything.
+        try:
+            instance = getattr(obj, field.name)
+        except Exception:
+            instance = None
+
+        if not instance:
+            if self.emits_events:
+                self.emit_event(type='local_field_no_instance', obj=obj, field=field)
+            return []
+
+        if self.emits_events:
+            self.emit_event(type='local_field_w_instance', obj=obj, field=field)
+        return [instance]
+
+    def get_generic_foreign_key_value(self, obj, field):
+        """
+        Get the model and the primary key of the object referred to by a GenericForeignKey, without loading it.
+        :return: a (model, pk) tuple, or (None, None) if there isn't any valid referred object
+        """
+        content_type_id = getattr(obj, obj._meta.get_field(field.ct_field).attname)
+        object_id = getattr(obj, field.fk_field)
+        if content_type_id is None or object_id is None:
+            if self.emits_events:
+                self.emit_event(type='local_field_wo_instance', obj=obj, field=field)
+            return None, None
+
+        related_model = self.get_model_from_content_type_id(content_type_id, obj._state.db)
+        try:
+            return related_model, related_model._meta.pk.to_python(object_id)
+        except Exception:
+            # Either the content type, or the object id, is not valid.
+            if self.emits_events:
+                self.emit_event(type='local_field_no_instance', obj=obj, field=field)
+            return None, None
+
+    def get_model_from_content_type_id(self, content_type_id, using):
+        """
+        Content types are cached during the whole collect, so we are only querying them once.
+        :return: the model class, or None if the content type (or its model) doesn't exist anymore
+        """
+        try:
+            return self._content_type_models[content_type_id]
+        except KeyError:
+            try:
+                model = ContentType.objects.db_manager(using).get_for_id(content_type_id).model_class()
+            except ContentType.DoesNotExist:
+                model = None
+            self._content_type_models[content_type_id] = model
+            return model
+
     def get_related_fields(self, obj):
-        return self.clean_by_fields(obj, get_all_related_objects(obj),
-                          lambda x: x.get_accessor_name(), self.EXCLUDE_RELATED_FIELDS)
+        return self.get_relation_plan(obj).related_fields
 
     def get_related_m2m_fields(self, obj):
-        return self.clean_by_fields(obj, get_all_related_m2m_objects_with_model(obj),
-                          lambda x:x[0].get_accessor_name(), self.EXCLUDE_RELATED_FIELDS)
+        return self.get_relation_plan(obj).related_m2m_fields
 
     def get_related_objs(self, obj):
         related_objs = []
 
         for related_field in self.get_related_fields(obj):
-            self.emit_event(type='related_field', obj=obj, field=related_field)
-            related_objs += self.query_related_objects(related_field, [obj])
+            if self.emits_events:
+                self.emit_event(type='related_field', obj=obj, field=related_field)
+            related_objs += self.profile_relation(obj, related_field, self.query_related_objects, related_field, [obj])
 
         for related_field, _ in self.get_related_m2m_fields(obj):
-            self.emit_event(type='related_m2m_field', obj=obj, field=related_field)
-            related_objs += self.query_related_objects(related_field, [obj])
+            if self.emits_events:
+                self.emit_event(type='related_m2m_field', obj=obj, field=related_field)
+            related_objs += self.profile_relation(obj, related_field, self.query_related_objects, related_field, [obj])
 
         return related_objs
 
@@ -428,34 +1254,55 @@ class DeepCollector(object):
             if isinstance(related.field, OneToOneField):
                 related_objs = [related_obj_or_manager]
             else:
-                related_objs = list(related_obj_or_manager.all())
+                related_objs = self.fetch_within_threshold(related_obj_or_manager.all(), objs[0],
+                                                           related.get_accessor_name())
         # TODO: make this exception less broad
         except Exception:
-            self.emit_event(type='error_related_object', obj=objs[0], field=related)
+            if self.emits_events:
+                self.emit_event(type='error_related_object', obj=objs[0], field=related)
 
         if not related_objs:
-            self.emit_event(type='no_related_object', obj=objs[0], field=related)
+            if self.emits_events:
+                self.emit_event(type='no_related_object', obj=objs[0], field=related)
         else:
-            self.emit_event(type='related_objects', obj=objs[0], field=related, number=len(related_objs))
+            if self.emits_events:
+                self.emit_event(type='related_objects', obj=objs[0], field=related, number=len(related_objs))
 
-            related_objs = self.filter_by_threshold(related_objs, objs[0], related.get_accessor_name())
+            # Other relations are already restricted by fetch_within_threshold.
+            if isinstance(related.field, OneToOneField):
+                related_objs = self.filter_by_threshold(related_objs, objs[0], related.get_accessor_name())
 
         return related_objs
 
 
+# emit_event methods of collectors of this package, only sending events to sinks (see
+# DeepCollector._has_custom_emit_event).
+_sink_emit_events = set([vars(DeepCollector)['emit_event']])
+
+
+# 'app_label.model_name' labels, by model class.
+_model_labels = {}
+
+
+def get_model_label(model):
+    try:
+        return _model_labels[model]
+    except KeyError:
+        meta = model._meta
+        # in django 1.8 _meta.module_name was renamed to _meta.model_name
+        model_name = meta.model_name if hasattr(meta, 'model_name') else meta.module_name
+        label = _model_labels[model] = meta.app_label + '.' + model_name
+        return label
+
+
 def get_model_from_instance(obj):
     if obj is None:
         return '<null_model>'
 
-    try:
-        meta = obj._meta
-    except AttributeError:
-        meta = obj.model._meta
+    if not hasattr(obj, '_meta'):
+        obj = obj.model
 
-    # in django 1.8 _meta.module_name was renamed to _meta.model_name
-    model_name = meta.model_name if hasattr(meta, 'model_name') else meta.module_name
-    model = meta.app_label + '.' + model_name
-    return model
+    return get_model_label(obj if isinstance(obj, type) else obj.__class__)
 
 
 def get_key_from_instance(obj):
@@ -464,5 +1311,94 @@ def get_key_from_instance(obj):
     return get_model_from_instance(obj) + '.' + str(obj.pk)
 
 
+def build_collector(collector_class, parameters=None):
+    """
+    Instantiate a collector class, with given parameters ({'EXCLUDE_MODELS': [...], ...}) set on the instance.
+    """
+    collector = collector_class()
+    for name, value in (parameters or {}).items():
+        setattr(collector, name, value)
+    return collector
+
+
+def close_thread_connections():
+    """
+    Close database connections of the current thread. Every thread has its own connections, that Django only closes
+    at the end of requests: threads started by collectors have to close theirs before they end.
+    """
+    for connection in connections.all():
+        connection.close()
+
+
+def get_field_name(field):
+    """
+    Name of a followed field: its accessor name for reverse relations (that may already be given as a string).
+    """
+    if isinstance(field, basestring):
+        return field
+    if hasattr(field, 'get_accessor_name'):
+        return field.get_accessor_name()
+    return field.name
+
+
+def get_registry_key(obj):
+    """
+    Key of given object in collector registries.
+    """
+    if obj is None:
+        return None
+    return obj.__class__, obj.pk
+
+
+class LabelKeyedView(Mapping):
+    """
+    Read-only view of a collector registry (keyed by model, or by (model, pk)), using the former string keys
+    ('app_label.model_name' or 'app_label.model_name.pk').
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def __getitem__(self, key):
+        return self.registry[self.get_registry_key(key)]
+
+    def __iter__(self):
+        return (self.get_label(key) for key in self.registry)
+
+    def __len__(self):
+        return len(self.registry)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    @staticmethod
+    def get_label(key):
+        if isinstance(key, tuple):
+            model, pk = key
+            return get_model_label(model) + '.' + str(pk)
+        return get_model_label(key)
+
+    @staticmethod
+    def get_registry_key(label):
+        """
+        Registry key of a string key, so that looking it up doesn't have to go through the whole registry.
+        """
+        if not isinstance(label, basestring):
+            raise KeyError(label)
+        # Primary keys may contain dots, app labels and model names can't.
+        parts = label.split('.', 2)
+        try:
+            model = apps.get_model(parts[0], parts[1])
+        except (IndexError, LookupError):
+            raise KeyError(label)
+        if len(parts) == 2:
+            return model
+
+        try:
+            return model, model._meta.pk.to_python(parts[2])
+        except ValidationError:
+            raise KeyError(label)
+
+
 # For backward compatibility
 RelatedObjectsCollector = DeepCollector
@@ -0,0 +1,93 @@
+import json
+import logging
+from collections import deque
+
+from django.db.models import Field, Model
+
+from .compat.builtins import basestring
+from .core import get_field_name, get_key_from_instance
+
+
+class EventSink(object):
+    """
+    Destination of collector events (see DeepCollector.EVENT_SINKS).
+    Events are dicts, with a 'type' key, referring to live objects (collected objects, fields, ...): sinks that keep
+    events after they have been emitted should keep serialized events instead (see serialize_event).
+    """
+
+    def emit(self, event):
+        raise NotImplementedError
+
+
+class ListSink(EventSink):
+    """
+    Keep every event in a list (that's the DEBUG collector log).
+    """
+
+    def __init__(self, events=None):
+        self.events = events if events is not None else []
+
+    def emit(self, event):
+        self.events.append(event)
+
+
+class RingBufferSink(EventSink):
+    """
+    Keep the last size events only, serialized.
+    """
+
+    def __init__(self, size=1000):
+        self.events = deque(maxlen=size)
+
+    def emit(self, event):
+        self.events.append(serialize_event(event))
+
+
+class JSONLinesSink(EventSink):
+    """
+    Write every event to a stream (e.g. an opened file), serialized as a JSON object per line.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def emit(self, event):
+        self.stream.write(json.dumps(serialize_event(event), default=str))
+        self.stream.write('\n')
+
+
+class LoggingSink(EventSink):
+    """
+    Log every event, serialized as JSON, with the given logger and level.
+    """
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger('deep_collector.events')
+        self.level = level
+
+    def emit(self, event):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, json.dumps(serialize_event(event), default=str))
+
+
+def serialize_event(event):
+    """
+    Copy of given event without any live object: model instances are replaced by their 'app_label.model_name.pk' key,
+    and fields by their name.
+    """
+    return dict((key, serialize_value(value)) for key, value in event.items())
+
+
+def serialize_value(value):
+    if value is None or isinstance(value, (basestring, bool, int, float)):
+        return value
+    if isinstance(value, Model):
+        return get_key_from_instance(value)
+    if isinstance(value, dict):
+        return dict((key, serialize_value(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [serialize_value(item) for item in value]
+    # Fields, reverse relations and GenericForeignKey.
+    if isinstance(value, Field) or hasattr(value, 'get_accessor_name') or hasattr(value, 'ct_field'):
+        return get_field_name(value)
+    return str(value)
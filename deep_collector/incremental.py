@@ -0,0 +1,354 @@
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.apps import apps
+from django.db import router
+from django.db.models import ForeignKey, ManyToManyField
+from django.utils import timezone
+
+from .checkpoint import dump_key, load_key
+from .compat.serializers import StreamingMultiModelInheritanceSerializer
+from .core import DeepCollector, get_model_label, get_registry_key
+
+
+# Version of the manifest format.
+MANIFEST_VERSION = 1
+
+
+class IncrementalDeepCollector(DeepCollector):
+    """
+    Collect objects related to roots that have already been exported, to only export what changed since then.
+
+    Every collect builds a manifest of collected objects: their version (the value of their CHANGED_SINCE_FIELDS field,
+    or a hash of their fields for other models), and the objects found through their reverse relations. Given the
+    manifest of a previous collect, collect_changes walks the same graph as DeepCollector, but reverse relations of
+    unchanged objects are read from the manifest instead of being queried, as long as none of the objects they may
+    contain has changed since the previous collect. Objects newly reachable through a changed object are collected as
+    usual.
+
+    Unchanged objects found through these relations are not even loaded: they are rebuilt from the manifest, with the
+    columns needed to follow their own relations only (hooks get them as deferred instances). They are loaded when
+    collected objects are asked for, but not to build the delta: deleted ones are then found with a single query.
+
+    HOWTO use:
+    >>> class CustomerCollector(IncrementalDeepCollector):
+    >>>     CHANGED_SINCE_FIELDS = {'shop.customer': 'updated_at', 'shop.order': 'updated_at'}
+    >>>
+    >>> collector = CustomerCollector()
+    >>> collector.collect_changes(customer, read_manifest(manifest_stream))
+    >>> collector.write_json_delta(delta_stream)
+    >>> write_manifest(collector.get_manifest(), manifest_stream)
+
+    Changes are only detected through objects of CHANGED_SINCE_FIELDS models (reverse relations from other models,
+    and ManyToManyField relations, are always queried), so their field has to be updated on every change, e.g. with
+    auto_now=True.
+    """
+
+    # Fields telling when objects of a model have been changed, by model.
+    # >>> CHANGED_SINCE_FIELDS = {'shop.order': 'updated_at'}
+    CHANGED_SINCE_FIELDS = {}
+
+    # Manifest of the previous collect, set by collect_changes.
+    previous_manifest = None
+
+    def collect_changes(self, root_obj, manifest):
+        self.collect_many_changes([root_obj], manifest)
+
+    def collect_many_changes(self, root_objs, manifest):
+        """
+        Collect objects related to given roots, reading relations of objects that haven't changed since the previous
+        collect from its manifest.
+        :param manifest: the manifest of the previous collect (see get_manifest)
+        """
+        self.previous_manifest = manifest
+        self.collect_many(root_objs)
+
+    def _reset_collect_state(self, root_objs):
+        super(IncrementalDeepCollector, self)._reset_collect_state(root_objs)
+
+        # Changes made during the collect will be in the next delta.
+        self._started_at = timezone.now()
+        self._related_keys = {}
+        self._delta = None
+
+        self._previous_versions = {}
+        self._previous_related_keys = {}
+        self._previous_traversal_values = {}
+        self._changed_keys = set()
+        self._changed_values = {}
+        # Columns needed to follow relations of collected objects of CHANGED_SINCE_FIELDS models, by key.
+        self._traversal_values = {}
+        # Keys of unchanged objects rebuilt from the previous manifest, instead of being loaded.
+        self._carried_keys = set()
+        if self.previous_manifest is not None:
+            self._load_previous_manifest(self.previous_manifest)
+
+    def _load_previous_manifest(self, manifest):
+        if manifest.get('version') != MANIFEST_VERSION:
+            raise ValueError('Unsupported manifest version: %s' % manifest.get('version'))
+
+        for label, pk, version, related_keys, traversal_values in manifest['objects']:
+            key = load_key([label, pk])
+            self._previous_versions[key] = version
+            self._previous_related_keys[key] = dict(
+                (accessor_name, [load_key(value) for value in values])
+                for accessor_name, values in related_keys.items()
+            )
+            if traversal_values:
+                self._previous_traversal_values[key] = traversal_values
+
+        for label, field_name in self.CHANGED_SINCE_FIELDS.items():
+            self._load_changed_objects(apps.get_model(label), field_name, manifest['since'])
+
+    def _load_changed_objects(self, model, field_name, since):
+        """
+        Register objects of given model that have changed since the previous collect, and the values of their foreign
+        keys: reverse relations of objects they refer to have to be queried again.
+        """
+        since = model._meta.get_field(field_name).to_python(since)
+        fk_fields = [field for field in model._meta.concrete_fields if isinstance(field, ForeignKey)]
+
+        rows = model._base_manager.filter(**{field_name + '__gte': since}).values_list(
+            'pk', *[field.attname for field in fk_fields])
+        for row in rows:
+            self._changed_keys.add((model, row[0]))
+            for field, value in zip(fk_fields, row[1:]):
+                if value is not None:
+                    self._changed_values.setdefault(get_field_key(field), set()).add(value)
+
+    def query_related_objects(self, related, objs):
+        if isinstance(related.field, ManyToManyField):
+            return super(IncrementalDeepCollector, self).query_related_objects(related, objs)
+
+        obj = objs[0]
+        key = get_registry_key(obj)
+        accessor_name = related.get_accessor_name()
+
+        if self._has_unchanged_relation(obj, related):
+            related_keys, related_objs = self._load_previous_related_objects(
+                self._previous_related_keys[key][accessor_name])
+            if self.emits_events:
+                self.emit_event(type='previous_related_objects', obj=obj, field=related, number=len(related_objs))
+        else:
+            excluded_fields_count = len(self.excluded_fields)
+            self._fetched_keys = None
+            related_objs = super(IncrementalDeepCollector, self).query_related_objects(related, objs)
+            # Relations having too many related objects are queried again every time, to report them again.
+            if len(self.excluded_fields) != excluded_fields_count:
+                return related_objs
+            related_keys = self._fetched_keys
+            if related_keys is None:
+                related_keys = [get_registry_key(related_obj) for related_obj in related_objs]
+
+        self._related_keys.setdefault(key, {})[accessor_name] = related_keys
+        return related_objs
+
+    def _get_pks_to_fetch(self, model, pks):
+        # Objects that are not loaded again, because they have already been collected, are still in the manifest: they
+        # may only be reachable through this relation in the next collect.
+        self._fetched_keys = [(model, pk) for pk in pks]
+        return super(IncrementalDeepCollector, self)._get_pks_to_fetch(model, pks)
+
+    def _has_unchanged_relation(self, obj, related):
+        """
+        Tell if objects found through a reverse relation of given object are the same as in the previous collect.
+        They are, if the object was in the previous collect, and none of the objects of the related model that have
+        changed since then refers to it.
+        """
+        key = get_registry_key(obj)
+        if key in self._changed_keys or related.get_accessor_name() not in self._previous_related_keys.get(key, {}):
+            return False
+
+        if get_model_label(related.related_model) not in self.CHANGED_SINCE_FIELDS:
+            return False
+
+        value = getattr(obj, related.field.target_field.attname)
+        return value not in self._changed_values.get(get_field_key(related.field), ())
+
+    def _load_previous_related_objects(self, keys):
+        """
+        Get objects that were found through a relation in the previous collect. Objects that have changed since then
+        (and may not refer to the same object anymore) are skipped. Unchanged objects are rebuilt from the manifest
+        when it has every column needed to follow their relations, other ones are loaded (deleted ones are skipped).
+        :return: keys of objects still found through the relation, and objects to collect
+        """
+        related_keys = []
+        related_objs = []
+        pks_by_model = OrderedDict()
+        for model, pk in keys:
+            if (model, pk) in self._changed_keys:
+                continue
+            if self._is_excluded_pk(model, pk):
+                related_keys.append((model, pk))
+            elif self._can_be_carried(model, pk):
+                related_keys.append((model, pk))
+                related_objs.append(self._get_carried_object(model, pk))
+            else:
+                pks_by_model.setdefault(model, []).append(pk)
+
+        for model, pks in pks_by_model.items():
+            objs = self.get_traversal_queryset(model._base_manager.all()).in_bulk(pks)
+            loaded_objs = [objs[pk] for pk in pks if pk in objs]
+            related_keys += [get_registry_key(related_obj) for related_obj in loaded_objs]
+            related_objs += loaded_objs
+
+        return related_keys, related_objs
+
+    def _can_be_carried(self, model, pk):
+        values = self._previous_traversal_values.get((model, pk))
+        return values is not None and set(self.get_relation_plan(model).get_traversal_fields()) <= set(values)
+
+    def _get_carried_object(self, model, pk):
+        """
+        Instance of an unchanged object, with the columns needed to follow its relations only, as they were in the
+        previous collect.
+        """
+        values = self._previous_traversal_values[(model, pk)]
+        traversal_fields = set(self.get_relation_plan(model).get_traversal_fields())
+        # Model.from_db expects values in concrete fields order.
+        fields = [field for field in model._meta.concrete_fields if field.attname in traversal_fields]
+
+        self._carried_keys.add((model, pk))
+        return model.from_db(router.db_for_read(model), [field.attname for field in fields],
+                             [field.to_python(values[field.attname]) for field in fields])
+
+    def add_to_collected_object(self, parent, obj):
+        super(IncrementalDeepCollector, self).add_to_collected_object(parent, obj)
+        key = get_registry_key(obj)
+
+        if get_model_label(obj.__class__) in self.CHANGED_SINCE_FIELDS:
+            self._traversal_values[key] = dict(
+                (attname, getattr(obj, attname)) for attname in self.get_relation_plan(obj).get_traversal_fields())
+        if key in self._carried_keys:
+            # Loaded when collected objects are asked for, as objects collected before resuming a collect.
+            self.collected_objs[key] = None
+            self._has_unloaded_objects = True
+
+    def get_version(self, obj, m2m_pks=None):
+        """
+        Version of given object: the value of its CHANGED_SINCE_FIELDS field, or a hash of its concrete fields values
+        and of the primary keys of objects related through its ManyToManyFields.
+        :param m2m_pks: sorted primary keys of related objects, by ManyToManyField name (see get_m2m_pks)
+        """
+        label = get_model_label(obj.__class__)
+        if label in self.CHANGED_SINCE_FIELDS:
+            return obj._meta.get_field(self.CHANGED_SINCE_FIELDS[label]).value_to_string(obj)
+
+        values = dict((field.attname, field.value_to_string(obj)) for field in obj._meta.concrete_fields)
+        values.update(m2m_pks or {})
+        return hashlib.md5(json.dumps(values, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get_m2m_pks(self, model, objs):
+        """
+        Primary keys of objects related to given objects (of the given model) through the ManyToManyFields that are
+        serialized with them, with a single query for every field. Not needed for CHANGED_SINCE_FIELDS models.
+        :return: {pk: {field name: sorted related primary keys}}
+        """
+        m2m_pks = dict((obj.pk, {}) for obj in objs)
+        if not objs or get_model_label(model) in self.CHANGED_SINCE_FIELDS:
+            return m2m_pks
+
+        for field in model._meta.many_to_many:
+            through = field.remote_field.through
+            # Same fields as the ones serializers write.
+            if not field.serialize or not through._meta.auto_created:
+                continue
+
+            for pks in m2m_pks.values():
+                pks[field.name] = []
+            source_name, target_name = field.m2m_field_name(), field.m2m_reverse_field_name()
+            rows = through._base_manager.filter(**{source_name + '__in': list(m2m_pks)}).values_list(
+                source_name, target_name)
+            for pk, related_pk in rows:
+                m2m_pks[pk][field.name].append(related_pk)
+            for pks in m2m_pks.values():
+                pks[field.name].sort()
+
+        return m2m_pks
+
+    def get_delta(self):
+        """
+        Changes since the previous collect.
+        :return: a dict, with 'upserts' (new and changed objects) and 'deletes' ((model, pk) keys of objects that were
+        in the previous collect, but that have been deleted or aren't related to roots anymore)
+        """
+        if self._delta is None:
+            self._versions = OrderedDict()
+            upserts = []
+            deleted_keys = []
+            for model, chunk in self._get_collected_chunks():
+                # Objects rebuilt from the previous manifest haven't changed, unless they have been deleted.
+                carried_pks = [pk for pk, _ in chunk if (model, pk) in self._carried_keys]
+                if carried_pks:
+                    existing_pks = set(model._base_manager.filter(pk__in=carried_pks).values_list('pk', flat=True))
+                    for pk in carried_pks:
+                        if pk in existing_pks:
+                            self._versions[(model, pk)] = self._previous_versions[(model, pk)]
+                        else:
+                            deleted_keys.append((model, pk))
+
+                objs = self._load_collected_chunk(model, [(pk, obj) for pk, obj in chunk
+                                                          if (model, pk) not in self._carried_keys])
+                if self.DEFER_FIELDS:
+                    self._load_deferred_chunk(objs)
+                m2m_pks = self.get_m2m_pks(model, objs)
+                for obj in objs:
+                    key = get_registry_key(obj)
+                    self._versions[key] = self.get_version(obj, m2m_pks[obj.pk])
+                    if self._previous_versions.get(key) != self._versions[key]:
+                        upserts.append(obj)
+
+            for key in deleted_keys:
+                del self.collected_objs[key]
+
+            self._delta = {
+                'upserts': upserts,
+                'deletes': [key for key in self._previous_versions if key not in self.collected_objs],
+            }
+
+        return self._delta
+
+    def write_json_delta(self, stream, indent=None):
+        """
+        Write changes since the previous collect to the given stream, as a JSON object: 'upserts' is a fixture of new
+        and changed objects, and 'deletes' is a list of ['app_label.model_name', pk] keys of objects to delete.
+        """
+        delta = self.get_delta()
+
+        stream.write('{"upserts": ')
+        StreamingMultiModelInheritanceSerializer().serialize(delta['upserts'], stream=stream, indent=indent)
+        stream.write(', "deletes": ')
+        json.dump([dump_key(key) for key in delta['deletes']], stream, default=str)
+        stream.write('}\n')
+
+    def get_manifest(self):
+        """
+        Manifest of collected objects, to be given to the next collect_changes.
+        """
+        self.get_delta()
+
+        return {
+            'version': MANIFEST_VERSION,
+            'since': self._started_at.isoformat(),
+            'objects': [
+                dump_key(key) + [version, dict(
+                    (accessor_name, [dump_key(related_key) for related_key in related_keys])
+                    for accessor_name, related_keys in self._related_keys.get(key, {}).items()
+                ), self._traversal_values.get(key, {})]
+                for key, version in self._versions.items()
+            ],
+        }
+
+
+def get_field_key(field):
+    return get_model_label(field.model), field.name
+
+
+def write_manifest(manifest, stream):
+    # Primary keys that are not JSON serializable (e.g. UUID) are converted back from strings when reading.
+    json.dump(manifest, stream, default=str)
+
+
+def read_manifest(stream):
+    return json.load(stream)
@@ -0,0 +1,135 @@
+import threading
+import time
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .compat.builtins import queue
+from .compat.serializers import PrefetchedM2MSerializer
+from .core import close_thread_connections
+
+
+# Markers put in the queue after the last batch: every batch has been collected, or the collect failed.
+_END = object()
+_ABORT = object()
+
+
+class _Aborted(Exception):
+    pass
+
+
+class PipelinedExport(object):
+    """
+    Collect objects related to given roots and write them as a JSON fixture at the same time: the collector pushes
+    every batch of collected objects (see DeepCollector.iter_collect_batches) to a bounded queue, and a serializer
+    thread encodes and writes them to the stream. When the serializer is the slowest one, the collector waits for it
+    before pushing another batch, so that there are never more than queue_size batches waiting to be written.
+
+    The collect runs in the calling thread, with its database connection (and transaction). The serializer thread
+    doesn't query the database: batches are loaded (KEYS_ONLY, DEFER_FIELDS) by the collector, which also prefetches
+    primary keys of objects related by ManyToManyFields before pushing them.
+
+    HOWTO use:
+    >>> collector = BatchDeepCollector()
+    >>> collector.KEYS_ONLY = True
+    >>> with open('/var/exports/user.json', 'w') as stream:
+    >>>     stats = PipelinedExport(collector).run([user], stream)
+
+    Memory is only bounded in KEYS_ONLY mode: otherwise the collector keeps every collected object anyway.
+    """
+
+    def __init__(self, collector, queue_size=4):
+        self.collector = collector
+        self.queue_size = queue_size
+
+    def run(self, root_objs, stream, indent=None):
+        """
+        :return: stats: numbers of written objects and batches, duration of the export, and time the collector spent
+        waiting for the serializer (queue is full), and the serializer waiting for the collector (queue is empty)
+        """
+        batches = queue.Queue(maxsize=self.queue_size)
+        # Set once the serializer has read the last batch marker.
+        ended = threading.Event()
+        errors = []
+        stats = {'objects': 0, 'batches': 0, 'collector_wait': 0.0, 'serializer_wait': 0.0}
+        started_at = time.time()
+
+        thread = threading.Thread(target=self.serialize, args=(batches, ended, stream, indent, stats, errors))
+        thread.daemon = True
+        thread.start()
+
+        try:
+            for model, objs in self.collector.iter_collect_batches(root_objs):
+                m2m_field_names = self.prefetch_m2m_fields(model, objs)
+                stats['objects'] += len(objs)
+                stats['batches'] += 1
+
+                wait_started_at = time.time()
+                batches.put((objs, m2m_field_names))
+                stats['collector_wait'] += time.time() - wait_started_at
+                if errors:
+                    break
+        except BaseException:
+            batches.put(_ABORT)
+            thread.join()
+            raise
+
+        batches.put(_END)
+        thread.join()
+        if errors:
+            raise errors[0]
+
+        stats['duration'] = time.time() - started_at
+        return stats
+
+    def prefetch_m2m_fields(self, model, objs):
+        """
+        Prefetch primary keys of objects related to given objects (of the given model) by the ManyToManyFields the
+        serializer writes, so that it doesn't have to query them.
+        :return: names of prefetched fields
+        """
+        fields = [
+            field for field in model._meta.many_to_many
+            if field.serialize and field.remote_field.through._meta.auto_created
+        ]
+        if fields:
+            prefetch_related_objects(objs, *[
+                Prefetch(field.name, queryset=field.related_model._base_manager.only('pk')) for field in fields
+            ])
+
+        return [field.name for field in fields]
+
+    def serialize(self, batches, ended, stream, indent, stats, errors):
+        try:
+            PrefetchedM2MSerializer().serialize(self._iter_batches(batches, ended, stats), stream=stream,
+                                                indent=indent)
+        except _Aborted:
+            pass
+        except Exception as e:
+            errors.append(e)
+            # The collector must never wait for a serializer that has stopped.
+            while not ended.is_set():
+                if batches.get() in (_END, _ABORT):
+                    ended.set()
+        finally:
+            close_thread_connections()
+
+    def _iter_batches(self, batches, ended, stats):
+        while True:
+            wait_started_at = time.time()
+            batch = batches.get()
+            stats['serializer_wait'] += time.time() - wait_started_at
+            if batch is _END or batch is _ABORT:
+                ended.set()
+            if batch is _END:
+                return
+            if batch is _ABORT:
+                raise _Aborted()
+
+            objs, m2m_field_names = batch
+            for obj in objs:
+                yield obj
+
+            # Once written, related primary keys are not needed anymore (the collector may keep collected objects).
+            for obj in objs:
+                for name in m2m_field_names:
+                    obj._prefetched_objects_cache.pop(name, None)
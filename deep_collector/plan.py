@@ -0,0 +1,115 @@
+from collections import OrderedDict
+
+from django.db.models import ForeignKey
+
+from .compat.fields import GenericForeignKey, GenericRelation
+
+
+class RelationPlan(object):
+    """
+    Every relation the collector follows from one model, once exclusion parameters have been applied.
+
+    It only depends on the model and on the collector parameters, so it is computed once per model and then shared by
+    every collected object of this model (see DeepCollector.get_relation_plan).
+
+    >>> plan = DeepCollector().get_relation_plan(BaseModel)
+    >>> plan.as_dict()
+    {'model': 'tests.basemodel', 'foreign_keys': ['fkey', 'o2o'], ..., 'related_fields': ['foreignkeytobasemodel_set']}
+    """
+
+    def __init__(self, model, local_fields, m2m_fields, related_fields, related_m2m_fields):
+        self.model = model
+
+        # Fields returned by DeepCollector getters, with exclusions already applied.
+        self.local_fields = local_fields
+        self.m2m_fields = m2m_fields
+        self.related_fields = related_fields
+        self.related_m2m_fields = related_m2m_fields
+
+        # Local fields we are following, in their declaration order.
+        self.local_relation_fields = [field for field in local_fields
+                                      if isinstance(field, (ForeignKey, GenericForeignKey, GenericRelation))]
+        self.foreign_keys = [field for field in local_fields if isinstance(field, ForeignKey)]
+        self.generic_foreign_keys = [field for field in local_fields if isinstance(field, GenericForeignKey)]
+        self.generic_relations = [field for field in local_fields if isinstance(field, GenericRelation)]
+
+        self._traversal_fields = None
+
+    def get_lookups(self):
+        """
+        Every field name or accessor name followed from this model, as it would be given to prefetch_related.
+        """
+        lookups = [field.name for field in self.local_relation_fields]
+        lookups += [field.name for field in self.m2m_fields]
+        lookups += [related.get_accessor_name() for related in self.related_fields]
+        lookups += [related.get_accessor_name() for related, _ in self.related_m2m_fields]
+        return lookups
+
+    def get_traversal_fields(self):
+        """
+        Names of the columns we need to follow every relation of this plan: primary key, foreign keys values, and
+        fields referred to by reverse relations. They are the only ones loaded while collecting in KEYS_ONLY mode.
+        """
+        if self._traversal_fields is None:
+            meta = self.model._meta
+            names = [meta.pk.attname]
+            names += [field.attname for field in self.foreign_keys]
+            for field in self.generic_foreign_keys:
+                names += [meta.get_field(field.ct_field).attname, field.fk_field]
+            names += [related.field.target_field.attname for related in self.related_fields]
+            for field in self.m2m_fields:
+                source_field = field.remote_field.through._meta.get_field(field.m2m_field_name())
+                names.append(source_field.target_field.attname)
+            for related, _ in self.related_m2m_fields:
+                through_meta = related.field.remote_field.through._meta
+                names.append(through_meta.get_field(related.field.m2m_reverse_field_name()).target_field.attname)
+
+            self._traversal_fields = list(OrderedDict.fromkeys(names))
+
+        return self._traversal_fields
+
+    def as_dict(self):
+        meta = self.model._meta
+        return {
+            'model': meta.app_label + '.' + meta.model_name,
+            'foreign_keys': [field.name for field in self.foreign_keys],
+            'generic_foreign_keys': [field.name for field in self.generic_foreign_keys],
+            'generic_relations': [field.name for field in self.generic_relations],
+            'm2m_fields': [field.name for field in self.m2m_fields],
+            'related_fields': [related.get_accessor_name() for related in self.related_fields],
+            'related_m2m_fields': [related.get_accessor_name() for related, _ in self.related_m2m_fields],
+        }
+
+    def __repr__(self):
+        return '<RelationPlan: %s>' % self.as_dict()['model']
+
+
+# Relation plans, by (collector class, exclusion parameters), and then by model.
+_relation_plans = {}
+
+
+def get_relation_plans(collector):
+    """
+    Relation plans shared by every collector of the same class and with the same exclusion parameters. Changing these
+    parameters gives a new (empty) set of plans, so plans computed with the previous parameters are not used anymore.
+    """
+    key = (
+        collector.__class__,
+        freeze(collector.EXCLUDE_DIRECT_FIELDS),
+        freeze(collector.EXCLUDE_RELATED_FIELDS),
+    )
+    return _relation_plans.setdefault(key, {})
+
+
+def clear_relation_plans():
+    _relation_plans.clear()
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze(item) for item in value)
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import time
+from multiprocessing import Pool
+
+import django
+from django.apps import apps
+
+from .checkpoint import replace_file
+from .core import DeepCollector, build_collector, close_thread_connections, get_model_label
+
+
+logger = logging.getLogger(__name__)
+
+# Keys of every root of the export being run, in the current process (see init_shard_process).
+_root_keys = frozenset()
+
+
+class ShardedExport(object):
+    """
+    Export objects related to a (very) large set of roots, by partitioning roots into shards of shard_size roots.
+    Every shard is collected (with collect_many) by a process of a pool, and written to its own JSON file in the given
+    directory. Objects related to roots of several shards are then written in several shards: merge gives a single
+    fixture, and deduplicate gives a consistent set of shards, every object being in a single shard.
+    Every shard knows the roots of the other ones (see DeepCollector.OTHER_ROOT_KEYS), so that ForeignKeys referring to
+    them are kept, as if every root was collected at once.
+
+    HOWTO use:
+    >>> export = ShardedExport('/var/exports', collector_class=BatchDeepCollector, shard_size=500, processes=8)
+    >>> export.run(User, user_pks)
+    >>> with open('/var/exports/users.json', 'w') as stream:
+    >>>     export.merge(stream)
+    >>> report = export.get_report()
+
+    Collector parameters can be given as a dict ({'EXCLUDE_MODELS': [...], ...}) when they are not set on
+    collector_class itself.
+    With processes=0, shards are collected one after the other, in the current process.
+    """
+
+    def __init__(self, directory, collector_class=DeepCollector, parameters=None, shard_size=1000, processes=None):
+        self.directory = directory
+        self.collector_class = collector_class
+        self.parameters = parameters or {}
+        self.shard_size = shard_size
+        self.processes = processes
+
+        self.shards = []
+        self.saved_log = []
+        self.duplicates_count = None
+
+    def get_shards(self, pks):
+        pks = list(pks)
+        return [pks[i:i + self.shard_size] for i in range(0, len(pks), self.shard_size)]
+
+    def get_shard_path(self, index):
+        return os.path.join(self.directory, 'shard-%05d.json' % index)
+
+    def run(self, model, pks):
+        """
+        Collect and write every shard of roots of given model.
+        :param model: the model of root objects
+        :param pks: primary keys of root objects
+        :return: shards stats, in shards order
+        """
+        label = get_model_label(model)
+        pks = list(pks)
+        tasks = [
+            (self.collector_class, self.parameters, label, shard_pks, index, self.get_shard_path(index))
+            for index, shard_pks in enumerate(self.get_shards(pks))
+        ]
+
+        self.shards = []
+        self.saved_log = []
+        self.duplicates_count = None
+
+        if self.processes == 0:
+            init_shard_process(label, pks)
+            results = (collect_shard(task) for task in tasks)
+            self._gather(results, len(tasks))
+        else:
+            # Forked processes must not share the connections of the current one.
+            close_thread_connections()
+            # Root keys are given once to every process, instead of with every shard.
+            pool = Pool(self.processes, initializer=init_shard_process, initargs=(label, pks))
+            try:
+                self._gather(pool.imap_unordered(collect_shard, tasks), len(tasks))
+            finally:
+                pool.close()
+                pool.join()
+
+        self.shards.sort(key=lambda stats: stats['shard'])
+        return self.shards
+
+    def _gather(self, results, shards_count):
+        for stats in results:
+            self.shards.append(stats)
+            event = {
+                'type': 'shard_collected',
+                'shard': stats['shard'],
+                'done': len(self.shards),
+                'total': shards_count,
+                'objects': stats['objects'],
+                'duration': stats['duration'],
+            }
+            self.saved_log.append(event)
+            logger.info('Shard %(shard)s collected (%(done)s/%(total)s): %(objects)s objects in %(duration).1fs', event)
+
+    def iter_shard_objects(self):
+        """
+        Serialized objects of every shard, each object being only given once, even if it is in several shards.
+        """
+        seen_keys = set()
+        self.duplicates_count = 0
+
+        for stats in self.shards:
+            with open(stats['path']) as stream:
+                objs = json.load(stream)
+
+            for obj in objs:
+                key = (obj['model'], obj['pk'])
+                if key in seen_keys:
+                    self.duplicates_count += 1
+                    continue
+                seen_keys.add(key)
+                yield stats, obj
+
+    def merge(self, stream):
+        """
+        Write serialized objects of every shard to the given stream, as a single fixture without duplicates.
+        """
+        stream.write('[')
+        for i, (_, obj) in enumerate(self.iter_shard_objects()):
+            if i:
+                stream.write(',\n')
+            stream.write(json.dumps(obj, separators=(',', ':')))
+        stream.write(']\n')
+
+    def deduplicate(self):
+        """
+        Rewrite shards, so that every object is only in the first shard it has been collected in.
+        """
+        objs_by_shard = dict((stats['shard'], []) for stats in self.shards)
+        for stats, obj in self.iter_shard_objects():
+            objs_by_shard[stats['shard']].append(obj)
+
+        for stats in self.shards:
+            tmp_path = stats['path'] + '.tmp'
+            with open(tmp_path, 'w') as stream:
+                json.dump(objs_by_shard[stats['shard']], stream, separators=(',', ':'))
+            replace_file(tmp_path, stats['path'])
+            stats['objects'] = len(objs_by_shard[stats['shard']])
+
+    def get_report(self):
+        excluded_fields = []
+        for stats in self.shards:
+            excluded_fields += stats['excluded_fields']
+
+        return {
+            'excluded_fields': excluded_fields,
+            'log': self.saved_log,
+            'shards': [dict((key, value) for key, value in stats.items() if key != 'excluded_fields')
+                       for stats in self.shards],
+            'duplicates': self.duplicates_count,
+        }
+
+
+def init_shard_process(label, pks):
+    """
+    Set keys of every root of the export (of given model label and primary keys), in the current process.
+    """
+    global _root_keys
+
+    if not apps.ready:
+        django.setup()
+
+    model = apps.get_model(label)
+    _root_keys = frozenset((model, model._meta.pk.to_python(pk)) for pk in pks)
+
+
+def collect_shard(task):
+    """
+    Collect objects related to a shard of roots, and write them to the shard file.
+    Run in pool processes, so everything it gets and returns has to be picklable.
+    :return: shard stats
+    """
+    collector_class, parameters, label, pks, index, path = task
+
+    if not apps.ready:
+        django.setup()
+
+    start = time.time()
+    model = apps.get_model(label)
+    roots = list(model._base_manager.filter(pk__in=pks).order_by('pk'))
+
+    collector = build_collector(collector_class, dict(parameters, OTHER_ROOT_KEYS=_root_keys))
+    collector.collect_many(roots)
+
+    with open(path, 'w') as stream:
+        collector.write_json_serialized_objects(stream)
+
+    return {
+        'shard': index,
+        'path': path,
+        'roots': len(roots),
+        'objects': len(collector.collected_objs),
+        'excluded_fields': collector.get_report()['excluded_fields'],
+        'duration': time.time() - start,
+    }
@@ -0,0 +1,321 @@
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from django.db.models.base import ModelState
+
+from .compat.builtins import MutableMapping
+
+
+# Number of rows read at once when iterating over a table.
+PAGE_SIZE = 1000
+
+
+class DiskStorage(object):
+    """
+    SQLite database the collect registries and the objects left to collect are spilled to (see
+    DeepCollector.SPILL_TO_DISK), so that only a bounded number of them are kept in memory.
+
+    Without any path, it's a private temporary database, deleted as soon as it's closed (or garbage collected).
+    Several threads (BatchDeepCollector workers) can share it.
+    """
+
+    def __init__(self, path=None, cache_size=10000):
+        self.cache_size = cache_size
+        self.connection = sqlite3.connect(path or '', check_same_thread=False)
+        # Nothing has to survive a crash: there is no need to journal or sync anything.
+        self.connection.execute('PRAGMA journal_mode = OFF')
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.lock = threading.RLock()
+
+        # Models are stored as their index in this list, in the order they are first seen.
+        self._models = []
+        self._model_indexes = {}
+
+    def get_registry(self, name):
+        return DiskRegistry(self, name)
+
+    def get_stack(self, name, items=()):
+        return DiskStack(self, name, items)
+
+    def create_table(self, name, columns, indexes):
+        with self.lock:
+            self.connection.execute('DROP TABLE IF EXISTS %s' % name)
+            self.connection.execute('CREATE TABLE %s (%s)' % (name, columns))
+            for index, (columns, unique) in enumerate(indexes):
+                self.connection.execute('CREATE %sINDEX %s_%s ON %s (%s)' % (
+                    'UNIQUE ' if unique else '', name, index, name, columns))
+
+    def dump_key(self, key):
+        """
+        Convert a (model, pk) collector key to a (model index, pk text) row.
+        """
+        model, pk = key
+        try:
+            index = self._model_indexes[model]
+        except KeyError:
+            index = self._model_indexes[model] = len(self._models)
+            self._models.append(model)
+        return index, '%s' % (pk,)
+
+    def load_key(self, index, pk):
+        model = self._models[index]
+        return model, model._meta.pk.to_python(pk)
+
+    def close(self):
+        self.connection.close()
+
+
+class DiskRegistry(MutableMapping):
+    """
+    Mapping of (model, pk) keys (e.g. collected objects), stored in a table, with the last cache_size keys that have
+    been read or written in memory. Keys are iterated model by model, in the order models and keys have been added.
+    Values are pickled.
+    """
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.table = name
+        self.storage.create_table(name, 'model INTEGER, pk TEXT, value BLOB', [('model, pk', True), ('model', False)])
+
+        # Least recently used keys first.
+        self._cache = OrderedDict()
+        # Keys written since the last flush, with their value and whether they are new keys.
+        self._pending = OrderedDict()
+        self._len = 0
+
+    def __getitem__(self, key):
+        with self.storage.lock:
+            if key in self._pending:
+                return self._pending[key][0]
+            try:
+                value = self._cache.pop(key)
+            except KeyError:
+                row = self.storage.connection.execute(
+                    'SELECT value FROM %s WHERE model = ? AND pk = ?' % self.table, self.storage.dump_key(key)
+                ).fetchone()
+                if row is None:
+                    raise KeyError(key)
+                value = load_value(row[0])
+            self._cache[key] = value
+            self._trim_cache()
+            return value
+
+    def __setitem__(self, key, value):
+        with self.storage.lock:
+            is_new = key not in self
+            if is_new:
+                self._len += 1
+            else:
+                is_new = self._pending.get(key, (None, False))[1]
+            self._cache.pop(key, None)
+            self._pending[key] = (value, is_new)
+            if len(self._pending) >= self.storage.cache_size:
+                self.flush()
+
+    def __delitem__(self, key):
+        with self.storage.lock:
+            if key not in self:
+                raise KeyError(key)
+            self.flush()
+            self._cache.pop(key, None)
+            self.storage.connection.execute('DELETE FROM %s WHERE model = ? AND pk = ?' % self.table,
+                                            self.storage.dump_key(key))
+            self._len -= 1
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for model, items in self.iter_items_by_model(PAGE_SIZE):
+            for pk, _ in items:
+                yield model, pk
+
+    def iter_items_by_model(self, chunk_size):
+        """
+        :return: (model, [(pk, value), ...]) tuples, with at most chunk_size items each, model by model
+        """
+        self.flush()
+        last_row = (-1, -1)
+        while True:
+            with self.storage.lock:
+                rows = self.storage.connection.execute(
+                    'SELECT model, rowid, pk, value FROM %s WHERE model > ? OR (model = ? AND rowid > ?) '
+                    'ORDER BY model, rowid LIMIT ?' % self.table,
+                    (last_row[0], last_row[0], last_row[1], chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_row = rows[-1][:2]
+
+            chunk_model = None
+            chunk = []
+            for index, _, pk, value in rows:
+                model, pk = self.storage.load_key(index, pk)
+                if model is not chunk_model and chunk:
+                    yield chunk_model, chunk
+                    chunk = []
+                chunk_model = model
+                chunk.append((pk, load_value(value)))
+            yield chunk_model, chunk
+
+    def flush(self):
+        """
+        Write keys written since the last flush to the table.
+        """
+        with self.storage.lock:
+            if not self._pending:
+                return
+            new_rows = []
+            updated_rows = []
+            for key, (value, is_new) in self._pending.items():
+                index, pk = self.storage.dump_key(key)
+                if is_new:
+                    new_rows.append((index, pk, dump_value(value)))
+                else:
+                    updated_rows.append((dump_value(value), index, pk))
+                self._cache[key] = value
+
+            connection = self.storage.connection
+            connection.executemany('INSERT INTO %s (model, pk, value) VALUES (?, ?, ?)' % self.table, new_rows)
+            connection.executemany('UPDATE %s SET value = ? WHERE model = ? AND pk = ?' % self.table, updated_rows)
+            connection.commit()
+
+            self._pending.clear()
+            self._trim_cache()
+
+    def _trim_cache(self):
+        while len(self._cache) > self.storage.cache_size:
+            self._cache.popitem(last=False)
+
+
+class DiskStack(object):
+    """
+    Stack of (parent, object) tuples (the objects left to collect), keeping its cache_size top items in memory. Bottom
+    items are spilled to a table when there are more than twice as many items in memory, and they are loaded back,
+    cache_size at a time, once every item in memory has been popped.
+    Objects are pickled without the related objects they have in cache. Parents are only kept as their keys: they are
+    loaded back as instances only having a primary key.
+    """
+
+    def __init__(self, storage, name, items=()):
+        self.storage = storage
+        self.table = name
+        self.storage.create_table(name, 'position INTEGER, parent_model INTEGER, parent_pk TEXT, obj BLOB',
+                                  [('position', False)])
+
+        self._items = []
+        self._disk_count = 0
+        self.extend(items)
+
+    def append(self, item):
+        self._items.append(item)
+        self._spill_if_needed()
+
+    def extend(self, items):
+        self._items.extend(items)
+        self._spill_if_needed()
+
+    def pop(self):
+        if not self._items and self._disk_count:
+            self._load()
+        return self._items.pop()
+
+    def reverse(self):
+        if self._disk_count:
+            self._spill(len(self._items))
+            with self.storage.lock:
+                self.storage.connection.execute('UPDATE %s SET position = ? - position' % self.table,
+                                                (self._disk_count - 1,))
+            self._load()
+        else:
+            self._items.reverse()
+
+    def __len__(self):
+        return self._disk_count + len(self._items)
+
+    def __iter__(self):
+        # Bottom first, as a list.
+        for offset in range(0, self._disk_count, PAGE_SIZE):
+            with self.storage.lock:
+                rows = self.storage.connection.execute(
+                    'SELECT parent_model, parent_pk, obj FROM %s WHERE position >= ? AND position < ? '
+                    'ORDER BY position' % self.table, (offset, offset + PAGE_SIZE)
+                ).fetchall()
+            for row in rows:
+                yield self._load_item(*row)
+
+        for item in self._items:
+            yield item
+
+    def _spill_if_needed(self):
+        if len(self._items) > 2 * self.storage.cache_size:
+            self._spill(len(self._items) - self.storage.cache_size)
+
+    def _spill(self, count):
+        rows = []
+        for position, (parent, obj) in enumerate(self._items[:count], self._disk_count):
+            parent_model, parent_pk = self.storage.dump_key((parent.__class__, parent.pk)) if parent else (None, None)
+            rows.append((position, parent_model, parent_pk, sqlite3.Binary(dump_instance(obj))))
+
+        with self.storage.lock:
+            self.storage.connection.executemany(
+                'INSERT INTO %s (position, parent_model, parent_pk, obj) VALUES (?, ?, ?, ?)' % self.table, rows)
+            self.storage.connection.commit()
+
+        del self._items[:count]
+        self._disk_count += count
+
+    def _load(self):
+        start = max(0, self._disk_count - self.storage.cache_size)
+        with self.storage.lock:
+            rows = self.storage.connection.execute(
+                'SELECT parent_model, parent_pk, obj FROM %s WHERE position >= ? ORDER BY position' % self.table,
+                (start,)
+            ).fetchall()
+            self.storage.connection.execute('DELETE FROM %s WHERE position >= ?' % self.table, (start,))
+            self.storage.connection.commit()
+
+        self._items = [self._load_item(*row) for row in rows] + self._items
+        self._disk_count = start
+
+    def _load_item(self, parent_model, parent_pk, obj):
+        if parent_model is None:
+            parent = None
+        else:
+            model, pk = self.storage.load_key(parent_model, parent_pk)
+            parent = model(pk=pk)
+        return parent, load_instance(obj)
+
+
+def dump_value(value):
+    return None if value is None else sqlite3.Binary(pickle.dumps(value, 2))
+
+
+def load_value(data):
+    return None if data is None else pickle.loads(bytes(data))
+
+
+def dump_instance(obj):
+    """
+    Pickle a model instance without the related objects it has in cache (that would be pickled too, with the objects
+    they have in cache, ...).
+    """
+    state = dict(
+        (name, value) for name, value in obj.__dict__.items()
+        # Related objects cache before Django 2.0, and prefetched objects.
+        if not (name.startswith('_') and name.endswith('_cache'))
+    )
+    # Related objects cache (Django 2.0+) is in the model state.
+    state['_state'] = ModelState()
+    state['_state'].db = obj._state.db
+    state['_state'].adding = obj._state.adding
+    return pickle.dumps((obj.__class__, state), 2)
+
+
+def load_instance(data):
+    model, state = pickle.loads(bytes(data))
+    obj = model.__new__(model)
+    obj.__dict__.update(state)
+    return obj
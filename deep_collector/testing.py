@@ -0,0 +1,70 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+
+from .core import DeepCollector, get_key_from_instance
+
+
+def get_collect_queries(root_obj, collector=None):
+    """
+    Collect objects related to given root with a profiled collector (see DeepCollector.PROFILE).
+    Root object is loaded again before, so that objects it has in cache don't change the number of queries.
+    :return: the total number of queries, and the number of queries of every followed relation, by
+    'app_label.model_name.field_name'
+    """
+    collector = collector if collector is not None else DeepCollector()
+    collector.PROFILE = True
+
+    root_obj = root_obj.__class__._base_manager.get(pk=root_obj.pk)
+    # Same for content types cache.
+    ContentType.objects.clear_cache()
+    collector.collect(root_obj)
+
+    report = collector.get_report()
+    relation_queries = dict(
+        ('%s.%s' % (relation['model'], relation['field']), relation['queries'])
+        for relation in report['hot_relations']
+        if relation['queries']
+    )
+    return report['queries'], relation_queries
+
+
+class CollectQueriesTestMixin(object):
+    """
+    TestCase mixin pinning the number of queries made by a collect, relation by relation, so that a change (in the
+    collector, in Django, in models) making a relation cost more queries fails with the relations that changed.
+
+    >>> class TestUserExportQueries(CollectQueriesTestMixin, TestCase):
+    >>>     def test_user_export_queries(self):
+    >>>         self.assertCollectQueries(user, {
+    >>>             'auth.user.groups': 2,
+    >>>             'auth.user.order_set': 2,
+    >>>         }, total=4, collector=UserCollector())
+    """
+
+    def assertCollectQueries(self, root_obj, expected_relation_queries, total=None, collector=None):
+        """
+        :param root_obj: the object to collect
+        :param expected_relation_queries: expected number of queries by 'app_label.model_name.field_name' relation
+        (relations that are not given are expected to make no query)
+        :param total: expected number of queries of the whole collect, if it has to be checked too
+        :param collector: the collector to use (a DeepCollector by default)
+        """
+        if not hasattr(connection, 'execute_wrapper'):
+            self.skipTest('Counting queries of every relation requires Django 2.0+')
+
+        total_queries, relation_queries = get_collect_queries(root_obj, collector)
+
+        differences = []
+        for relation in sorted(set(relation_queries) | set(expected_relation_queries)):
+            expected = expected_relation_queries.get(relation, 0)
+            actual = relation_queries.get(relation, 0)
+            if actual != expected:
+                differences.append('    %s: %s queries instead of %s (%+d)' % (relation, actual, expected,
+                                                                                actual - expected))
+        if total is not None and total_queries != total:
+            differences.append('    total: %s queries instead of %s (%+d)' % (total_queries, total,
+                                                                             total_queries - total))
+
+        if differences:
+            self.fail('Collect of %s made unexpected queries:\n%s' % (get_key_from_instance(root_obj),
+                                                                       '\n'.join(differences)))
@@ -0,0 +1,46 @@
+# Generated by Django 3.1.14 on 2026-10-16 18:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0002_incremental_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='M2MThroughTargetModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ManyToManyThroughModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ManyToManyWithThroughModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('m2m', models.ManyToManyField(through='tests.ManyToManyThroughModel', to='tests.M2MThroughTargetModel')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='manytomanythroughmodel',
+            name='source',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tests.manytomanywiththroughmodel'),
+        ),
+        migrations.AddField(
+            model_name='manytomanythroughmodel',
+            name='target',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tests.m2mthroughtargetmodel'),
+        ),
+    ]
@@ -79,3 +79,35 @@ class GFKModel(models.Model):
 
 class BaseToGFKModel(models.Model):
     gfk_relation = GenericRelation(GFKModel)
+
+
+class Customer(models.Model):
+    name = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class Order(models.Model):
+    name = models.CharField(max_length=255)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class OrderLine(models.Model):
+    name = models.CharField(max_length=255)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class M2MThroughTargetModel(models.Model):
+    name = models.CharField(max_length=255)
+
+
+class ManyToManyWithThroughModel(models.Model):
+    name = models.CharField(max_length=255)
+    m2m = models.ManyToManyField(M2MThroughTargetModel, through='ManyToManyThroughModel')
+
+
+class ManyToManyThroughModel(models.Model):
+    source = models.ForeignKey(ManyToManyWithThroughModel, on_delete=models.CASCADE)
+    target = models.ForeignKey(M2MThroughTargetModel, on_delete=models.CASCADE)
+    position = models.PositiveIntegerField(default=0)
@@ -0,0 +1,105 @@
+from unittest import skipIf
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+
+from deep_collector.batch import BatchDeepCollector
+from deep_collector.core import get_key_from_instance
+
+from .factories import (BaseModelFactory, ChildModelFactory, ForeignKeyToBaseModelFactory,
+                        ManyToManyToBaseModelFactory, ManyToManyToBaseModelWithRelatedNameFactory,
+                        OneToOneToBaseModelFactory)
+from .models import BaseModel, BaseToGFKModel, GFKModel
+from .test_batch import collect
+
+try:
+    from asgiref.sync import async_to_sync
+    from deep_collector.asynchronous import AsyncDeepCollector
+except (ImportError, SyntaxError):
+    # Asynchronous ORM is only available with Django 4.1+ (and Python 3).
+    AsyncDeepCollector = None
+else:
+    class SyncAsyncDeepCollector(AsyncDeepCollector):
+        """
+        AsyncDeepCollector run from synchronous tests, so that it is compared with the same helpers as other
+        collectors.
+        """
+
+        def collect(self, root_obj):
+            async_to_sync(super(SyncAsyncDeepCollector, self).collect)(root_obj)
+
+        def get_collected_objects(self):
+            return async_to_sync(self.aget_collected_objects)()
+
+
+@skipIf(AsyncDeepCollector is None, 'AsyncDeepCollector requires Django 4.1+')
+class TestAsyncDeepCollector(TestCase):
+
+    def collect(self, collector_class, root_obj, **parameters):
+        collector, _ = collect(collector_class, root_obj, DEBUG=True, **parameters)
+        return collector, list(collector.get_collected_objects())
+
+    def assertSameCollect(self, root_obj, **parameters):
+        collector, objs = self.collect(BatchDeepCollector, root_obj, **parameters)
+        async_collector, async_objs = self.collect(SyncAsyncDeepCollector, root_obj, **parameters)
+
+        self.assertEqual(set(get_key_from_instance(obj) for obj in objs),
+                         set(get_key_from_instance(obj) for obj in async_objs))
+        self.assertEqual(collector.get_report()['excluded_fields'], async_collector.get_report()['excluded_fields'])
+        self.assertEqual(collector.get_report()['collected_objects_history'],
+                         async_collector.get_report()['collected_objects_history'])
+        return async_objs
+
+    def test_collects_same_objects_as_batch_collector(self):
+        obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=3)
+        OneToOneToBaseModelFactory.create(o2oto=obj)
+        ManyToManyToBaseModelFactory.create(base_models=[obj, BaseModelFactory.create()])
+        ManyToManyToBaseModelWithRelatedNameFactory.create(base_models=[obj])
+        ChildModelFactory.create(fkey=obj.fkey)
+
+        self.assertSameCollect(obj)
+        self.assertSameCollect(obj, ALLOWS_SAME_TYPE_AS_ROOT_COLLECT=True)
+        self.assertSameCollect(obj, MAXIMUM_RELATED_INSTANCES=2)
+        self.assertSameCollect(obj, KEYS_ONLY=True)
+        self.assertSameCollect(obj, DEFER_FIELDS={'tests.foreignkeytobasemodel': ['name']}, CONCURRENCY=1)
+
+    def test_collects_same_objects_as_batch_collector_with_generic_relations(self):
+        obj = BaseToGFKModel.objects.create()
+        GFKModel.objects.create(content_object=obj)
+        GFKModel.objects.create(content_object=obj)
+        GFKModel.objects.create(content_object=BaseModelFactory.create())
+
+        self.assertSameCollect(obj)
+        self.assertSameCollect(obj, MAXIMUM_RELATED_INSTANCES_PER_MODEL={'tests.gfkmodel': 1})
+        self.assertSameCollect(ContentType.objects.get_for_model(BaseModel))
+
+    def test_hooks_are_called(self):
+        obj = BaseModelFactory.create()
+        pre_collected_objs = []
+
+        class HookedCollector(SyncAsyncDeepCollector):
+            def pre_collect(self, obj):
+                pre_collected_objs.append(obj)
+                return obj
+
+        _, objs = self.collect(HookedCollector, obj)
+        self.assertEqual(len(pre_collected_objs), 3)
+        self.assertEqual(set(pre_collected_objs), set(objs))
+
+    def test_collect_limits(self):
+        obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=3)
+
+        collector, objs = self.collect(BatchDeepCollector, obj, MAX_COLLECTED_OBJECTS=2)
+        async_collector, async_objs = self.collect(SyncAsyncDeepCollector, obj, MAX_COLLECTED_OBJECTS=2)
+        self.assertEqual(set(get_key_from_instance(obj) for obj in objs),
+                         set(get_key_from_instance(obj) for obj in async_objs))
+        self.assertEqual(async_collector.get_report()['truncated']['reason'], 'max_collected_objects')
+        self.assertEqual(async_collector.get_report()['unexplored_objects'],
+                         collector.get_report()['unexplored_objects'])
+
+        for parameters in [{'MAX_QUERIES': 10}, {'PROFILE': True}, {'CHECKPOINT_PATH': 'collect.json'}]:
+            with self.assertRaises(ImproperlyConfigured):
+                self.collect(SyncAsyncDeepCollector, obj, **parameters)
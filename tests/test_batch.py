@@ -0,0 +1,516 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError, connection
+from django.db.models.signals import post_init
+import threading
+
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from deep_collector.batch import BatchDeepCollector
+from deep_collector.core import DeepCollector, build_collector, get_key_from_instance
+
+from .factories import (BaseModelFactory, ChildModelFactory, ClassLevel3Factory, FKDummyModelFactory,
+                        ForeignKeyToBaseModelFactory,
+                        ManyToManyToBaseModelFactory, ManyToManyToBaseModelWithRelatedNameFactory,
+                        OneToOneToBaseModelFactory)
+from .models import (BaseModel, BaseToGFKModel, FKDummyModel, ForeignKeyToBaseModel, GFKModel, InvalidFKNonRootModel,
+                     InvalidFKRootModel, ManyToManyToBaseModel)
+
+
+def collect(collector_class, root_obj, **parameters):
+    """
+    :return: the collector, and its number of queries
+    """
+    # Using a fresh instance, so relations cached by a previous collect are not taken into account.
+    root_obj = root_obj.__class__._base_manager.get(pk=root_obj.pk)
+    collector = build_collector(collector_class, parameters)
+
+    with CaptureQueriesContext(connection) as queries:
+        collector.collect(root_obj)
+
+    return collector, len(queries)
+
+
+def collect_keys(collector_class, root_obj, **parameters):
+    collector, queries_count = collect(collector_class, root_obj, **parameters)
+    keys = set(get_key_from_instance(obj) for obj in collector.get_collected_objects())
+    excluded_fields = sorted(collector.get_report()['excluded_fields'], key=lambda x: sorted(x.items()))
+    return keys, excluded_fields, queries_count
+
+
+class TestBatchDeepCollector(TestCase):
+
+    def assertSameCollect(self, root_obj, **parameters):
+        keys, excluded_fields, queries_count = collect_keys(DeepCollector, root_obj, **parameters)
+        batch_keys, batch_excluded_fields, batch_queries_count = collect_keys(BatchDeepCollector, root_obj,
+                                                                              **parameters)
+
+        self.assertEqual(keys, batch_keys)
+        self.assertEqual(excluded_fields, batch_excluded_fields)
+        return queries_count, batch_queries_count
+
+    def test_collects_same_objects_as_deep_collector(self):
+        obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=3)
+        OneToOneToBaseModelFactory.create(o2oto=obj)
+        ManyToManyToBaseModelFactory.create(base_models=[obj, BaseModelFactory.create()])
+        ManyToManyToBaseModelWithRelatedNameFactory.create(base_models=[obj])
+
+        self.assertSameCollect(obj)
+        self.assertSameCollect(obj, ALLOWS_SAME_TYPE_AS_ROOT_COLLECT=True)
+        self.assertSameCollect(obj, EXCLUDE_MODELS=['tests.o2odummymodel'])
+        self.assertSameCollect(obj, EXCLUDE_DIRECT_FIELDS={'tests.basemodel': ['fkey']})
+        self.assertSameCollect(obj, EXCLUDE_RELATED_FIELDS={'tests.basemodel': ['manytomanytobasemodel_set']})
+
+    def test_collects_same_objects_as_deep_collector_with_thresholds(self):
+        obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=3)
+        root_obj = ManyToManyToBaseModelFactory.create(base_models=[obj, BaseModelFactory.create()])
+
+        self.assertSameCollect(obj, MAXIMUM_RELATED_INSTANCES=2)
+        self.assertSameCollect(root_obj, MAXIMUM_RELATED_INSTANCES=1)
+        self.assertSameCollect(root_obj, MAXIMUM_RELATED_INSTANCES_PER_MODEL={'tests.foreignkeytobasemodel': 2})
+
+    def test_collects_same_objects_as_deep_collector_on_nested_and_inherited_objects(self):
+        level3 = ClassLevel3Factory.create()
+        child = ChildModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=child, size=2)
+
+        self.assertSameCollect(level3)
+        self.assertSameCollect(level3.fkey.fkey)
+        self.assertSameCollect(child)
+
+    def test_collects_same_objects_as_deep_collector_with_generic_relations(self):
+        obj = BaseToGFKModel.objects.create()
+        GFKModel.objects.create(content_object=obj)
+        gfkmodel = GFKModel.objects.create(content_object=BaseModelFactory.create())
+
+        self.assertSameCollect(obj)
+        self.assertSameCollect(gfkmodel)
+        self.assertSameCollect(obj, MAXIMUM_RELATED_INSTANCES_PER_MODEL={'tests.gfkmodel': 1})
+        self.assertSameCollect(ContentType.objects.get_for_model(BaseModel))
+
+    def test_collects_same_objects_as_deep_collector_with_invalid_foreign_keys(self):
+        root = InvalidFKRootModel.objects.create()
+        non_root = InvalidFKNonRootModel.objects.create(valid_fk=root, invalid_fk_id=root.pk + 1000)
+        root.valid_fk = non_root
+        root.invalid_fk_id = non_root.pk + 1000
+        root.save()
+
+        self.assertSameCollect(root)
+
+    def test_related_objects_are_queried_once_per_level(self):
+        obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=10)
+        ManyToManyToBaseModelFactory.create_batch(base_models=[obj], size=10)
+
+        queries_count, batch_queries_count = self.assertSameCollect(obj)
+        self.assertLess(batch_queries_count, queries_count)
+
+        # Adding more objects to the same level doesn't add any query.
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=10)
+        ManyToManyToBaseModelFactory.create_batch(base_models=[obj], size=10)
+        _, _, more_objects_batch_queries_count = collect_keys(BatchDeepCollector, obj)
+        self.assertEqual(batch_queries_count, more_objects_batch_queries_count)
+
+    def test_related_objects_are_not_loaded_if_there_are_too_many_of_them(self):
+        obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=3)
+
+        loaded_instances = []
+
+        def count_loaded_instances(sender, instance, **kwargs):
+            loaded_instances.append(instance)
+
+        post_init.connect(count_loaded_instances, sender=ForeignKeyToBaseModel)
+        try:
+            collector = BatchDeepCollector()
+            collector.MAXIMUM_RELATED_INSTANCES = 2
+            collector.collect(obj)
+        finally:
+            post_init.disconnect(count_loaded_instances, sender=ForeignKeyToBaseModel)
+
+        self.assertEqual(loaded_instances, [])
+        self.assertEqual(collector.get_report()['excluded_fields'], [{
+            'parent_instance': u'tests.basemodel.%s' % obj.pk,
+            'field_name': u'foreignkeytobasemodel_set',
+            'related_model': u'tests.foreignkeytobasemodel',
+            'count': 3,
+            'max_count': 2,
+        }])
+
+    def test_many_to_many_relations_are_read_once_per_level(self):
+        obj = BaseModelFactory.create()
+        other_objs = BaseModelFactory.create_batch(size=3)
+        ManyToManyToBaseModelFactory.create_batch(base_models=[obj], size=5)
+        too_many_m2m_model = ManyToManyToBaseModelFactory.create(base_models=[obj] + other_objs)
+
+        parameters = {'ALLOWS_SAME_TYPE_AS_ROOT_COLLECT': True,
+                      'MAXIMUM_RELATED_INSTANCES_PER_MODEL': {'tests.basemodel': 3}}
+        keys, excluded_fields, queries_count = collect_keys(BatchDeepCollector, obj, **parameters)
+
+        # Thresholds are checked for every source object: only the m2m field having too many objects is excluded.
+        self.assertEqual(len(keys), 9)
+        self.assertEqual(excluded_fields, [{
+            'parent_instance': u'tests.manytomanytobasemodel.%s' % too_many_m2m_model.pk,
+            'field_name': u'm2m',
+            'related_model': u'tests.basemodel',
+            'count': 4,
+            'max_count': 3,
+        }])
+
+        ManyToManyToBaseModelFactory.create_batch(base_models=[obj], size=5)
+        keys, _, more_objects_queries_count = collect_keys(BatchDeepCollector, obj, **parameters)
+        self.assertEqual(len(keys), 14)
+        self.assertEqual(queries_count, more_objects_queries_count)
+
+    def test_foreign_keys_are_loaded_once_per_level(self):
+        fkey = FKDummyModelFactory.create()
+        BaseModelFactory.create_batch(fkey=fkey, size=2)
+        keys, _, queries_count = collect_keys(BatchDeepCollector, fkey)
+        self.assertEqual(len(keys), 5)
+
+        BaseModelFactory.create_batch(fkey=fkey, size=5)
+        keys, _, more_objects_queries_count = collect_keys(BatchDeepCollector, fkey)
+        self.assertEqual(len(keys), 15)
+        self.assertEqual(queries_count, more_objects_queries_count)
+
+    def test_invalid_foreign_keys_are_not_collected(self):
+        root = InvalidFKRootModel.objects.create()
+        for _ in range(3):
+            InvalidFKNonRootModel.objects.create(valid_fk=root, invalid_fk_id=root.pk + 1000)
+
+        collector = BatchDeepCollector()
+        collector.ALLOWS_SAME_TYPE_AS_ROOT_COLLECT = True
+        collector.DEBUG = True
+        collector.collect(root)
+
+        self.assertEqual(len(collector.get_collected_objects()), 4)
+        invalid_foreign_keys = [event for event in collector.get_report()['log']
+                                if event['type'] == 'local_field_no_instance']
+        self.assertEqual(len(invalid_foreign_keys), 3)
+
+    def test_relations_that_cannot_be_queried_are_reported(self):
+        obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=3)
+
+        class BrokenRelationCollector(BatchDeepCollector):
+            error = None
+
+            def get_manager(self, manager):
+                if manager.model is ForeignKeyToBaseModel and self.error:
+                    raise self.error
+                return super(BrokenRelationCollector, self).get_manager(manager)
+
+        collector = BrokenRelationCollector()
+        collector.error = DatabaseError('no such table: tests_foreignkeytobasemodel')
+        collector.DEBUG = True
+        collector.collect(BaseModel.objects.get(pk=obj.pk))
+
+        self.assertFalse([obj for obj in collector.get_collected_objects() if isinstance(obj, ForeignKeyToBaseModel)])
+        report = collector.get_report()
+        self.assertEqual(report['unexplored_relations'],
+                         [{'object': get_key_from_instance(obj), 'field': 'foreignkeytobasemodel_set'}])
+        self.assertEqual(len([event for event in report['log'] if event['type'] == 'error_related_object']), 1)
+
+        # Any other error is a bug, that is not hidden.
+        collector = BrokenRelationCollector()
+        collector.error = ValueError('Unexpected error')
+        with self.assertRaises(ValueError):
+            collector.collect(BaseModel.objects.get(pk=obj.pk))
+
+    def test_m2m_relations_that_cannot_be_queried_are_reported(self):
+        obj = ManyToManyToBaseModelFactory.create(base_models=BaseModelFactory.create_batch(2))
+        through = ManyToManyToBaseModel.m2m.through
+
+        class BrokenThroughCollector(BatchDeepCollector):
+            def get_manager(self, manager):
+                if manager.model is through:
+                    raise DatabaseError('no such table: %s' % through._meta.db_table)
+                return super(BrokenThroughCollector, self).get_manager(manager)
+
+        collector = BrokenThroughCollector()
+        collector.collect(ManyToManyToBaseModel.objects.get(pk=obj.pk))
+
+        self.assertEqual(list(collector.get_collected_objects()), [obj])
+        self.assertEqual(collector.get_report()['unexplored_relations'],
+                         [{'object': get_key_from_instance(obj), 'field': 'm2m'}])
+
+    def test_collectors_do_not_share_task_records(self):
+        obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=3)
+
+        class NestedCollector(BatchDeepCollector):
+            def filter_by_threshold(self, objs, parent, field_name):
+                # Another collect, run while a relation task of this one is running.
+                BatchDeepCollector().collect(FKDummyModel.objects.get(pk=obj.fkey_id))
+                return super(NestedCollector, self).filter_by_threshold(objs, parent, field_name)
+
+        collector = NestedCollector()
+        collector.DEBUG = True
+        collector.collect(BaseModel.objects.get(pk=obj.pk))
+
+        keys, _, _ = collect_keys(BatchDeepCollector, obj)
+        self.assertEqual(set(get_key_from_instance(o) for o in collector.get_collected_objects()), keys)
+
+    def test_generic_foreign_keys_are_loaded_once_per_content_type(self):
+        content_type = ContentType.objects.get_for_model(BaseModel)
+        for obj in BaseModelFactory.create_batch(size=2):
+            GFKModel.objects.create(content_object=obj)
+
+        ContentType.objects.clear_cache()
+        keys, _, queries_count = collect_keys(BatchDeepCollector, content_type, ALLOWS_SAME_TYPE_AS_ROOT_COLLECT=True)
+        self.assertEqual(len(keys), 9)
+
+        for obj in BaseModelFactory.create_batch(size=3):
+            GFKModel.objects.create(content_object=obj)
+
+        ContentType.objects.clear_cache()
+        keys, _, more_objects_queries_count = collect_keys(BatchDeepCollector, content_type,
+                                                           ALLOWS_SAME_TYPE_AS_ROOT_COLLECT=True)
+        self.assertEqual(len(keys), 21)
+        self.assertEqual(queries_count, more_objects_queries_count)
+
+    def test_generic_relations_are_read_once_per_level(self):
+        content_type = ContentType.objects.get_for_model(BaseToGFKModel)
+        for obj in [BaseToGFKModel.objects.create() for _ in range(2)]:
+            GFKModel.objects.create(content_object=obj)
+        keys, _, queries_count = collect_keys(BatchDeepCollector, content_type)
+        self.assertEqual(len(keys), 5)
+
+        for obj in [BaseToGFKModel.objects.create() for _ in range(3)]:
+            GFKModel.objects.create(content_object=obj)
+        keys, _, more_objects_queries_count = collect_keys(BatchDeepCollector, content_type)
+        self.assertEqual(len(keys), 11)
+        self.assertEqual(queries_count, more_objects_queries_count)
+
+    def test_generic_relations_thresholds_are_checked_for_every_parent(self):
+        obj = BaseToGFKModel.objects.create()
+        other_obj = BaseToGFKModel.objects.create()
+        GFKModel.objects.create(content_object=obj)
+        GFKModel.objects.create(content_object=obj)
+        gfkmodel = GFKModel.objects.create(content_object=other_obj)
+
+        collector = BatchDeepCollector()
+        collector.MAXIMUM_RELATED_INSTANCES_PER_MODEL = {'tests.gfkmodel': 1}
+        collector._reset_collect_state([obj])
+        related_objs = collector.query_generic_relation_objects_batch(
+            [obj, other_obj], BaseToGFKModel._meta.get_field('gfk_relation'))
+
+        self.assertEqual(related_objs, [(other_obj, gfkmodel)])
+        self.assertEqual(collector.get_report()['excluded_fields'], [{
+            'parent_instance': u'tests.basetogfkmodel.%s' % obj.pk,
+            'field_name': u'gfk_relation',
+            'related_model': u'tests.gfkmodel',
+            'count': 2,
+            'max_count': 1,
+        }])
+
+    def test_collect_many_collects_same_objects_as_deep_collector(self):
+        root1 = BaseModelFactory.create()
+        root2 = BaseModelFactory.create(fkey=root1.fkey)
+        BaseModelFactory.create(fkey=root1.fkey)
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=root2, size=2)
+        ManyToManyToBaseModelFactory.create(base_models=[root1, root2])
+
+        owners = []
+        for collector_class in [DeepCollector, BatchDeepCollector]:
+            collector = collector_class()
+            collector.collect_many([root1, root2])
+            owners.append(dict((get_key_from_instance(obj), get_key_from_instance(collector.get_root(obj)))
+                               for obj in collector.get_collected_objects()))
+
+        # Owners of objects related to several roots depend on traversal order, but roots belong to themselves.
+        self.assertEqual(set(owners[0]), set(owners[1]))
+        self.assertEqual(len(owners[0]), 8)
+        for root in [root1, root2]:
+            self.assertEqual(owners[0][get_key_from_instance(root)], get_key_from_instance(root))
+            self.assertEqual(owners[1][get_key_from_instance(root)], get_key_from_instance(root))
+        self.assertEqual(owners[1][get_key_from_instance(root1.fkey)], get_key_from_instance(root1))
+
+    def test_collect_many_queries_shared_objects_once(self):
+        fkey = FKDummyModelFactory.create()
+        roots = BaseModelFactory.create_batch(fkey=fkey, size=10)
+
+        with CaptureQueriesContext(connection) as queries:
+            for root in roots:
+                BatchDeepCollector().collect(root)
+        collect_queries_count = len(queries)
+
+        collector = BatchDeepCollector()
+        with CaptureQueriesContext(connection) as queries:
+            collector.collect_many(roots)
+
+        self.assertEqual(len(list(collector.get_collected_objects())), 21)
+        self.assertLess(len(queries) * 5, collect_queries_count)
+
+
+class TestKeysOnlyCollect(TestCase):
+
+    def create_objects(self):
+        obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=3)
+        OneToOneToBaseModelFactory.create(o2oto=obj)
+        ManyToManyToBaseModelFactory.create(base_models=[obj, BaseModelFactory.create()])
+        ManyToManyToBaseModelWithRelatedNameFactory.create(base_models=[obj])
+        ChildModelFactory.create(fkey=obj.fkey)
+        GFKModel.objects.create(content_object=obj.fkey)
+        return obj
+
+    def test_collects_same_objects_with_same_queries(self):
+        obj = self.create_objects()
+
+        for collector_class in [DeepCollector, BatchDeepCollector]:
+            keys, excluded_fields, queries_count = collect_keys(collector_class, obj)
+            keys_only_keys, keys_only_excluded_fields, keys_only_queries_count = collect_keys(
+                collector_class, obj, KEYS_ONLY=True)
+
+            self.assertEqual(keys, keys_only_keys)
+            self.assertEqual(excluded_fields, keys_only_excluded_fields)
+            # Deferred columns are never loaded while collecting.
+            self.assertEqual(queries_count, keys_only_queries_count)
+
+    def test_collected_objects_are_loaded_by_model_when_asked_for(self):
+        obj = self.create_objects()
+
+        post_collected_objs = []
+
+        class PostCollectRecorder(BatchDeepCollector):
+            def post_collect(self, obj):
+                post_collected_objs.append(obj)
+                super(PostCollectRecorder, self).post_collect(obj)
+
+        collector = PostCollectRecorder()
+        collector.KEYS_ONLY = True
+        collector.LOAD_CHUNK_SIZE = 2
+        collector.collect(obj)
+
+        self.assertEqual(post_collected_objs, [])
+        self.assertTrue(all(value is None for value in collector.collected_objs.values()))
+
+        pks_by_model = {}
+        for model, pk in collector.collected_objs:
+            pks_by_model.setdefault(model, []).append(pk)
+        chunks_count = sum((len(pks) + 1) // 2 for pks in pks_by_model.values())
+
+        with self.assertNumQueries(chunks_count):
+            objs = list(collector.get_collected_objects())
+            # Collected objects are fully loaded.
+            names = [o.name for o in objs if isinstance(o, ForeignKeyToBaseModel)]
+            self.assertEqual(len(names), 3)
+            self.assertTrue(all(names))
+
+        self.assertEqual(set(get_key_from_instance(o) for o in objs),
+                         set(collector.get_collected_objects_by_key()))
+        self.assertEqual(post_collected_objs, objs)
+
+    def test_collected_objects_can_be_iterated_several_times(self):
+        obj = self.create_objects()
+
+        collector = BatchDeepCollector()
+        collector.KEYS_ONLY = True
+        collector.LOAD_CHUNK_SIZE = 2
+        collector.collect(obj)
+
+        objs = collector.get_collected_objects()
+        self.assertEqual(len(objs), len(collector.collected_objs))
+        with self.assertNumQueries(0):
+            self.assertEqual(list(objs), list(objs))
+
+        # Objects are only loaded while they are iterated.
+        with self.assertNumQueries(0):
+            objs_iterator = collector.iter_collected_objects()
+        with self.assertNumQueries(1):
+            next(objs_iterator)
+        self.assertEqual(len(list(objs_iterator)), len(objs) - 1)
+
+
+class TestDeferredFieldsCollect(TestCase):
+
+    def test_deferred_fields_are_loaded_in_bulk_when_collected_objects_are_asked_for(self):
+        obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=3)
+        ManyToManyToBaseModelFactory.create_batch(base_models=[obj], size=2)
+
+        for collector_class in [DeepCollector, BatchDeepCollector]:
+            keys, _, queries_count = collect_keys(collector_class, obj)
+            defer_fields = {'tests.foreignkeytobasemodel': ['name', 'fkeyto'], 'tests.manytomanytobasemodel': ['name']}
+            deferred_keys, _, deferred_queries_count = collect_keys(collector_class, obj, DEFER_FIELDS=defer_fields)
+            self.assertEqual(keys, deferred_keys)
+            self.assertEqual(queries_count, deferred_queries_count)
+
+            collector = collector_class()
+            collector.DEFER_FIELDS = defer_fields
+            collector.collect(BaseModel.objects.get(pk=obj.pk))
+
+            fkey_objs = [o for o in collector.collected_objs.values() if isinstance(o, ForeignKeyToBaseModel)]
+            self.assertEqual(len(fkey_objs), 3)
+            # Columns needed to follow relations are never deferred.
+            self.assertEqual([o.get_deferred_fields() for o in fkey_objs], [set(['name'])] * 3)
+
+            # A single query for every model having deferred fields.
+            with self.assertNumQueries(2):
+                objs = list(collector.get_collected_objects())
+                self.assertTrue(all(o.name for o in objs if isinstance(o, ForeignKeyToBaseModel)))
+            self.assertEqual(len(objs), len(keys))
+
+
+class ThreadRecordingCollector(BatchDeepCollector):
+    DEBUG = True
+
+    def __init__(self):
+        self.query_threads = set()
+
+    def query_foreign_key_objects_batch(self, objs, field):
+        self.query_threads.add(threading.current_thread())
+        return super(ThreadRecordingCollector, self).query_foreign_key_objects_batch(objs, field)
+
+    def query_related_objects_batch(self, *args):
+        self.query_threads.add(threading.current_thread())
+        return super(ThreadRecordingCollector, self).query_related_objects_batch(*args)
+
+
+# Worker threads use their own database connection, so they can only see committed data.
+class TestParallelCollect(TransactionTestCase):
+
+    def collect(self, root_obj, **parameters):
+        collector = build_collector(ThreadRecordingCollector, parameters)
+        collector.collect(root_obj.__class__._base_manager.get(pk=root_obj.pk))
+        return collector
+
+    def test_parallel_collect_is_the_same_as_sequential_collect(self):
+        obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=3)
+        OneToOneToBaseModelFactory.create(o2oto=obj)
+        ManyToManyToBaseModelFactory.create(base_models=[obj, BaseModelFactory.create()])
+        ManyToManyToBaseModelWithRelatedNameFactory.create(base_models=[obj])
+        GFKModel.objects.create(content_object=obj.fkey)
+
+        for parameters in [{}, {'MAXIMUM_RELATED_INSTANCES': 2}, {'USING': 'default', 'KEYS_ONLY': True}]:
+            collector = self.collect(obj, **parameters)
+            parallel_collector = self.collect(obj, WORKERS=4, **parameters)
+
+            self.assertEqual(collector.query_threads, set([threading.current_thread()]))
+            self.assertNotIn(threading.current_thread(), parallel_collector.query_threads)
+
+            self.assertEqual(set(collector.get_collected_objects_by_key()),
+                             set(parallel_collector.get_collected_objects_by_key()))
+            self.assertEqual(collector.get_report()['excluded_fields'],
+                             parallel_collector.get_report()['excluded_fields'])
+            # Events are recorded in the same order.
+            self.assertEqual([(event['type'], get_key_from_instance(event.get('obj')))
+                              for event in collector.get_report()['log']],
+                             [(event['type'], get_key_from_instance(event.get('obj')))
+                              for event in parallel_collector.get_report()['log']])
+
+    def test_errors_are_raised_in_collecting_thread(self):
+        obj = BaseModelFactory.create()
+
+        class FailingCollector(BatchDeepCollector):
+            def query_foreign_key_objects_batch(self, objs, field):
+                raise ValueError(field.name)
+
+        collector = FailingCollector()
+        collector.WORKERS = 4
+        with self.assertRaises(ValueError):
+            collector.collect(obj)
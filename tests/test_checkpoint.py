@@ -0,0 +1,105 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from deep_collector.batch import BatchDeepCollector
+from deep_collector.core import DeepCollector
+
+from .factories import BaseModelFactory, ManyToManyToBaseModelFactory
+
+
+class Interrupted(Exception):
+    pass
+
+
+def get_interrupted_collector_class(collector_class, objects_count):
+    """
+    Collector class that is interrupted when collecting its objects_count-th object.
+    """
+    class InterruptedCollector(collector_class):
+        def pre_collect(self, obj):
+            if len(self.collected_objs) >= objects_count:
+                raise Interrupted()
+            return super(InterruptedCollector, self).pre_collect(obj)
+
+    return InterruptedCollector
+
+
+class TestCheckpoint(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'checkpoint.json')
+        self.root = BaseModelFactory.create()
+        ManyToManyToBaseModelFactory.create_batch(base_models=[self.root], size=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertResumedCollectIsComplete(self, collector_class):
+        full_collector = collector_class()
+        with CaptureQueriesContext(connection) as full_queries:
+            full_collector.collect(self.root)
+
+        collector = get_interrupted_collector_class(collector_class, 3)()
+        collector.CHECKPOINT_PATH = self.path
+        collector.CHECKPOINT_INTERVAL = 0
+        with self.assertRaises(Interrupted):
+            collector.collect(self.root)
+
+        resumed_collector = collector_class()
+        resumed_collector.CHECKPOINT_PATH = self.path
+        with CaptureQueriesContext(connection) as resumed_queries:
+            resumed_collector.resume()
+
+        self.assertEqual(set(resumed_collector.collected_objs), set(full_collector.collected_objs))
+        self.assertEqual(resumed_collector.collected_objs_history, full_collector.collected_objs_history)
+        # Relations of objects collected before the checkpoint are not queried again.
+        self.assertLess(len(resumed_queries), len(full_queries))
+        self.assertEqual(set(resumed_collector.get_collected_objects()), set(full_collector.get_collected_objects()))
+
+    def test_resumed_collect_is_complete(self):
+        self.assertResumedCollectIsComplete(DeepCollector)
+
+    def test_resumed_batch_collect_is_complete(self):
+        self.assertResumedCollectIsComplete(BatchDeepCollector)
+
+    def test_truncated_batch_collect_is_resumed(self):
+        full_collector = BatchDeepCollector()
+        full_collector.collect(self.root)
+
+        collector = BatchDeepCollector()
+        collector.MAX_QUERIES = 1
+        collector.CHECKPOINT_PATH = self.path
+        collector.collect(self.root)
+        # Objects of the first level are collected, but most of their relations haven't been queried.
+        self.assertTrue(collector.get_report()['unexplored_relations'])
+
+        resumed_collector = BatchDeepCollector()
+        resumed_collector.resume(self.path)
+
+        self.assertEqual(set(resumed_collector.collected_objs), set(full_collector.collected_objs))
+        self.assertNotIn('unexplored_relations', resumed_collector.get_report())
+
+    def test_checkpoint_is_saved_at_the_end_of_collect(self):
+        collector = DeepCollector()
+        collector.CHECKPOINT_PATH = self.path
+        collector.collect(self.root)
+
+        with open(self.path) as stream:
+            state = json.load(stream)
+        self.assertEqual(state['roots'], [['tests.basemodel', self.root.pk]])
+        self.assertEqual(state['objects_to_collect'], [])
+        self.assertEqual(len(state['collected_objs']), len(collector.collected_objs))
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+        # Nothing is left to collect: roots are the only objects loaded again.
+        resumed_collector = DeepCollector()
+        with self.assertNumQueries(1):
+            resumed_collector.resume(self.path)
+        self.assertEqual(set(resumed_collector.collected_objs), set(collector.collected_objs))
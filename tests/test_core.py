@@ -1,4 +1,5 @@
 
+from django.db.models.signals import post_init
 from django.test import TestCase
 
 from .factories import (BaseModelFactory, ManyToManyToBaseModelFactory,
@@ -258,6 +259,41 @@ class TestCollectorParameters(TestCase):
         }, collector.get_report()['excluded_fields'][0])
 
 
+class TestThresholdQueries(TestCase):
+
+    def test_related_objects_are_not_all_loaded_if_there_are_too_many_of_them(self):
+        obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=3)
+        m2m_model = ManyToManyToBaseModelFactory.create(base_models=[obj] + BaseModelFactory.create_batch(3))
+
+        loaded_instances = []
+
+        def count_loaded_instances(sender, instance, **kwargs):
+            loaded_instances.append(instance)
+
+        post_init.connect(count_loaded_instances, sender=ForeignKeyToBaseModel)
+        post_init.connect(count_loaded_instances, sender=BaseModel)
+        try:
+            collector = DeepCollector()
+            collector.MAXIMUM_RELATED_INSTANCES = 1
+            collector.collect(m2m_model)
+        finally:
+            post_init.disconnect(count_loaded_instances, sender=ForeignKeyToBaseModel)
+            post_init.disconnect(count_loaded_instances, sender=BaseModel)
+
+        # Only max_count + 1 related objects are loaded to know we are over the threshold, then they are counted.
+        self.assertEqual(len(loaded_instances), 2)
+        self.assertTrue(all(isinstance(instance, BaseModel) for instance in loaded_instances))
+        self.assertEqual(list(collector.get_collected_objects()), [m2m_model])
+        self.assertDictEqual({
+            'parent_instance': u'tests.manytomanytobasemodel.%s' % m2m_model.pk,
+            'field_name': u'm2m',
+            'related_model': u'tests.basemodel',
+            'count': 4,
+            'max_count': 1,
+        }, collector.get_report()['excluded_fields'][0])
+
+
 class TestPostCollect(TestCase):
     @staticmethod
     def _generate_invalid_id(model):
@@ -329,6 +365,81 @@ class TestGFKRelation(TestCase):
         self.assertNotIn(gfkmodel2, collector.get_collected_objects())
 
 
+class TestCollectedObjectsRegistry(TestCase):
+
+    def test_objects_are_registered_by_model_and_primary_key(self):
+        obj = BaseModelFactory.create()
+
+        collector = DeepCollector()
+        collector.collect(obj)
+        self.assertIs(collector.collected_objs[(BaseModel, obj.pk)], obj)
+        self.assertEqual(collector.collected_objs_history[BaseModel], 1)
+
+    def test_string_keys_are_still_available(self):
+        obj = BaseModelFactory.create()
+
+        collector = DeepCollector()
+        collector.DEBUG = True
+        collector.collect(obj)
+        collected_objs = collector.get_collected_objects_by_key()
+        self.assertIs(collected_objs['tests.basemodel.%s' % obj.pk], obj)
+        self.assertIn('tests.fkdummymodel.%s' % obj.fkey.pk, collected_objs)
+        self.assertNotIn('tests.fkdummymodel.%s' % (obj.fkey.pk + 1), collected_objs)
+        self.assertNotIn('tests.fkdummymodel.not-a-pk', collected_objs)
+        self.assertNotIn('tests.unknownmodel.1', collected_objs)
+        self.assertNotIn('tests.basemodel', collected_objs)
+        self.assertEqual(collector.get_report()['collected_objects_history'], {
+            'tests.basemodel': 1,
+            'tests.fkdummymodel': 1,
+            'tests.o2odummymodel': 1,
+        })
+
+
+class TestCollectMany(TestCase):
+
+    def test_objects_are_collected_once_and_belong_to_their_first_root(self):
+        root1 = BaseModelFactory.create()
+        root2 = BaseModelFactory.create(fkey=root1.fkey)
+        other = BaseModelFactory.create(fkey=root1.fkey)
+
+        collector = DeepCollector()
+        collector.collect_many([root1, root2])
+
+        collected_objs = list(collector.get_collected_objects())
+        self.assertEqual(len(collected_objs), 5)
+        self.assertIn(root1, collected_objs)
+        self.assertIn(root2, collected_objs)
+        # Objects of the same type as roots are not collected, unless they are roots.
+        self.assertNotIn(other, collected_objs)
+
+        self.assertIs(collector.get_root(root1.fkey), root1)
+        self.assertIs(collector.get_root(root2), root2)
+        self.assertIs(collector.get_root(root2.o2o), root2)
+        objs_by_root = collector.get_collected_objects_by_root()
+        self.assertEqual([root for root, _ in objs_by_root], [root1, root2])
+        self.assertEqual(set(objs_by_root[0][1]), set([root1, root1.fkey, root1.o2o]))
+        self.assertEqual(set(objs_by_root[1][1]), set([root2, root2.o2o]))
+
+    def test_foreign_keys_are_set_to_the_root_objects_belong_to(self):
+        root1 = InvalidFKRootModel.objects.create()
+        root2 = InvalidFKRootModel.objects.create()
+        other = InvalidFKRootModel.objects.create()
+        non_root1 = InvalidFKNonRootModel.objects.create(valid_fk=root1, invalid_fk=root2)
+        non_root2 = InvalidFKNonRootModel.objects.create(valid_fk=root2, invalid_fk=other)
+
+        collector = DeepCollector()
+        collector.collect_many([root1, root2])
+
+        collected_objs = collector.get_collected_objects_by_key()
+        non_root1 = collected_objs['tests.invalidfknonrootmodel.%s' % non_root1.pk]
+        non_root2 = collected_objs['tests.invalidfknonrootmodel.%s' % non_root2.pk]
+        # Foreign keys referring to one of the roots are kept.
+        self.assertEqual(non_root1.valid_fk_id, root1.pk)
+        self.assertEqual(non_root1.invalid_fk_id, root2.pk)
+        self.assertEqual(non_root2.valid_fk_id, root2.pk)
+        self.assertEqual(non_root2.invalid_fk_id, root2.pk)
+
+
 class TestBackwardCompatibility(TestCase):
 
     def test_get_foreign_key_object(self):
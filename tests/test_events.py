@@ -0,0 +1,143 @@
+import json
+import logging
+
+from django.test import TestCase
+
+from deep_collector.batch import BatchDeepCollector
+from deep_collector.compat.builtins import StringIO
+from deep_collector.core import DeepCollector
+from deep_collector.events import JSONLinesSink, ListSink, LoggingSink, RingBufferSink
+
+from .factories import BaseModelFactory, ForeignKeyToBaseModelFactory
+
+
+def fail_on_event(**kwargs):
+    raise AssertionError('No event should be built without any sink')
+
+
+class EventRecordingCollector(DeepCollector):
+    def __init__(self, *args, **kwargs):
+        super(EventRecordingCollector, self).__init__(*args, **kwargs)
+        self.events = []
+
+    def emit_event(self, **kwargs):
+        self.events.append(kwargs)
+
+
+class BatchEventRecordingCollector(BatchDeepCollector):
+    def __init__(self, *args, **kwargs):
+        super(BatchEventRecordingCollector, self).__init__(*args, **kwargs)
+        self.events = []
+
+    def emit_event(self, **kwargs):
+        self.events.append(kwargs)
+
+
+class VendoredEventRecordingCollector(DeepCollector):
+    # As if it was defined in a copy of this package.
+    __module__ = 'deep_collector.vendored'
+
+    def __init__(self, *args, **kwargs):
+        super(VendoredEventRecordingCollector, self).__init__(*args, **kwargs)
+        self.events = []
+
+    def emit_event(self, **kwargs):
+        self.events.append(kwargs)
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestEvents(TestCase):
+
+    def setUp(self):
+        self.obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=self.obj, size=3)
+
+    def test_events_are_not_built_without_any_sink(self):
+        for collector_class in (DeepCollector, BatchDeepCollector):
+            collector = collector_class()
+            # Only the class method is checked to tell if emit_event is overridden.
+            collector.emit_event = fail_on_event
+            collector.collect(self.obj)
+
+            self.assertFalse(collector.emits_events)
+            self.assertEqual(len(collector.collected_objs), 6)
+
+    def test_overridden_emit_event_gets_events_without_any_sink(self):
+        for collector_class in (EventRecordingCollector, BatchEventRecordingCollector, VendoredEventRecordingCollector):
+            collector = collector_class()
+            collector.collect(self.obj)
+
+            self.assertTrue(collector.emits_events)
+            collected_events = [event for event in collector.events if event['type'] == 'object_collected']
+            self.assertEqual(len(collected_events), 6)
+
+    def test_ring_buffer_sink_keeps_last_serialized_events(self):
+        for collector_class in (DeepCollector, BatchDeepCollector):
+            all_events = ListSink()
+            last_events = RingBufferSink(size=5)
+            collector = collector_class()
+            collector.EVENT_SINKS = [all_events, last_events]
+            collector.collect(self.obj)
+
+            self.assertGreater(len(all_events.events), 5)
+            self.assertEqual(len(last_events.events), 5)
+            self.assertEqual([event['type'] for event in last_events.events],
+                             [event['type'] for event in all_events.events[-5:]])
+            # Collected objects count is only emitted once, at the end of the collect.
+            history_events = [event for event in all_events.events if event['type'] == 'object_collect_history']
+            self.assertEqual(len(history_events), 1)
+            self.assertEqual(history_events[0]['objs']['tests.foreignkeytobasemodel'], 3)
+            self.assertEqual(last_events.events[-1], history_events[0])
+
+            collected_events = [event for event in last_events.events if event['type'] == 'object_collected']
+            for event in collected_events:
+                self.assertIn(event['obj'], collector.get_collected_objects_by_key())
+
+    def test_json_lines_and_logging_sinks(self):
+        stream = StringIO()
+        handler = RecordingHandler()
+        logger = logging.getLogger('tests.events')
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        try:
+            collector = DeepCollector()
+            collector.EVENT_SINKS = [JSONLinesSink(stream), LoggingSink(logger, level=logging.INFO)]
+            collector.EVENT_TYPES = ['object_collected']
+            collector.collect(self.obj)
+        finally:
+            logger.removeHandler(handler)
+
+        events = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(len(events), 6)
+        self.assertEqual(events[0], {'type': 'object_collected', 'obj': 'tests.basemodel.%s' % self.obj.pk,
+                                     'parent': None})
+        self.assertEqual([json.loads(message) for message in handler.messages], events)
+
+    def test_event_sampling(self):
+        sink = ListSink()
+        collector = DeepCollector()
+        collector.EVENT_SINKS = [sink]
+        collector.EVENT_TYPES = ['object_collected']
+        collector.EVENT_SAMPLING = 4
+        collector.collect(self.obj)
+
+        # Events 1 and 5 out of 6 collected objects.
+        self.assertEqual(len(sink.events), 2)
+        self.assertIsNone(sink.events[0]['parent'])
+
+    def test_debug_log_is_still_in_report(self):
+        collector = DeepCollector()
+        collector.DEBUG = True
+        collector.collect(self.obj)
+
+        log = collector.get_report()['log']
+        self.assertEqual(log, collector.saved_log)
+        self.assertEqual(len([event for event in log if event['type'] == 'object_collected']), 6)
@@ -0,0 +1,139 @@
+import json
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from deep_collector.compat.builtins import StringIO
+from deep_collector.incremental import IncrementalDeepCollector, read_manifest, write_manifest
+
+from .factories import BaseModelFactory, ManyToManyToBaseModelFactory
+from .models import BaseModel, Customer, Order, OrderLine
+
+
+class CustomerCollector(IncrementalDeepCollector):
+    CHANGED_SINCE_FIELDS = {
+        'tests.customer': 'updated_at',
+        'tests.order': 'updated_at',
+        'tests.orderline': 'updated_at',
+    }
+
+
+class TestIncrementalDeepCollector(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='customer')
+        self.order1 = Order.objects.create(name='order1', customer=self.customer)
+        self.order2 = Order.objects.create(name='order2', customer=self.customer)
+        self.order3 = Order.objects.create(name='order3', customer=self.customer)
+        self.line1 = OrderLine.objects.create(name='line1', order=self.order1)
+        self.line2 = OrderLine.objects.create(name='line2', order=self.order2)
+
+        collector = CustomerCollector()
+        collector.collect(self.customer)
+        self.first_delta = collector.get_delta()
+
+        # Manifests are JSON serializable.
+        stream = StringIO()
+        write_manifest(collector.get_manifest(), stream)
+        stream.seek(0)
+        self.manifest = read_manifest(stream)
+
+    def collect_changes(self):
+        collector = CustomerCollector()
+        collector.collect_changes(self.customer, self.manifest)
+        return collector
+
+    def test_first_collect_upserts_every_object(self):
+        self.assertEqual(set(self.first_delta['upserts']),
+                         set([self.customer, self.order1, self.order2, self.order3, self.line1, self.line2]))
+        self.assertEqual(self.first_delta['deletes'], [])
+
+    def test_unchanged_objects_relations_are_not_queried(self):
+        full_collector = CustomerCollector()
+        with CaptureQueriesContext(connection) as full_queries:
+            full_collector.collect(self.customer)
+
+        with CaptureQueriesContext(connection) as incremental_queries:
+            collector = self.collect_changes()
+        self.assertEqual(collector.get_delta(), {'upserts': [], 'deletes': []})
+
+        self.assertEqual(set(collector.collected_objs), set(full_collector.collected_objs))
+        # Unchanged orders and lines are not even loaded.
+        self.assertLess(len(incremental_queries), len(full_queries))
+        self.assertEqual(set(collector.get_collected_objects()),
+                         set([self.customer, self.order1, self.order2, self.order3, self.line1, self.line2]))
+
+    def test_delta_has_changed_new_and_deleted_objects(self):
+        self.order2.name = 'changed'
+        self.order2.save()
+        new_line = OrderLine.objects.create(name='new line', order=self.order1)
+        new_order = Order.objects.create(name='new order', customer=self.customer)
+        new_order_line = OrderLine.objects.create(name='new order line', order=new_order)
+        line2_pk = self.line2.pk
+        self.line2.delete()
+
+        collector = self.collect_changes()
+        delta = collector.get_delta()
+
+        # Objects newly reachable through changed objects are collected.
+        self.assertEqual(set(delta['upserts']), set([self.order2, new_line, new_order, new_order_line]))
+        self.assertEqual(delta['deletes'], [(OrderLine, line2_pk)])
+
+        stream = StringIO()
+        collector.write_json_delta(stream)
+        written_delta = json.loads(stream.getvalue())
+        self.assertEqual(len(written_delta['upserts']), 4)
+        self.assertEqual(written_delta['deletes'], [['tests.orderline', line2_pk]])
+
+    def test_deleted_unchanged_objects_are_deleted(self):
+        line1_pk = self.line1.pk
+        self.line1.delete()
+
+        collector = self.collect_changes()
+
+        self.assertEqual(collector.get_delta(), {'upserts': [], 'deletes': [(OrderLine, line1_pk)]})
+        self.assertNotIn(self.line1, collector.get_collected_objects())
+        self.assertNotIn(['tests.orderline', line1_pk], [entry[:2] for entry in collector.get_manifest()['objects']])
+
+    def test_objects_moved_to_another_object_are_not_collected_from_the_previous_one(self):
+        other_customer = Customer.objects.create(name='other customer')
+        self.order2.customer = other_customer
+        self.order2.save()
+
+        collector = self.collect_changes()
+
+        self.assertNotIn((Order, self.order2.pk), collector.collected_objs)
+        self.assertEqual(set(collector.get_delta()['deletes']),
+                         set([(Order, self.order2.pk), (OrderLine, self.line2.pk)]))
+
+
+class TestVersions(TestCase):
+
+    def setUp(self):
+        self.obj = BaseModelFactory.create()
+        self.m2m_objs = ManyToManyToBaseModelFactory.create_batch(base_models=[self.obj], size=5)
+
+        collector = IncrementalDeepCollector()
+        collector.collect(self.obj)
+        self.manifest = collector.get_manifest()
+
+    def get_delta(self):
+        collector = IncrementalDeepCollector()
+        collector.collect_changes(BaseModel.objects.get(pk=self.obj.pk), self.manifest)
+        with CaptureQueriesContext(connection) as queries:
+            delta = collector.get_delta()
+        return delta, len(queries)
+
+    def test_versions_are_computed_without_a_query_for_every_object(self):
+        delta, queries_count = self.get_delta()
+
+        self.assertEqual(delta, {'upserts': [], 'deletes': []})
+        # Many to many relations of all the m2m objects, with a single query.
+        self.assertEqual(queries_count, 1)
+
+    def test_many_to_many_changes_are_in_the_delta(self):
+        self.m2m_objs[0].m2m.add(BaseModelFactory.create())
+
+        delta, _ = self.get_delta()
+        self.assertEqual(delta['upserts'], [self.m2m_objs[0]])
@@ -0,0 +1,75 @@
+from django.test import TestCase
+
+from deep_collector.batch import BatchDeepCollector
+from deep_collector.core import DeepCollector
+
+from .factories import BaseModelFactory, ForeignKeyToBaseModelFactory, ManyToManyToBaseModelFactory
+from .models import BaseModel, ForeignKeyToBaseModel
+
+
+class TestIterCollect(TestCase):
+
+    def setUp(self):
+        self.obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=self.obj, size=5)
+        ManyToManyToBaseModelFactory.create(base_models=[self.obj])
+
+        full_collector = DeepCollector()
+        full_collector.collect(self.obj)
+        self.full_keys = set(full_collector.collected_objs)
+
+    def get_root(self):
+        return BaseModel.objects.get(pk=self.obj.pk)
+
+    def test_iter_collect(self):
+        for collector_class in (DeepCollector, BatchDeepCollector):
+            collector = collector_class()
+            objs = list(collector.iter_collect(self.get_root()))
+
+            self.assertEqual(len(objs), len(self.full_keys))
+            self.assertEqual(set((obj.__class__, obj.pk) for obj in objs), self.full_keys)
+            self.assertEqual(set(obj.pk for obj in collector.get_collected_objects()),
+                             set(obj.pk for obj in objs))
+
+    def test_objects_are_yielded_while_collecting(self):
+        for collector_class in (DeepCollector, BatchDeepCollector):
+            collector = collector_class()
+            collector.LOAD_CHUNK_SIZE = 2
+            collected_counts = []
+            batches = []
+            for model, objs in collector.iter_collect_batches([self.get_root()]):
+                collected_counts.append(len(collector.collected_objs))
+                batches.append((model, objs))
+
+            self.assertLess(collected_counts[0], len(self.full_keys))
+            self.assertEqual(collected_counts[-1], len(self.full_keys))
+            for model, objs in batches:
+                self.assertLessEqual(len(objs), 2)
+                self.assertTrue(all(obj.__class__ is model for obj in objs))
+
+    def test_keys_only_objects_are_loaded_before_being_yielded(self):
+        for collector_class in (DeepCollector, BatchDeepCollector):
+            collector = collector_class()
+            collector.KEYS_ONLY = True
+            objs = list(collector.iter_collect(self.get_root()))
+
+            self.assertEqual(set((obj.__class__, obj.pk) for obj in objs), self.full_keys)
+            self.assertTrue(all(value is None for value in collector.collected_objs.values()))
+            fk_objs = [obj for obj in objs if isinstance(obj, ForeignKeyToBaseModel)]
+            self.assertEqual(len(fk_objs), 5)
+            with self.assertNumQueries(0):
+                self.assertTrue(all(obj.name for obj in fk_objs))
+
+    def test_consumer_queries_are_not_counted(self):
+        collector = DeepCollector()
+        collector.PROFILE = True
+        collector.collect(self.get_root())
+        queries_count = collector.get_report()['queries']
+
+        collector = DeepCollector()
+        collector.PROFILE = True
+        collector.LOAD_CHUNK_SIZE = 2
+        for _ in collector.iter_collect(self.get_root()):
+            BaseModel.objects.count()
+
+        self.assertEqual(collector.get_report()['queries'], queries_count)
@@ -0,0 +1,80 @@
+from django.test import TestCase
+
+from deep_collector.batch import BatchDeepCollector
+from deep_collector.core import DeepCollector
+
+from .factories import BaseModelFactory, ForeignKeyToBaseModelFactory, ManyToManyToBaseModelFactory
+
+
+class TestCollectLimits(TestCase):
+
+    def setUp(self):
+        self.obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=self.obj, size=3)
+        ManyToManyToBaseModelFactory.create(base_models=[self.obj])
+
+        full_collector = DeepCollector()
+        full_collector.collect(self.obj)
+        self.full_keys = set(full_collector.collected_objs)
+
+    def test_collect_is_not_truncated_under_limits(self):
+        collector = DeepCollector()
+        collector.MAX_QUERIES = 100
+        collector.MAX_DURATION = 60
+        collector.MAX_COLLECTED_OBJECTS = 100
+        collector.collect(self.obj)
+
+        self.assertEqual(set(collector.collected_objs), self.full_keys)
+        self.assertNotIn('truncated', collector.get_report())
+
+    def test_max_collected_objects(self):
+        for collector_class in (DeepCollector, BatchDeepCollector):
+            collector = collector_class()
+            collector.MAX_COLLECTED_OBJECTS = 2
+            collector.collect(self.obj)
+
+            self.assertEqual(len(collector.collected_objs), 2)
+            self.assertTrue(set(collector.collected_objs) < self.full_keys)
+            report = collector.get_report()
+            self.assertEqual(report['truncated']['reason'], 'max_collected_objects')
+            self.assertEqual(report['truncated']['collected_objects'], 2)
+            # Every object that hasn't been collected is either unexplored, or related to an unexplored relation.
+            unexplored_keys = set(unexplored['object'] for unexplored in report['unexplored_objects'])
+            self.assertTrue(unexplored_keys)
+            self.assertFalse(unexplored_keys & set(collector.get_collected_objects_by_key()))
+
+    def test_max_queries(self):
+        collector = DeepCollector()
+        collector.MAX_QUERIES = 2
+        collector.collect(self.obj)
+
+        report = collector.get_report()
+        self.assertEqual(report['truncated']['reason'], 'max_queries')
+        self.assertGreaterEqual(report['truncated']['queries'], 2)
+        self.assertTrue(set(collector.collected_objs) < self.full_keys)
+        self.assertTrue(report['unexplored_objects'])
+
+    def test_max_queries_stops_relation_queries_of_a_level(self):
+        collector = BatchDeepCollector()
+        collector.MAX_QUERIES = 1
+        collector.collect(self.obj)
+
+        report = collector.get_report()
+        self.assertEqual(report['truncated']['reason'], 'max_queries')
+        self.assertEqual(list(collector.collected_objs), [(self.obj.__class__, self.obj.pk)])
+        unexplored_fields = set(relation['field'] for relation in report['unexplored_relations'])
+        self.assertIn('foreignkeytobasemodel_set', unexplored_fields)
+        self.assertEqual(set(relation['object'] for relation in report['unexplored_relations']),
+                         set(['tests.basemodel.%s' % self.obj.pk]))
+
+    def test_max_duration(self):
+        collector = BatchDeepCollector()
+        collector.MAX_DURATION = 0
+        collector.collect(self.obj)
+
+        report = collector.get_report()
+        self.assertEqual(report['truncated']['reason'], 'max_duration')
+        self.assertEqual(len(collector.collected_objs), 0)
+        self.assertEqual(report['unexplored_objects'], [
+            {'parent': None, 'object': 'tests.basemodel.%s' % self.obj.pk},
+        ])
@@ -0,0 +1,111 @@
+import json
+
+from django.test import TestCase
+
+from deep_collector.batch import BatchDeepCollector
+from deep_collector.compat.builtins import StringIO
+from deep_collector.compat.serializers import PrefetchedM2MSerializer
+from deep_collector.core import DeepCollector
+from deep_collector.pipeline import PipelinedExport
+
+from .factories import (BaseModelFactory, ChildModelFactory, ForeignKeyToBaseModelFactory,
+                        ManyToManyToBaseModelFactory, ManyToManyToBaseModelWithRelatedNameFactory)
+from .models import BaseModel, M2MThroughTargetModel, ManyToManyThroughModel, ManyToManyWithThroughModel
+
+
+class FailingStream(object):
+    def write(self, data):
+        raise IOError('No space left on device')
+
+
+class FailingCollector(DeepCollector):
+    def post_collect(self, obj):
+        if len(self.collected_objs) > 3:
+            raise ValueError('Collect failed')
+        super(FailingCollector, self).post_collect(obj)
+
+
+def sort_objects(output):
+    return sorted(json.loads(output), key=lambda obj: (obj['model'], obj['pk']))
+
+
+class TestPipelinedExport(TestCase):
+
+    def setUp(self):
+        self.obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=self.obj, size=5)
+        ManyToManyToBaseModelFactory.create_batch(base_models=[self.obj, BaseModelFactory.create()], size=3)
+        ManyToManyToBaseModelWithRelatedNameFactory.create(base_models=[self.obj])
+        ChildModelFactory.create(fkey=self.obj.fkey)
+
+    def get_root(self):
+        return BaseModel.objects.get(pk=self.obj.pk)
+
+    def test_pipelined_export_is_the_same_as_serialization(self):
+        for collector_class in (DeepCollector, BatchDeepCollector):
+            for keys_only in (False, True):
+                collector = collector_class()
+                collector.KEYS_ONLY = keys_only
+                collector.collect(self.get_root())
+                expected_stream = StringIO()
+                collector.write_json_serialized_objects(expected_stream)
+
+                collector = collector_class()
+                collector.KEYS_ONLY = keys_only
+                collector.LOAD_CHUNK_SIZE = 2
+                stream = StringIO()
+                stats = PipelinedExport(collector, queue_size=1).run([self.get_root()], stream)
+
+                self.assertEqual(sort_objects(stream.getvalue()), sort_objects(expected_stream.getvalue()))
+                self.assertEqual(stats['objects'], len(collector.collected_objs))
+                self.assertGreater(stats['batches'], 1)
+                m2m_objs = [obj for obj in json.loads(stream.getvalue()) if obj['model'] == 'tests.manytomanytobasemodel']
+                self.assertEqual(len(m2m_objs), 3)
+                self.assertEqual(len(m2m_objs[0]['fields']['m2m']), 2)
+
+    def test_m2m_with_custom_through_model_is_not_serialized(self):
+        obj = ManyToManyWithThroughModel.objects.create(name='source')
+        for position in range(2):
+            target = M2MThroughTargetModel.objects.create(name='target%s' % position)
+            ManyToManyThroughModel.objects.create(source=obj, target=target, position=position)
+
+        collector = BatchDeepCollector()
+        collector.collect(obj)
+        expected_stream = StringIO()
+        collector.write_json_serialized_objects(expected_stream)
+
+        stream = StringIO()
+        PipelinedExport(BatchDeepCollector()).run([ManyToManyWithThroughModel.objects.get(pk=obj.pk)], stream)
+        self.assertEqual(sort_objects(stream.getvalue()), sort_objects(expected_stream.getvalue()))
+        objs = sort_objects(stream.getvalue())
+        self.assertEqual([obj['model'] for obj in objs].count('tests.manytomanythroughmodel'), 2)
+        source_objs = [obj for obj in objs if obj['model'] == 'tests.manytomanywiththroughmodel']
+        self.assertNotIn('m2m', source_objs[0]['fields'])
+
+        # Even when it is prefetched: relations are in through objects.
+        prefetched_stream = StringIO()
+        PrefetchedM2MSerializer().serialize(ManyToManyWithThroughModel.objects.prefetch_related('m2m'),
+                                            stream=prefetched_stream)
+        self.assertEqual(json.loads(prefetched_stream.getvalue()), source_objs)
+
+    def test_prefetched_objects_are_not_kept(self):
+        collector = BatchDeepCollector()
+        PipelinedExport(collector).run([self.get_root()], StringIO())
+
+        for obj in collector.get_collected_objects():
+            self.assertFalse(getattr(obj, '_prefetched_objects_cache', None))
+
+    def test_serializer_errors_are_raised(self):
+        collector = DeepCollector()
+        collector.LOAD_CHUNK_SIZE = 1
+
+        with self.assertRaises(IOError):
+            PipelinedExport(collector, queue_size=1).run([self.get_root()], FailingStream())
+
+    def test_collector_errors_are_raised(self):
+        stream = StringIO()
+
+        with self.assertRaises(ValueError):
+            PipelinedExport(FailingCollector(), queue_size=1).run([self.get_root()], stream)
+        # The fixture is not terminated.
+        self.assertFalse(stream.getvalue().endswith(']'))
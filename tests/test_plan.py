@@ -0,0 +1,51 @@
+from django.test import TestCase
+
+from deep_collector.core import DeepCollector
+
+from .factories import BaseModelFactory
+from .models import BaseModel, BaseToGFKModel, GFKModel
+
+
+class CustomCollector(DeepCollector):
+    pass
+
+
+class TestRelationPlan(TestCase):
+
+    def test_plan_lists_every_followed_relation(self):
+        plan = DeepCollector().get_relation_plan(BaseModel).as_dict()
+
+        self.assertEqual(plan['model'], 'tests.basemodel')
+        self.assertEqual(plan['foreign_keys'], ['fkey', 'o2o'])
+        self.assertEqual(plan['m2m_fields'], [])
+        self.assertEqual(sorted(plan['related_fields']), ['childmodel', 'foreignkeytobasemodel_set',
+                                                          'onetoonetobasemodel', 'subclassofbasemodel'])
+        self.assertEqual(sorted(plan['related_m2m_fields']), ['custom_related_m2m_name', 'manytomanytobasemodel_set'])
+        self.assertEqual(DeepCollector().get_relation_plan(GFKModel).as_dict()['generic_foreign_keys'],
+                         ['content_object'])
+        self.assertEqual(DeepCollector().get_relation_plan(BaseToGFKModel).as_dict()['generic_relations'],
+                         ['gfk_relation'])
+
+    def test_plan_is_shared_between_objects_and_collectors_of_the_same_class(self):
+        obj = BaseModelFactory.create()
+        collector = DeepCollector()
+        collector.collect(obj)
+
+        plan = collector.get_relation_plan(obj)
+        self.assertIs(plan, collector.get_relation_plan(BaseModelFactory.create()))
+        self.assertIs(plan, DeepCollector().get_relation_plan(BaseModel))
+        self.assertIsNot(plan, CustomCollector().get_relation_plan(BaseModel))
+
+    def test_plan_is_invalidated_when_exclusion_parameters_change(self):
+        obj = BaseModelFactory.create()
+        collector = DeepCollector()
+        collector.collect(obj)
+        self.assertIn('fkey', collector.get_relation_plan(BaseModel).as_dict()['foreign_keys'])
+
+        collector.EXCLUDE_DIRECT_FIELDS = {'tests.basemodel': ['fkey']}
+        collector.EXCLUDE_RELATED_FIELDS = {'tests.basemodel': ['childmodel']}
+        collector.collect(obj)
+        plan = collector.get_relation_plan(BaseModel).as_dict()
+        self.assertNotIn('fkey', plan['foreign_keys'])
+        self.assertNotIn('childmodel', plan['related_fields'])
+        self.assertNotIn(obj.fkey, collector.get_collected_objects())
@@ -0,0 +1,214 @@
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from deep_collector.batch import BatchDeepCollector
+from deep_collector.testing import CollectQueriesTestMixin
+
+from .factories import (BaseModelFactory, ChildModelFactory, ClassLevel3Factory, ForeignKeyToBaseModelFactory,
+                        ManyToManyToBaseModelFactory, ManyToManyToBaseModelWithRelatedNameFactory,
+                        OneToOneToBaseModelFactory)
+from .models import BaseToGFKModel, GFKModel
+
+
+# Every relation of a BaseModel object that has nothing related makes a query.
+BASE_MODEL_QUERIES = {
+    'tests.basemodel.childmodel': 1,
+    'tests.basemodel.custom_related_m2m_name': 1,
+    'tests.basemodel.fkey': 1,
+    'tests.basemodel.foreignkeytobasemodel_set': 1,
+    'tests.basemodel.manytomanytobasemodel_set': 1,
+    'tests.basemodel.o2o': 1,
+    'tests.basemodel.onetoonetobasemodel': 1,
+    'tests.basemodel.subclassofbasemodel': 1,
+    'tests.fkdummymodel.basemodel_set': 1,
+}
+
+
+def get_queries(base_model_factor=1, **relation_queries):
+    queries = dict((relation, count * base_model_factor) for relation, count in BASE_MODEL_QUERIES.items())
+    queries.update(('tests.%s' % relation.replace('__', '.'), count) for relation, count in relation_queries.items())
+    return queries
+
+
+# The batch collector queries every relation once for all BaseModel objects of a level, whatever their number, but
+# reverse relations of their dummy models make more queries than with the depth-first collector.
+BATCH_BASE_MODEL_QUERIES = dict(BASE_MODEL_QUERIES, **{
+    'tests.fkdummymodel.basemodel_set': 2,
+    'tests.o2odummymodel.basemodel': 1,
+})
+
+
+def get_batch_queries(**relation_queries):
+    queries = dict(BATCH_BASE_MODEL_QUERIES)
+    queries.update(('tests.%s' % relation.replace('__', '.'), count) for relation, count in relation_queries.items())
+    return queries
+
+
+class TestCollectQueries(CollectQueriesTestMixin, TestCase):
+
+    def test_fk_chain(self):
+        obj = ClassLevel3Factory.create()
+
+        self.assertCollectQueries(obj, {
+            'tests.classlevel1.classlevel2_set': 1,
+            'tests.classlevel2.classlevel3_set': 1,
+            'tests.classlevel2.fkey': 1,
+            'tests.classlevel3.fkey': 1,
+        }, total=4)
+
+    def test_reverse_fk(self):
+        obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=3)
+
+        # Related objects are loaded by a single query, and their fkeyto (the root) is already collected.
+        self.assertCollectQueries(obj, get_queries(), total=9)
+
+    def test_o2o(self):
+        obj = BaseModelFactory.create()
+        OneToOneToBaseModelFactory.create(o2oto=obj)
+
+        self.assertCollectQueries(obj, get_queries(), total=9)
+
+    def test_m2m(self):
+        obj = ManyToManyToBaseModelFactory.create(base_models=BaseModelFactory.create_batch(2))
+
+        self.assertCollectQueries(obj, get_queries(base_model_factor=2, manytomanytobasemodel__m2m=1), total=19)
+        self.assertCollectQueries(obj.m2m.all()[0], get_queries(manytomanytobasemodel__m2m=1), total=10)
+
+    def test_m2m_with_related_name(self):
+        obj = ManyToManyToBaseModelWithRelatedNameFactory.create(base_models=BaseModelFactory.create_batch(2))
+
+        self.assertCollectQueries(obj, get_queries(base_model_factor=2, manytomanytobasemodelwithrelatedname__m2m=1),
+                                  total=19)
+        self.assertCollectQueries(obj.m2m.all()[0], get_queries(manytomanytobasemodelwithrelatedname__m2m=1),
+                                  total=10)
+
+    def test_gfk(self):
+        obj = GFKModel.objects.create(content_object=BaseModelFactory.create())
+
+        queries = get_queries(gfkmodel__content_object=2, gfkmodel__content_type=1)
+        queries['contenttypes.contenttype.gfkmodel_set'] = 1
+        self.assertCollectQueries(obj, queries, total=13)
+
+    def test_generic_relation(self):
+        obj = BaseToGFKModel.objects.create()
+        GFKModel.objects.create(content_object=obj)
+        GFKModel.objects.create(content_object=obj)
+
+        self.assertCollectQueries(obj, {
+            'contenttypes.contenttype.gfkmodel_set': 2,
+            'tests.basetogfkmodel.gfk_relation': 1,
+            'tests.gfkmodel.content_type': 1,
+        }, total=5)
+
+    def test_mti(self):
+        obj = ChildModelFactory.create()
+
+        self.assertCollectQueries(obj, {
+            'tests.basemodel.custom_related_m2m_name': 1,
+            'tests.basemodel.fkey': 1,
+            'tests.basemodel.foreignkeytobasemodel_set': 1,
+            'tests.basemodel.manytomanytobasemodel_set': 1,
+            'tests.basemodel.o2o': 1,
+            'tests.basemodel.onetoonetobasemodel': 1,
+            'tests.basemodel.subclassofbasemodel': 1,
+            'tests.childmodel.custom_related_m2m_name': 1,
+            'tests.childmodel.fkey': 1,
+            'tests.childmodel.foreignkeytobasemodel_set': 1,
+            'tests.childmodel.manytomanytobasemodel_set': 1,
+            'tests.childmodel.o2o': 1,
+            'tests.childmodel.onetoonetobasemodel': 1,
+            'tests.fkdummymodel.basemodel_set': 1,
+        }, total=14)
+
+    def test_batch_collector(self):
+        obj = ClassLevel3Factory.create()
+
+        # Every level of the batch collector is loaded with a query by relation.
+        self.assertCollectQueries(obj, {
+            'tests.classlevel1.classlevel2_set': 2,
+            'tests.classlevel2.classlevel3_set': 2,
+            'tests.classlevel2.fkey': 1,
+            'tests.classlevel3.fkey': 1,
+        }, total=6, collector=BatchDeepCollector())
+
+    def test_batch_collector_m2m(self):
+        obj = ManyToManyToBaseModelFactory.create(base_models=BaseModelFactory.create_batch(2))
+
+        self.assertCollectQueries(obj, get_batch_queries(manytomanytobasemodel__m2m=2), total=13,
+                                  collector=BatchDeepCollector())
+        self.assertCollectQueries(obj.m2m.all()[0], get_batch_queries(basemodel__manytomanytobasemodel_set=2,
+                                                                      manytomanytobasemodel__m2m=1),
+                                  total=13, collector=BatchDeepCollector())
+
+    def test_batch_collector_m2m_with_related_name(self):
+        obj = ManyToManyToBaseModelWithRelatedNameFactory.create(base_models=BaseModelFactory.create_batch(2))
+
+        self.assertCollectQueries(obj, get_batch_queries(manytomanytobasemodelwithrelatedname__m2m=2), total=13,
+                                  collector=BatchDeepCollector())
+        self.assertCollectQueries(obj.m2m.all()[0], get_batch_queries(basemodel__custom_related_m2m_name=2,
+                                                                      manytomanytobasemodelwithrelatedname__m2m=1),
+                                  total=13, collector=BatchDeepCollector())
+
+    def test_batch_collector_gfk(self):
+        obj = GFKModel.objects.create(content_object=BaseModelFactory.create())
+
+        queries = get_batch_queries(gfkmodel__content_object=2, gfkmodel__content_type=1)
+        queries['contenttypes.contenttype.gfkmodel_set'] = 2
+        self.assertCollectQueries(obj, queries, total=16, collector=BatchDeepCollector())
+
+    def test_batch_collector_generic_relation(self):
+        obj = BaseToGFKModel.objects.create()
+        GFKModel.objects.create(content_object=obj)
+        GFKModel.objects.create(content_object=obj)
+
+        self.assertCollectQueries(obj, {
+            'contenttypes.contenttype.gfkmodel_set': 2,
+            'tests.basetogfkmodel.gfk_relation': 3,
+            'tests.gfkmodel.content_type': 1,
+        }, total=6, collector=BatchDeepCollector())
+
+    def test_batch_collector_mti(self):
+        obj = ChildModelFactory.create()
+
+        # Parent objects are loaded by the basemodel_ptr relation, then their relations are followed on both models.
+        self.assertCollectQueries(obj, {
+            'tests.basemodel.childmodel': 1,
+            'tests.basemodel.custom_related_m2m_name': 1,
+            'tests.basemodel.foreignkeytobasemodel_set': 1,
+            'tests.basemodel.manytomanytobasemodel_set': 1,
+            'tests.basemodel.onetoonetobasemodel': 1,
+            'tests.basemodel.subclassofbasemodel': 1,
+            'tests.childmodel.basemodel_ptr': 1,
+            'tests.childmodel.custom_related_m2m_name': 1,
+            'tests.childmodel.fkey': 1,
+            'tests.childmodel.foreignkeytobasemodel_set': 1,
+            'tests.childmodel.manytomanytobasemodel_set': 1,
+            'tests.childmodel.o2o': 1,
+            'tests.childmodel.onetoonetobasemodel': 1,
+            'tests.fkdummymodel.basemodel_set': 2,
+            'tests.o2odummymodel.basemodel': 1,
+        }, total=16, collector=BatchDeepCollector())
+
+    def test_content_types_cache_does_not_change_queries(self):
+        obj = GFKModel.objects.create(content_object=BaseModelFactory.create())
+        ContentType.objects.get_for_model(GFKModel)
+
+        queries = get_queries(gfkmodel__content_object=2, gfkmodel__content_type=1)
+        queries['contenttypes.contenttype.gfkmodel_set'] = 1
+        self.assertCollectQueries(obj, queries, total=13)
+
+    def test_regression_message(self):
+        obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=3)
+
+        queries = get_queries()
+        del queries['tests.basemodel.foreignkeytobasemodel_set']
+        with self.assertRaises(AssertionError) as context:
+            self.assertCollectQueries(obj, queries, total=8)
+
+        message = str(context.exception)
+        self.assertIn('Collect of tests.basemodel.%s made unexpected queries' % obj.pk, message)
+        self.assertIn('tests.basemodel.foreignkeytobasemodel_set: 1 queries instead of 0 (+1)', message)
+        self.assertIn('total: 9 queries instead of 8 (+1)', message)
+        self.assertNotIn('tests.basemodel.o2o', message)
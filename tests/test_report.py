@@ -1,8 +1,10 @@
 from django.test import TestCase
 
-from deep_collector.core import RelatedObjectsCollector
+from deep_collector.batch import BatchDeepCollector
+from deep_collector.core import DeepCollector, RelatedObjectsCollector
 
 from .factories import BaseModelFactory, ForeignKeyToBaseModelFactory
+from .models import BaseModel
 
 
 class TestLogReportGeneration(TestCase):
@@ -50,3 +52,38 @@ class TestExcludedFieldLogReportGeneration(TestCase):
         collector.collect(obj)
 
         self.assertEquals(len(collector.get_report()['excluded_fields']), 1)
+
+
+class TestProfileReport(TestCase):
+
+    def test_hot_relations_report(self):
+        obj = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=obj, size=3)
+
+        for collector_class in (DeepCollector, BatchDeepCollector):
+            collector = collector_class()
+            collector.PROFILE = True
+            # Without any related object in cache.
+            collector.collect(BaseModel.objects.get(pk=obj.pk))
+            hot_relations = collector.get_report()['hot_relations']
+
+            relations = dict(((relation['model'], relation['field']), relation) for relation in hot_relations)
+            relation = relations[('tests.basemodel', 'foreignkeytobasemodel_set')]
+            self.assertEqual(relation['calls'], 1)
+            self.assertEqual(relation['instances'], 3)
+            self.assertGreaterEqual(relation['queries'], 1)
+            # Foreign keys are loaded by their descriptor, its query is counted too.
+            self.assertEqual(relations[('tests.basemodel', 'fkey')]['queries'], 1)
+            self.assertEqual(relations[('tests.foreignkeytobasemodel', 'fkeyto')]['instances'], 0)
+
+            durations = [relation['duration'] for relation in hot_relations]
+            self.assertEqual(durations, sorted(durations, reverse=True))
+            queries = [relation['queries'] for relation in collector.get_hot_relations(order_by='queries')]
+            self.assertEqual(queries, sorted(queries, reverse=True))
+
+    def test_no_hot_relations_report_without_profile(self):
+        collector = DeepCollector()
+        collector.collect(BaseModelFactory.create())
+
+        self.assertNotIn('hot_relations', collector.get_report())
+        self.assertEqual(collector.get_hot_relations(), [])
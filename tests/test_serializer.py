@@ -2,8 +2,11 @@ from copy import copy
 import json
 from django.test import TestCase
 
-from .factories import ChildModelFactory
-from deep_collector.compat.serializers import MultiModelInheritanceSerializer
+from deep_collector.compat.builtins import StringIO
+
+from .factories import BaseModelFactory, ChildModelFactory
+from deep_collector.compat.serializers import MultiModelInheritanceSerializer, StreamingMultiModelInheritanceSerializer
+from deep_collector.core import DeepCollector
 
 
 class TestMultiModelInheritanceSerializer(TestCase):
@@ -33,3 +36,62 @@ class TestMultiModelInheritanceSerializer(TestCase):
 
         self.assertEqual(local_fields_before, local_fields_after)
         self.assertEqual(local_m2m_fields_before, local_m2m_fields_after)
+
+
+class RecordingStream(object):
+
+    def __init__(self):
+        self.writes = []
+        self.flushes = 0
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def flush(self):
+        self.flushes += 1
+
+    def getvalue(self):
+        return ''.join(self.writes)
+
+
+class TestStreamingMultiModelInheritanceSerializer(TestCase):
+
+    def test_streamed_objects_are_the_same_as_serialized_objects(self):
+        objs = [ChildModelFactory.create()] + BaseModelFactory.create_batch(size=3)
+
+        json_objects = MultiModelInheritanceSerializer().serialize(objs, indent=2)
+        stream = StringIO()
+        StreamingMultiModelInheritanceSerializer().serialize(objs, stream=stream, indent=2)
+
+        self.assertEqual(stream.getvalue(), json_objects)
+
+    def test_compact_json_is_written_without_indent(self):
+        objs = BaseModelFactory.create_batch(size=3)
+
+        stream = StringIO()
+        StreamingMultiModelInheritanceSerializer().serialize(objs, stream=stream)
+
+        self.assertNotIn('\n', stream.getvalue())
+        self.assertNotIn('": ', stream.getvalue())
+        self.assertEqual(json.loads(stream.getvalue()), json.loads(MultiModelInheritanceSerializer().serialize(objs)))
+
+    def test_objects_are_written_in_chunks(self):
+        objs = BaseModelFactory.create_batch(size=20)
+
+        stream = RecordingStream()
+        StreamingMultiModelInheritanceSerializer().serialize(objs, stream=stream, chunk_size=256)
+
+        self.assertGreater(len(stream.writes), 1)
+        self.assertTrue(all(len(data) < 2 * 256 for data in stream.writes))
+        self.assertGreaterEqual(stream.flushes, len(stream.writes))
+        self.assertEqual(len(json.loads(stream.getvalue())), 20)
+
+    def test_collector_writes_serialized_objects_to_stream(self):
+        obj = BaseModelFactory.create()
+        collector = DeepCollector()
+        collector.collect(obj)
+
+        stream = StringIO()
+        collector.write_json_serialized_objects(stream)
+
+        self.assertEqual(json.loads(stream.getvalue()), json.loads(collector.get_json_serialized_objects().read()))
@@ -0,0 +1,127 @@
+import json
+import shutil
+import tempfile
+
+from django.test import TestCase, TransactionTestCase
+
+from deep_collector.batch import BatchDeepCollector
+from deep_collector.core import DeepCollector
+from deep_collector.sharding import ShardedExport
+
+from .factories import BaseModelFactory, FKDummyModelFactory, ManyToManyToBaseModelFactory
+from .models import BaseModel, InvalidFKNonRootModel, InvalidFKRootModel
+
+
+class TestShardedExport(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        fkey = FKDummyModelFactory.create()
+        self.roots = BaseModelFactory.create_batch(fkey=fkey, size=5)
+        ManyToManyToBaseModelFactory.create_batch(base_models=self.roots, size=2)
+        self.pks = [root.pk for root in self.roots]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_collected_keys(self):
+        collector = DeepCollector()
+        collector.collect_many(self.roots)
+        return set(collector.get_collected_objects_by_key())
+
+    def test_shards_are_merged_without_duplicates(self):
+        # Shards are collected in the current process: other processes can't see test data.
+        export = ShardedExport(self.directory, shard_size=2, processes=0)
+        shards = export.run(BaseModel, self.pks)
+
+        self.assertEqual([stats['roots'] for stats in shards], [2, 2, 1])
+        # The shared foreign key and m2m objects are collected in every shard.
+        self.assertEqual([stats['objects'] for stats in shards], [7, 7, 5])
+
+        merged = tempfile.TemporaryFile(mode='w+')
+        export.merge(merged)
+        merged.seek(0)
+        objs = json.load(merged)
+
+        self.assertEqual(set('%s.%s' % (obj['model'], obj['pk']) for obj in objs), self.get_collected_keys())
+        self.assertEqual(len(objs), 13)
+        self.assertEqual(export.get_report()['duplicates'], 6)
+
+    def test_shards_are_deduplicated(self):
+        export = ShardedExport(self.directory, collector_class=BatchDeepCollector, shard_size=2, processes=0)
+        export.run(BaseModel, self.pks)
+        export.deduplicate()
+
+        keys = []
+        for stats in export.get_report()['shards']:
+            with open(stats['path']) as stream:
+                keys += ['%s.%s' % (obj['model'], obj['pk']) for obj in json.load(stream)]
+
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertEqual(set(keys), self.get_collected_keys())
+        self.assertEqual([stats['objects'] for stats in export.get_report()['shards']], [7, 4, 2])
+
+    def test_shards_stats_are_in_report(self):
+        export = ShardedExport(self.directory, parameters={'MAXIMUM_RELATED_INSTANCES': 1}, shard_size=3,
+                               processes=0)
+        export.run(BaseModel, self.pks)
+
+        report = export.get_report()
+        self.assertEqual([stats['shard'] for stats in report['shards']], [0, 1])
+        self.assertEqual([event['type'] for event in report['log']], ['shard_collected', 'shard_collected'])
+        self.assertEqual([event['done'] for event in report['log']], [1, 2])
+        # Every root has 2 m2m objects, and the shared foreign key has 5 base models.
+        self.assertEqual(len(report['excluded_fields']), 5 + 2)
+        self.assertIsNone(report['duplicates'])
+
+    def test_foreign_keys_to_roots_of_other_shards_are_kept(self):
+        roots = [InvalidFKRootModel.objects.create() for _ in range(4)]
+        non_root = InvalidFKNonRootModel.objects.create(valid_fk=roots[0], invalid_fk=roots[3])
+
+        for collector_class in (DeepCollector, BatchDeepCollector):
+            collector = collector_class()
+            collector.collect_many(roots)
+            expected_objs = json.loads(collector.get_json_serialized_objects().getvalue())
+
+            export = ShardedExport(self.directory, collector_class=collector_class, shard_size=2, processes=0)
+            export.run(InvalidFKRootModel, [root.pk for root in roots])
+            merged = tempfile.TemporaryFile(mode='w+')
+            export.merge(merged)
+            merged.seek(0)
+            objs = json.load(merged)
+
+            self.assertEqual(sorted(objs, key=lambda obj: (obj['model'], obj['pk'])),
+                             sorted(expected_objs, key=lambda obj: (obj['model'], obj['pk'])))
+            non_root_obj = [obj for obj in objs if obj['model'] == 'tests.invalidfknonrootmodel'][0]
+            self.assertEqual(non_root_obj['pk'], non_root.pk)
+            self.assertEqual(non_root_obj['fields']['invalid_fk'], roots[3].pk)
+
+
+# Pool processes use their own database connection, so they can only see committed data.
+class TestShardedExportInProcesses(TransactionTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shards_are_collected_in_processes(self):
+        roots = BaseModelFactory.create_batch(fkey=FKDummyModelFactory.create(), size=5)
+        pks = [root.pk for root in roots]
+
+        export = ShardedExport(self.directory, shard_size=2, processes=0)
+        export.run(BaseModel, pks)
+        expected_stream = tempfile.TemporaryFile(mode='w+')
+        export.merge(expected_stream)
+        expected_stream.seek(0)
+
+        export = ShardedExport(self.directory, collector_class=BatchDeepCollector, shard_size=2, processes=2)
+        shards = export.run(BaseModel, pks)
+        stream = tempfile.TemporaryFile(mode='w+')
+        export.merge(stream)
+        stream.seek(0)
+
+        self.assertEqual([stats['shard'] for stats in shards], [0, 1, 2])
+        self.assertEqual(sorted(json.load(stream), key=lambda obj: (obj['model'], obj['pk'])),
+                         sorted(json.load(expected_stream), key=lambda obj: (obj['model'], obj['pk'])))
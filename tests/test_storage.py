@@ -0,0 +1,166 @@
+import json
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+
+from deep_collector.batch import BatchDeepCollector
+from deep_collector.core import DeepCollector
+from deep_collector.storage import DiskStack, DiskStorage
+
+from .factories import (BaseModelFactory, ChildModelFactory, ClassLevel1Factory, ClassLevel2Factory,
+                        ClassLevel3Factory, ForeignKeyToBaseModelFactory, ManyToManyToBaseModelFactory)
+from .models import BaseModel, ChildModel, ClassLevel1, ClassLevel2
+
+
+class TestDiskStorage(TestCase):
+
+    def setUp(self):
+        self.storage = DiskStorage(cache_size=3)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def test_registry(self):
+        registry = self.storage.get_registry('registry')
+        keys = [(ClassLevel1, pk) for pk in range(1, 11)] + [(ClassLevel2, pk) for pk in range(1, 4)]
+        for key in keys[::2] + keys[1::2]:
+            registry[key] = None
+        registry[(ClassLevel1, 4)] = (ClassLevel1, 1)
+
+        self.assertEqual(len(registry), 13)
+        self.assertIn((ClassLevel1, 10), registry)
+        self.assertNotIn((ClassLevel1, 11), registry)
+        self.assertNotIn((ClassLevel2, 10), registry)
+        self.assertEqual(registry[(ClassLevel1, 4)], (ClassLevel1, 1))
+        self.assertIsNone(registry[(ClassLevel2, 2)])
+        # Keys are iterated model by model, in the order they have been added.
+        self.assertEqual(list(registry), keys[:10:2] + keys[1:10:2] + [keys[10], keys[12], keys[11]])
+
+        del registry[(ClassLevel1, 1)]
+        self.assertEqual(len(registry), 12)
+        self.assertNotIn((ClassLevel1, 1), registry)
+        with self.assertRaises(KeyError):
+            registry[(ClassLevel1, 1)]
+
+        chunks = list(registry.iter_items_by_model(4))
+        self.assertEqual([(model, len(items)) for model, items in chunks],
+                         [(ClassLevel1, 4), (ClassLevel1, 4), (ClassLevel1, 1), (ClassLevel2, 3)])
+        self.assertIn((4, (ClassLevel1, 1)), chunks[0][1] + chunks[1][1])
+
+    def test_stack(self):
+        root = ClassLevel1Factory.create()
+        level2_objs = ClassLevel2Factory.create_batch(fkey=root, size=10)
+        items = [(root, obj) for obj in level2_objs]
+        list_stack = list(items[:4])
+        stack = self.storage.get_stack('stack', [(None, root)] + items[:4])
+        list_stack.insert(0, (None, root))
+
+        stack.extend(items[4:])
+        list_stack.extend(items[4:])
+        self.assertEqual(len(stack), 11)
+        self.assertEqual(list(stack), list_stack)
+
+        stack.reverse()
+        list_stack.reverse()
+        popped = [stack.pop() for _ in range(4)]
+        self.assertEqual(popped, [list_stack.pop() for _ in range(4)])
+        self.assertEqual(popped[0], (None, root))
+        stack.append(items[0])
+        list_stack.append(items[0])
+
+        popped = []
+        while stack:
+            popped.append(stack.pop())
+        self.assertEqual(popped, list_stack[::-1])
+        self.assertEqual(len(stack), 0)
+
+        # Spilled objects are the same, and parents only have their primary key.
+        parent, obj = popped[-1]
+        self.assertEqual(parent.pk, root.pk)
+        self.assertNotEqual(parent.name, root.name)
+        self.assertEqual(obj.name, items[9][1].name)
+        self.assertEqual(obj._state.db, 'default')
+        self.assertFalse(obj._state.adding)
+
+
+class LevelSizesCollector(BatchDeepCollector):
+    def __init__(self, *args, **kwargs):
+        super(LevelSizesCollector, self).__init__(*args, **kwargs)
+        self.levels = []
+        self.chunk_sizes = []
+
+    def _collect_level(self, frontier):
+        # Level size, and how many of its items are in memory.
+        in_memory = len(frontier._items) if isinstance(frontier, DiskStack) else len(frontier)
+        self.levels.append((len(frontier), in_memory))
+        return super(LevelSizesCollector, self)._collect_level(frontier)
+
+    def _collect_frontier(self, frontier):
+        self.chunk_sizes.append(len(frontier))
+        return super(LevelSizesCollector, self)._collect_frontier(frontier)
+
+
+class TestSpillToDisk(TestCase):
+
+    def setUp(self):
+        self.root = BaseModelFactory.create()
+        ForeignKeyToBaseModelFactory.create_batch(fkeyto=self.root, size=5)
+        ManyToManyToBaseModelFactory.create_batch(base_models=[self.root, BaseModelFactory.create()], size=3)
+        ChildModelFactory.create()
+
+    def assertSpilledCollectIsTheSame(self, collector_class, roots):
+        collector = collector_class()
+        collector.KEYS_ONLY = True
+        collector.collect_many(roots)
+
+        spilled_collector = collector_class()
+        spilled_collector.KEYS_ONLY = True
+        spilled_collector.SPILL_TO_DISK = True
+        spilled_collector.SPILL_CACHE_SIZE = 2
+        spilled_collector.collect_many(roots)
+
+        self.assertEqual(len(spilled_collector.collected_objs), len(collector.collected_objs))
+        self.assertEqual(set(spilled_collector.collected_objs), set(collector.collected_objs))
+        self.assertEqual(dict(spilled_collector.collected_objs_roots.items()), collector.collected_objs_roots)
+        self.assertEqual(sorted(json.loads(spilled_collector.get_json_serialized_objects().getvalue()),
+                                key=lambda obj: (obj['model'], obj['pk'])),
+                         sorted(json.loads(collector.get_json_serialized_objects().getvalue()),
+                                key=lambda obj: (obj['model'], obj['pk'])))
+
+    def test_spilled_collect_is_the_same(self):
+        roots = [self.root, ChildModel.objects.get()]
+        self.assertSpilledCollectIsTheSame(DeepCollector, roots)
+        self.assertSpilledCollectIsTheSame(BatchDeepCollector, roots)
+
+    def test_spilled_depth_first_collect(self):
+        level1 = ClassLevel1Factory.create()
+        for level2 in ClassLevel2Factory.create_batch(fkey=level1, size=3):
+            ClassLevel3Factory.create_batch(fkey=level2, size=3)
+
+        self.assertSpilledCollectIsTheSame(DeepCollector, [level1])
+
+    def test_spilled_wide_level_is_not_held_in_memory(self):
+        level1 = ClassLevel1Factory.create()
+        for level2 in ClassLevel2Factory.create_batch(fkey=level1, size=10):
+            ClassLevel3Factory.create_batch(fkey=level2, size=3)
+
+        self.assertSpilledCollectIsTheSame(BatchDeepCollector, [level1])
+
+        collector = LevelSizesCollector()
+        collector.KEYS_ONLY = True
+        collector.SPILL_TO_DISK = True
+        collector.SPILL_CACHE_SIZE = 2
+        collector.collect(level1)
+
+        self.assertEqual(len(collector.collected_objs), 41)
+        # Levels of 10 and 30 objects are read from disk, and collected 2 objects at a time.
+        self.assertEqual([size for size, _ in collector.levels[:3]], [1, 10, 30])
+        self.assertTrue(all(in_memory <= 2 * 2 for _, in_memory in collector.levels))
+        self.assertEqual(max(collector.chunk_sizes), 2)
+
+    def test_spill_to_disk_requires_keys_only(self):
+        collector = DeepCollector()
+        collector.SPILL_TO_DISK = True
+
+        with self.assertRaises(ImproperlyConfigured):
+            collector.collect(BaseModel.objects.get(pk=self.root.pk))